@@ -1,40 +1,127 @@
 # admin.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from db import get_db_connection
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app
+from db import get_db_connection, get_pool_stats, get_query_stats
+from http_cache import conditional
+from permissions import invalidate_role, role_required
+from pagination import decode_cursor, encode_cursor
+import waiting_room
+import search
+from fragment_cache import fragment_cache
 from datetime import datetime
+import os
+import threading
+import time
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
-def is_admin():
-    """Check if current user is admin"""
-    user_id = session.get('user_id')
-    if not user_id:
-        return False
-    
-    db = get_db_connection()
-    if not db:
-        return False
-    
-    try:
-        cursor = db.cursor()
-        cursor.execute("SELECT role FROM Users WHERE user_id = %s", (user_id,))
-        result = cursor.fetchone()
-        return result and result[0] == 'admin'
-    except:
-        return False
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if db:
-            db.close()
+admin_required = role_required('admin', message='Access denied! Admin privileges required.')
+admin_api = role_required('admin', api=True, message='Admin privileges required')
+
+
+# Dashboard counters by artist status. One grouped aggregate fills the cache;
+# approve/reject/apply recompute it, and ADMIN_STATS_TTL bounds how stale it
+# can get from writes made by other worker processes. `generation` moves on
+# every such write and versions the dashboard page for its ETag.
+_artist_stats = {'values': None, 'refreshed_at': 0.0, 'generation': 0}
+_artist_stats_lock = threading.Lock()
+
+
+def refresh_artist_stats(cursor):
+    cursor.execute("SELECT status, COUNT(*) FROM Artists GROUP BY status")
+    stats = {'pending': 0, 'approved': 0, 'rejected': 0, 'total': 0}
+    for status, count in cursor.fetchall():
+        stats[status] = count
+        stats['total'] += count
+    with _artist_stats_lock:
+        _artist_stats['values'] = stats
+        _artist_stats['refreshed_at'] = time.monotonic()
+    return stats
+
+
+def get_artist_stats(cursor):
+    ttl = current_app.config.get('ADMIN_STATS_TTL', 60)
+    with _artist_stats_lock:
+        stats = _artist_stats['values']
+        fresh = stats is not None and time.monotonic() - _artist_stats['refreshed_at'] < ttl
+    return dict(stats) if fresh else refresh_artist_stats(cursor)
+
+
+def invalidate_artist_stats():
+    with _artist_stats_lock:
+        _artist_stats['values'] = None
+        _artist_stats['generation'] += 1
+
+
+# Tab -> (status filter, sort column). Each has a matching
+# (status, <column>, artist_id) index in schema_changes.sql.
+APPLICATION_TABS = {
+    'pending': ('pending', 'application_date'),
+    'approved': ('approved', 'approved_date'),
+    'rejected': ('rejected', 'application_date'),
+    'all': (None, 'application_date'),
+}
+
+
+def fetch_applications(cursor, tab, after=None, limit=25):
+    """
+    One page of a dashboard tab, newest first, and the cursor of the next
+    page (None on the last page). `after` is a decoded keyset cursor.
+    """
+    status, column = APPLICATION_TABS[tab]
+    conditions = []
+    params = []
+    if status:
+        conditions.append("a.status = %s")
+        params.append(status)
+    if after:
+        conditions.append(f"(a.{column} < %s OR (a.{column} = %s AND a.artist_id < %s))")
+        params.extend([after[0], after[0], after[1]])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cursor.execute(f"""
+        SELECT a.artist_id, a.artist_name, a.genre, a.country, a.application_date, a.status,
+               u.email, a.approved_date
+        FROM Artists a
+        JOIN Users u ON a.user_id = u.user_id
+        {where}
+        ORDER BY a.{column} DESC, a.artist_id DESC
+        LIMIT %s
+    """, (*params, limit + 1))
+    rows = cursor.fetchall()
+
+    applications = [{
+        'artist_id': app[0],
+        'artist_name': app[1],
+        'genre': app[2],
+        'country': app[3],
+        'application_date': app[4],
+        'status': app[5],
+        'email': app[6],
+        'approved_date': app[7]
+    } for app in rows[:limit]]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = applications[-1]
+        next_cursor = encode_cursor(last[column], last['artist_id'])
+    return applications, next_cursor
+
+
+def _dashboard_version():
+    """
+    Moves on apply, approve and reject in this process. The ADMIN_STATS_TTL
+    window bounds how long writes made by other workers can go unnoticed,
+    as it does for the counters themselves.
+    """
+    ttl = current_app.config.get('ADMIN_STATS_TTL', 60) or 1
+    with _artist_stats_lock:
+        generation = _artist_stats['generation']
+    return generation, int(time.time() // ttl)
+
 
 @admin_bp.route('/dashboard')
+@admin_required
+@conditional(_dashboard_version)
 def dashboard():
-    # Check if user is admin
-    if not is_admin():
-        flash('Access denied! Admin privileges required.', 'error')
-        return redirect(url_for('profile.profile'))
-    
     db = get_db_connection()
     if not db:
         flash('Database connection error!', 'error')
@@ -45,118 +132,19 @@ def dashboard():
     try:
         cursor = db.cursor()
         
-        # Get statistics
-        cursor.execute("SELECT COUNT(*) FROM Artists WHERE status = 'pending'")
-        pending_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM Artists WHERE status = 'approved'")
-        approved_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM Artists WHERE status = 'rejected'")
-        rejected_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM Artists")
-        total_count = cursor.fetchone()[0]
-        
-        stats = {
-            'pending': pending_count,
-            'approved': approved_count,
-            'rejected': rejected_count,
-            'total': total_count
-        }
-        
-        # Get pending applications
-        cursor.execute("""
-            SELECT a.artist_id, a.artist_name, a.genre, a.country, a.application_date, a.status,
-                   u.email
-            FROM Artists a
-            JOIN Users u ON a.user_id = u.user_id
-            WHERE a.status = 'pending'
-            ORDER BY a.application_date DESC
-        """)
-        pending_apps = cursor.fetchall()
-        
-        pending_applications = [{
-            'artist_id': app[0],
-            'artist_name': app[1],
-            'genre': app[2],
-            'country': app[3],
-            'application_date': app[4],
-            'status': app[5],
-            'email': app[6]
-        } for app in pending_apps]
-        
-        # Get approved applications
-        cursor.execute("""
-            SELECT a.artist_id, a.artist_name, a.genre, a.country, a.application_date, a.status,
-                   u.email, a.approved_date
-            FROM Artists a
-            JOIN Users u ON a.user_id = u.user_id
-            WHERE a.status = 'approved'
-            ORDER BY a.approved_date DESC
-        """)
-        approved_apps = cursor.fetchall()
+        stats = get_artist_stats(cursor)
         
-        approved_applications = [{
-            'artist_id': app[0],
-            'artist_name': app[1],
-            'genre': app[2],
-            'country': app[3],
-            'application_date': app[4],
-            'status': app[5],
-            'email': app[6],
-            'approved_date': app[7]
-        } for app in approved_apps]
-        
-        # Get rejected applications
-        cursor.execute("""
-            SELECT a.artist_id, a.artist_name, a.genre, a.country, a.application_date, a.status,
-                   u.email
-            FROM Artists a
-            JOIN Users u ON a.user_id = u.user_id
-            WHERE a.status = 'rejected'
-            ORDER BY a.application_date DESC
-        """)
-        rejected_apps = cursor.fetchall()
-        
-        rejected_applications = [{
-            'artist_id': app[0],
-            'artist_name': app[1],
-            'genre': app[2],
-            'country': app[3],
-            'application_date': app[4],
-            'status': app[5],
-            'email': app[6]
-        } for app in rejected_apps]
-        
-        # Get all applications
-        cursor.execute("""
-            SELECT a.artist_id, a.artist_name, a.genre, a.country, a.application_date, a.status,
-                   u.email
-            FROM Artists a
-            JOIN Users u ON a.user_id = u.user_id
-            ORDER BY a.application_date DESC
-        """)
-        all_apps = cursor.fetchall()
-        
-        all_applications = [{
-            'artist_id': app[0],
-            'artist_name': app[1],
-            'genre': app[2],
-            'country': app[3],
-            'application_date': app[4],
-            'status': app[5],
-            'email': app[6]
-        } for app in all_apps]
+        # Only the first page of the default tab is rendered here; the other
+        # tabs and further pages come from admin.applications on demand
+        pending_applications, pending_cursor = fetch_applications(
+            cursor, 'pending', limit=current_app.config.get('ADMIN_PAGE_SIZE', 25))
         
     except Exception as e:
         print(f"Error fetching admin dashboard data: {e}")
         flash('An error occurred while loading the dashboard.', 'error')
         stats = {'pending': 0, 'approved': 0, 'rejected': 0, 'total': 0}
         pending_applications = []
-        approved_applications = []
-        rejected_applications = []
-        all_applications = []
+        pending_cursor = None
     
     finally:
         if cursor:
@@ -167,19 +155,120 @@ def dashboard():
     return render_template('admin_dashboard.html',
                           stats=stats,
                           pending_applications=pending_applications,
-                          approved_applications=approved_applications,
-                          rejected_applications=rejected_applications,
-                          all_applications=all_applications)
+                          pending_cursor=pending_cursor)
+
+
+@admin_bp.route('/applications')
+@admin_api
+def applications():
+    """A page of one dashboard tab as rendered table rows, plus the next cursor"""
+    tab = request.args.get('status', 'pending')
+    if tab not in APPLICATION_TABS:
+        return jsonify({'error': 'Unknown status'}), 400
+    after = decode_cursor(request.args.get('after'))
+    
+    db = get_db_connection()
+    if not db:
+        return jsonify({'error': 'Database connection error'}), 503
+    
+    cursor = None
+    try:
+        cursor = db.cursor()
+        page, next_cursor = fetch_applications(
+            cursor, tab, after, current_app.config.get('ADMIN_PAGE_SIZE', 25))
+    except Exception as e:
+        print(f"Error fetching applications: {e}")
+        return jsonify({'error': 'Could not load applications'}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        db.close()
+    
+    return jsonify({
+        'html': render_template('admin_application_rows.html', applications=page, tab=tab),
+        'count': len(page),
+        'next_cursor': next_cursor,
+    })
+
+@admin_bp.route('/db_pool')
+@admin_api
+def db_pool():
+    """Runtime statistics of the database connection pool"""
+    return jsonify(get_pool_stats())
+
+@admin_bp.route('/query_stats')
+@admin_api
+def query_stats():
+    """Queries per route and the most expensive statement fingerprints"""
+    try:
+        top = max(1, min(int(request.args.get('top', 20)), 200))
+    except ValueError:
+        top = 20
+    return jsonify(get_query_stats(top))
+
+@admin_bp.route('/hold_sweeper')
+@admin_api
+def hold_sweeper():
+    """Tickets released by the expired-hold sweeper"""
+    sweeper = current_app.extensions.get('hold_sweeper')
+    return jsonify(sweeper.stats if sweeper else {'enabled': False})
+
+@admin_bp.route('/search_index')
+@admin_api
+def search_index():
+    """Size and age of the in-process search index"""
+    return jsonify(search.search_stats() or {'documents': 0, 'built': False})
+
+@admin_bp.route('/fragment_cache', methods=['GET', 'DELETE'])
+@admin_api
+def fragment_cache_stats():
+    """Hit rate of the rendered fragment cache; DELETE empties it"""
+    if request.method == 'DELETE':
+        fragment_cache.clear()
+    return jsonify(fragment_cache.stats())
+
+
+@admin_bp.route('/ticket_jobs')
+@admin_api
+def ticket_jobs():
+    """Ticket generation jobs known to this process"""
+    runner = current_app.extensions.get('ticket_jobs')
+    return jsonify(runner.stats() if runner else {})
+
+
+@admin_bp.route('/waiting_room', defaults={'concert_id': None})
+@admin_bp.route('/waiting_room/<int:concert_id>', methods=['GET', 'POST'])
+@admin_api
+def waiting_room_admin(concert_id):
+    """
+    Inspect queues, or POST rate (admissions/second, 0 = open) and burst.
+
+    Queues live in process memory, so both reads and rate changes apply only
+    to the worker process that serves this request; every response says so
+    and names the process. Set WAITING_ROOM_DEFAULT_RATE to change the rate
+    for all workers.
+    """
+    scope = {'scope': 'process', 'pid': os.getpid()}
+    if concert_id is None:
+        return jsonify({**scope, 'queues': waiting_room.all_stats()})
+    if request.method == 'POST':
+        try:
+            rate = float(request.form.get('rate', request.args.get('rate', '')))
+            burst = request.form.get('burst', request.args.get('burst'))
+            burst = int(burst) if burst else None
+        except ValueError:
+            return jsonify({'error': 'rate must be a number'}), 400
+        if rate < 0 or (burst is not None and burst < 1):
+            return jsonify({'error': 'rate must be >= 0 and burst >= 1'}), 400
+        return jsonify({**scope, **waiting_room.set_rate(concert_id, rate, burst).stats()})
+    queue = waiting_room.get_queue(concert_id)
+    return jsonify({**scope, **(queue.stats() if queue else {'rate': 0})})
 
 # Add these routes to admin.py
 
 @admin_bp.route('/review_artist/<int:artist_id>')
+@admin_required
 def review_artist(artist_id):
-    # Check if user is admin
-    if not is_admin():
-        flash('Access denied! Admin privileges required.', 'error')
-        return redirect(url_for('profile.profile'))
-    
     db = get_db_connection()
     if not db:
         flash('Database connection error!', 'error')
@@ -242,12 +331,8 @@ def review_artist(artist_id):
 
 
 @admin_bp.route('/approve_artist/<int:artist_id>', methods=['POST'])
+@admin_required
 def approve_artist(artist_id):
-    # Check if user is admin
-    if not is_admin():
-        flash('Access denied! Admin privileges required.', 'error')
-        return redirect(url_for('profile.profile'))
-    
     admin_user_id = session.get('user_id')
     
     db = get_db_connection()
@@ -288,6 +373,9 @@ def approve_artist(artist_id):
         """, (user_id,))
         
         db.commit()
+        invalidate_role(user_id)
+        search.index_artist(cursor, artist_id)
+        invalidate_artist_stats()
         
         flash(f'Artist "{artist_name}" has been approved successfully! 🎉', 'success')
         
@@ -307,12 +395,8 @@ def approve_artist(artist_id):
 
 
 @admin_bp.route('/reject_artist/<int:artist_id>', methods=['POST'])
+@admin_required
 def reject_artist(artist_id):
-    # Check if user is admin
-    if not is_admin():
-        flash('Access denied! Admin privileges required.', 'error')
-        return redirect(url_for('profile.profile'))
-    
     rejection_reason = request.form.get('rejection_reason', '').strip()
     
     if not rejection_reason or len(rejection_reason) < 20:
@@ -349,6 +433,7 @@ def reject_artist(artist_id):
         """, (rejection_reason, artist_id))
         
         db.commit()
+        invalidate_artist_stats()
         
         flash(f'Application for "{artist_name}" has been rejected.', 'info')
         
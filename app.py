@@ -1,7 +1,17 @@
-from flask import Flask, render_template, flash, session, redirect, url_for
+from flask import Flask, render_template, flash, session, redirect, url_for, request
+from markupsafe import Markup
 import os
+import time
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from db import get_db_connection
+from db import get_db_connection, init_app as init_db
+from pagination import decode_cursor, encode_cursor
+from hold_sweeper import init_app as init_hold_sweeper
+from metrics import init_app as init_metrics
+from profiler import init_app as init_profiler
+from assets import init_app as init_assets
+from http_cache import conditional, init_app as init_http_cache
+import fragment_cache
 
 load_dotenv(override=True)
 
@@ -15,6 +25,119 @@ class Config:
     DB_PASSWORD = os.environ.get('DB_PASSWORD')
     DB_NAME = os.environ.get('DB_NAME')
 
+    # Connection pool (see db.py)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+
+    # Query instrumentation: per-request statement stats, a slow-query log
+    # (0 disables it) and a warning when one SELECT repeats this many times
+    DB_QUERY_STATS = os.environ.get('DB_QUERY_STATS', '1') == '1'
+    DB_SLOW_QUERY_MS = int(os.environ.get('DB_SLOW_QUERY_MS', 200))
+    DB_N_PLUS_ONE_THRESHOLD = int(os.environ.get('DB_N_PLUS_ONE_THRESHOLD', 10))
+
+    # Prometheus metrics at /metrics; set METRICS_TOKEN to require
+    # "Authorization: Bearer <token>" from the scraper
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Sampling profiler: admins send "X-Profile: 1", or every Nth request is
+    # profiled (0 = only on request). Collapsed stacks land in PROFILER_DIR.
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', '0') == '1'
+    PROFILER_SAMPLE_RATE = int(os.environ.get('PROFILER_SAMPLE_RATE', 0))
+    PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', 5))
+    PROFILER_DIR = os.environ.get('PROFILER_DIR', 'profiles')
+
+    # Seconds between re-reads of cached seat statuses (0 = rely on local updates only)
+    SEATMAP_STATUS_TTL = float(os.environ.get('SEATMAP_STATUS_TTL', 10))
+    # Seat changes remembered per concert for /book/<id>/availability?since=
+    SEATMAP_CHANGELOG_SIZE = int(os.environ.get('SEATMAP_CHANGELOG_SIZE', 1024))
+    # Concerts whose seat maps stay in memory (least recently viewed dropped first)
+    SEATMAP_MAX_CONCERTS = int(os.environ.get('SEATMAP_MAX_CONCERTS', 50))
+    # Seats per concert whose rendered booking-page rows are kept (~380 B each);
+    # rows of sections nobody opened lately are dropped first
+    SEATMAP_ROW_CACHE_SEATS = int(os.environ.get('SEATMAP_ROW_CACHE_SEATS', 10000))
+
+    # Live seat updates over server-sent events (/book/<id>/stream). Every
+    # stream holds a worker thread, so with threaded workers only
+    # SEAT_STREAM_THREAD_SHARE of SERVER_THREADS (threads per process, as in
+    # gunicorn --threads) may stream and the rest poll; MAX_CLIENTS is the cap
+    # under gevent/eventlet workers
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 8))
+    SEAT_STREAM_THREAD_SHARE = float(os.environ.get('SEAT_STREAM_THREAD_SHARE', 0.25))
+    SEAT_STREAM_MAX_CLIENTS = int(os.environ.get('SEAT_STREAM_MAX_CLIENTS', 1000))
+    SEAT_STREAM_HEARTBEAT = float(os.environ.get('SEAT_STREAM_HEARTBEAT', 15))
+    SEAT_STREAM_MAX_AGE = float(os.environ.get('SEAT_STREAM_MAX_AGE', 300))
+    SEAT_STREAM_RETRY_MS = int(os.environ.get('SEAT_STREAM_RETRY_MS', 3000))
+
+    # Release of abandoned ticket holds (see hold_sweeper.py)
+    HOLD_SWEEP_ENABLED = os.environ.get('HOLD_SWEEP_ENABLED', '1') == '1'
+    HOLD_TTL_SECONDS = int(os.environ.get('HOLD_TTL_SECONDS', 600))
+    HOLD_SWEEP_INTERVAL = float(os.environ.get('HOLD_SWEEP_INTERVAL', 30))
+    HOLD_SWEEP_BATCH = int(os.environ.get('HOLD_SWEEP_BATCH', 500))
+
+    # Most seats a single order may hold and buy at once
+    CART_MAX_TICKETS = int(os.environ.get('CART_MAX_TICKETS', 10))
+
+    # Replay of repeated payment submissions (see idempotency.py)
+    IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL', 3600))
+    IDEMPOTENCY_MAX_KEYS = int(os.environ.get('IDEMPOTENCY_MAX_KEYS', 10000))
+    IDEMPOTENCY_USE_DB = os.environ.get('IDEMPOTENCY_USE_DB', '0') == '1'
+
+    # Waiting room for hot concerts (see waiting_room.py); admins can set a
+    # per-concert rate for the worker process that serves
+    # /admin/waiting_room/<concert_id>
+    WAITING_ROOM_DEFAULT_RATE = float(os.environ.get('WAITING_ROOM_DEFAULT_RATE', 0))
+    WAITING_ROOM_BURST = int(os.environ.get('WAITING_ROOM_BURST', 50))
+    WAITING_ROOM_ADMISSION_TTL = int(os.environ.get('WAITING_ROOM_ADMISSION_TTL', 900))
+    WAITING_ROOM_TOKEN_TTL = int(os.environ.get('WAITING_ROOM_TOKEN_TTL', 3600))
+
+    # Concerts per page on /index
+    INDEX_PAGE_SIZE = int(os.environ.get('INDEX_PAGE_SIZE', 12))
+
+    # In-process search index; full rebuild interval (seconds) to pick up
+    # changes made by other worker processes
+    SEARCH_REBUILD_INTERVAL = int(os.environ.get('SEARCH_REBUILD_INTERVAL', 300))
+
+    # Seconds the admin dashboard's artist counters are cached
+    ADMIN_STATS_TTL = int(os.environ.get('ADMIN_STATS_TTL', 60))
+    # Applications per page on each admin dashboard tab
+    ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE', 25))
+
+    # Seconds a user's role is cached between requests
+    ROLE_CACHE_TTL = int(os.environ.get('ROLE_CACHE_TTL', 30))
+
+    # Bookings per page on the profile page
+    PROFILE_PAGE_SIZE = int(os.environ.get('PROFILE_PAGE_SIZE', 10))
+
+    # Background ticket generation for new concerts: seats per INSERT batch,
+    # worker threads, seconds finished jobs stay visible, seconds without a
+    # batch after which a running job counts as dead and is taken over, and
+    # how many times in a row a process checks back on such a job
+    TICKET_JOB_BATCH = int(os.environ.get('TICKET_JOB_BATCH', 2000))
+    TICKET_JOB_WORKERS = int(os.environ.get('TICKET_JOB_WORKERS', 2))
+    TICKET_JOB_RETENTION = int(os.environ.get('TICKET_JOB_RETENTION', 3600))
+    TICKET_JOB_STALL_SECONDS = int(os.environ.get('TICKET_JOB_STALL_SECONDS', 300))
+    TICKET_JOB_RESUME_RETRIES = int(os.environ.get('TICKET_JOB_RESUME_RETRIES', 3))
+
+    # Cache lifetime of fingerprinted CSS/JS from `flask assets build`
+    ASSETS_MAX_AGE = int(os.environ.get('ASSETS_MAX_AGE', 31536000))
+
+    # Response compression for text bodies of at least COMPRESS_MIN_SIZE
+    # bytes, and data-version ETags (304s) on the listing, booking and
+    # admin dashboard pages
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', '1') == '1'
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+    HTTP_ETAGS = os.environ.get('HTTP_ETAGS', '1') == '1'
+
+    # Rendered fragments shared by every visitor (the concert listing, the
+    # booking page header): seconds they live unless invalidated, and how many
+    FRAGMENT_CACHE_ENABLED = os.environ.get('FRAGMENT_CACHE_ENABLED', '1') == '1'
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 60))
+    FRAGMENT_CACHE_MAX_ENTRIES = int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 2000))
+
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -22,6 +145,14 @@ app.config.from_object(Config)
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['SESSION_COOKIE_SECURE'] = False
 
+init_db(app)
+init_hold_sweeper(app)
+init_metrics(app)
+init_profiler(app)
+init_assets(app)
+init_http_cache(app)
+fragment_cache.init_app(app)
+
 @app.context_processor
 def inject_user():
     """Make user session data available to all templates"""
@@ -38,35 +169,119 @@ def home():
     user_id = session.get('user_id')
     return render_template('base.html', user_id=user_id, role=role)
 
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+def _catalog_version():
+    """
+    Moves whenever the listing fragments are invalidated (a concert is
+    published) and once every FRAGMENT_CACHE_TTL, which also covers concerts
+    starting and writes made by other worker processes. No query.
+    """
+    ttl = app.config.get('FRAGMENT_CACHE_TTL', 60) or 1
+    return (fragment_cache.fragment_cache.generation(fragment_cache.TAG_CATALOG),
+            int(time.time() // ttl))
+
 @app.route('/index')
+@conditional(_catalog_version)
 def index():
     user_id = session.get('user_id')
     username = session.get('name')
     if not username:
         username = "Guest"
 
+    filters = {
+        'genre': request.args.get('genre', '').strip(),
+        'venue': request.args.get('venue', '').strip(),
+        'location': request.args.get('location', '').strip(),
+        'date_from': request.args.get('date_from', '').strip(),
+        'date_to': request.args.get('date_to', '').strip(),
+    }
+    page_size = app.config.get('INDEX_PAGE_SIZE', 12)
+    shown_filters = {k: v for k, v in filters.items() if v}
+
+    # The cards and pagination are the same for everyone asking for the same
+    # filters and page: serve them from the fragment cache without querying
+    listing_key = fragment_cache.make_key('index', sorted(shown_filters.items()), request.args.get('after', ''))
+    concert_list = fragment_cache.fragment_cache.get(listing_key) if fragment_cache.enabled() else None
+    if concert_list is not None:
+        return render_template('index.html', username=username, filters=shown_filters,
+                               concert_list=concert_list)
+
+    # Upcoming published concerts only, optionally narrowed by the filters
+    date_from = _parse_date(filters['date_from'])
+    conditions = ["c.published = 1", "c.date_time >= %s"]
+    params = [max(date_from, datetime.now()) if date_from else datetime.now()]
+    date_to = _parse_date(filters['date_to'])
+    if date_to:
+        conditions.append("c.date_time < %s")
+        params.append(date_to + timedelta(days=1))
+    if filters['genre']:
+        conditions.append("a.genre = %s")
+        params.append(filters['genre'])
+    if filters['venue']:
+        conditions.append("v.venue_name = %s")
+        params.append(filters['venue'])
+    if filters['location']:
+        conditions.append("v.location = %s")
+        params.append(filters['location'])
+
+    # Keyset pagination: continue after the last (date_time, concert_id) seen
+    cursor_position = decode_cursor(request.args.get('after'))
+    if cursor_position:
+        conditions.append("(c.date_time > %s OR (c.date_time = %s AND c.concert_id > %s))")
+        params.extend([cursor_position[0], cursor_position[0], cursor_position[1]])
+
     concerts = []
+    next_cursor = None
     db = get_db_connection()
     if not db:
         flash('Database connection error!', 'error')
+        return render_template('index.html', username=username, filters={},
+                               concert_list=_render_concert_list([], {}, None, True))
+    cursor = None
+    failed = False
     try:
         cursor = db.cursor()
-        cursor.execute("""
-                       SELECT c.concert_id, c.title, c.date_time, a.artist_name, 
-                       a.genre, v.venue_name, v.location FROM 
-                       Concerts c, Artists a, Venues v 
-                       WHERE c.artist_id = a.artist_id 
-                       AND c.venue_id = v.venue_id LIMIT 5
-                       """)
+        cursor.execute(f"""
+                       SELECT c.concert_id, c.title, c.date_time, a.artist_name,
+                       a.genre, v.venue_name, v.location
+                       FROM Concerts c
+                       JOIN Artists a ON c.artist_id = a.artist_id
+                       JOIN Venues v ON c.venue_id = v.venue_id
+                       WHERE {' AND '.join(conditions)}
+                       ORDER BY c.date_time, c.concert_id
+                       LIMIT %s
+                       """, (*params, page_size + 1))
         concerts = cursor.fetchall()
+        # The extra row only tells us whether there is a next page
+        if len(concerts) > page_size:
+            concerts = concerts[:page_size]
+            last = concerts[-1]
+            next_cursor = encode_cursor(last[2], last[0])
     except Exception as e:
         flash(f'An error occurred: {str(e)}', 'error')
         concerts = []
+        failed = True
     finally:
-        cursor.close()
+        if cursor:
+            cursor.close()
         db.close()
-    print(concerts)
-    return render_template('index.html', username=username, concerts=concerts)
+
+    concert_list = _render_concert_list(concerts, shown_filters, next_cursor, cursor_position is None)
+    if not failed and fragment_cache.enabled():
+        tags = [fragment_cache.TAG_CATALOG] + [fragment_cache.concert_tag(c[0]) for c in concerts]
+        fragment_cache.fragment_cache.set(listing_key, concert_list, fragment_cache.default_ttl(), tags)
+    return render_template('index.html', username=username, filters=shown_filters,
+                           concert_list=concert_list)
+
+def _render_concert_list(concerts, filters, next_cursor, is_first_page):
+    """Cards and pagination of the listing (index_concerts.html), ready to embed"""
+    return Markup(render_template('index_concerts.html', concerts=concerts, filters=filters,
+                                  next_cursor=next_cursor, is_first_page=is_first_page))
 
 from auth import auth_bp
 app.register_blueprint(auth_bp)
@@ -86,5 +301,14 @@ app.register_blueprint(artist_bp)
 from admin import admin_bp
 app.register_blueprint(admin_bp)
 
+from waiting_room import waiting_room_bp
+app.register_blueprint(waiting_room_bp)
+
+from search import search_bp
+app.register_blueprint(search_bp)
+
+from ticket_jobs import init_app as init_ticket_jobs
+init_ticket_jobs(app)
+
 if __name__ == '__main__':
     app.run(debug=True)
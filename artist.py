@@ -1,6 +1,10 @@
 # artist.py
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from db import get_db_connection
+from permissions import get_role, role_required
+from ticket_jobs import record_ticket_job, start_ticket_generation
+from admin import invalidate_artist_stats
+import fragment_cache
 from datetime import datetime
 
 artist_bp = Blueprint('artist', __name__)
@@ -14,8 +18,7 @@ def apply_artist():
         flash('You need to log in first!', 'error')
         return redirect(url_for('auth.login'))
 
-    role = session.get('role')
-    if role == 'artist':
+    if get_role() == 'artist':
         flash('You are already a verified artist!', 'info')
         return redirect(url_for('profile.profile'))
 
@@ -98,6 +101,10 @@ def apply_artist():
                       proof_description, datetime.now()))
             
             db.commit()
+            invalidate_artist_stats()
+            if existing_application:
+                # A renamed or re-genred artist may already have concerts listed
+                fragment_cache.invalidate(fragment_cache.TAG_CATALOG)
             
             flash('Application submitted successfully! We will review it shortly.', 'success')
             return redirect(url_for('profile.profile'))
@@ -118,14 +125,10 @@ def apply_artist():
 
 
 @artist_bp.route('/create_concert', methods=['GET', 'POST'])
+@role_required('artist', message='Only verified artists can create concerts!')
 def create_concert():
     user_id = session.get('user_id')
     
-    # Check if user is logged in
-    if not user_id:
-        flash('You need to log in first!', 'error')
-        return redirect(url_for('auth.login'))
-    
     db = get_db_connection()
     if not db:
         flash('Database connection error!', 'error')
@@ -137,27 +140,14 @@ def create_concert():
     try:
         cursor = db.cursor()
         
-        # Check if user is a verified artist
+        # Role is checked by role_required; the artist record is still needed
         cursor.execute("""
-            SELECT a.artist_id, u.role, a.status 
-            FROM Users u
-            LEFT JOIN Artists a ON u.user_id = a.user_id
-            WHERE u.user_id = %s
+            SELECT artist_id, status FROM Artists WHERE user_id = %s
         """, (user_id,))
-        user_data = cursor.fetchone()
-        
-        if not user_data:
-            flash('User not found!', 'error')
-            return redirect(url_for('profile.profile'))
-        
-        artist_id = user_data[0]
-        user_role = user_data[1]
-        artist_status = user_data[2] if user_data[2] else None
+        artist_data = cursor.fetchone()
         
-        # Check if user is an artist
-        if user_role != 'artist':
-            flash('Only verified artists can create concerts!', 'error')
-            return redirect(url_for('profile.profile'))
+        artist_id = artist_data[0] if artist_data else None
+        artist_status = artist_data[1] if artist_data else None
         
         # Check if artist application is approved
         if artist_status != 'approved':
@@ -240,35 +230,23 @@ def create_concert():
                                       venues=venues,
                                       min_datetime=datetime.now().strftime('%Y-%m-%dT%H:%M'))
             
-            # Insert concert into database
+            # Insert the concert unpublished; it goes live once its tickets exist
             cursor.execute("""
-                INSERT INTO Concerts (title, artist_id, venue_id, date_time)
-                VALUES (%s, %s, %s, %s)
+                INSERT INTO Concerts (title, artist_id, venue_id, date_time, published)
+                VALUES (%s, %s, %s, %s, 0)
             """, (title, artist_id, venue_id, concert_datetime))
+            concert_id = cursor.lastrowid
+            # Stored with the concert, so the job can be resumed after a restart
+            record_ticket_job(cursor, concert_id, (gold_price, silver_price, bronze_price))
             
             db.commit()
-            concert_id = cursor.lastrowid
             
-            # Call the stored procedure to generate tickets
-            try:
-                cursor.callproc('generate_concert_tickets', 
-                               [concert_id, gold_price, silver_price, bronze_price])
-                db.commit()
-                
-                # Get count of tickets generated
-                cursor.execute("""
-                    SELECT COUNT(*) FROM Tickets WHERE concert_id = %s
-                """, (concert_id,))
-                ticket_count = cursor.fetchone()[0]
-                
-                flash(f'Concert "{title}" created successfully with {ticket_count} tickets! 🎉', 'success')
-                
-            except Exception as proc_error:
-                db.rollback()
-                print(f"Error calling stored procedure: {proc_error}")
-                flash('Concert created but failed to generate tickets. Please contact support.', 'warning')
+            # Tickets are generated in the background; the artist can watch
+            # the progress instead of waiting on this request
+            start_ticket_generation(concert_id, user_id, (gold_price, silver_price, bronze_price))
             
-            return redirect(url_for('profile.profile'))
+            flash(f'Concert "{title}" created! Its tickets are being generated and it will be published when they are ready. 🎉', 'success')
+            return redirect(url_for('ticket_jobs.progress_page', concert_id=concert_id))
         
     except Exception as e:
         if db:
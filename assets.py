@@ -0,0 +1,182 @@
+# assets.py
+"""
+Static asset pipeline for the page styles and scripts.
+
+Sources live in static/src/ (css/<page>.css, js/<page>.js). Running
+
+    flask --app app assets build
+
+minifies each stylesheet (scripts are kept as written), names each file
+after a hash of its content
+(css/booking.3f2a9c1e04.css), writes a gzip copy and, when the optional
+`brotli` package is installed, a brotli copy next to it, and records the
+names in static/dist/manifest.json.
+
+Templates link assets with `asset_url('css/booking.css')`. With a manifest
+that resolves to /assets/<fingerprinted name>, served with a one-year
+immutable Cache-Control and the precompressed copy the browser accepts; a
+new build changes the name, so no cache ever has to be purged. In debug
+mode or before the first build it falls back to the source file.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import Blueprint, current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+assets_bp = Blueprint('assets', __name__)
+assets_cli = AppGroup('assets', help='Build the fingerprinted static bundles.')
+
+SOURCE_DIR = 'src'
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+
+# Precompressed copies, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+# Quoted strings and comments, in source order; a '/*' inside a string is
+# part of the string and a quote inside a comment part of the comment
+_CSS_TOKEN_RE = re.compile(r"""("(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*'|/\*.*?\*/)""", re.S)
+
+
+def minify_css(source):
+    """
+    Drop comments and collapse whitespace. Quoted strings (content values,
+    attribute selectors, font names) are set aside first and put back
+    unchanged.
+    """
+    strings = []
+
+    def set_aside(match):
+        token = match.group(0)
+        if token.startswith('/*'):
+            return ' '
+        strings.append(token)
+        return f'\x00{len(strings) - 1}\x00'
+
+    source = _CSS_TOKEN_RE.sub(set_aside, source)
+    source = re.sub(r'\s+', ' ', source)
+    # Spaces around punctuation never matter here; around ':' they can in selectors
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    source = source.replace(';}', '}').strip()
+    return re.sub(r'\x00(\d+)\x00', lambda m: strings[int(m.group(1))], source) + '\n'
+
+
+# Scripts are shipped as written: stripping them safely (template literals,
+# regex literals) needs a real JavaScript parser, and the gzip and brotli
+# copies already take out most of what a minifier would save
+MINIFIERS = {'.css': minify_css, '.js': lambda source: source}
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build(static_folder, clean=False):
+    """Build every source asset; returns the manifest {logical name: built name}."""
+    source_root = os.path.join(static_folder, SOURCE_DIR)
+    dist_root = os.path.join(static_folder, DIST_DIR)
+    manifest = {}
+    written = {os.path.join(dist_root, MANIFEST)}
+
+    for directory, _, files in os.walk(source_root):
+        for filename in sorted(files):
+            base, ext = os.path.splitext(filename)
+            minify = MINIFIERS.get(ext)
+            if minify is None:
+                continue
+            source_path = os.path.join(directory, filename)
+            name = os.path.relpath(source_path, source_root).replace(os.sep, '/')
+            with open(source_path, encoding='utf-8') as f:
+                data = minify(f.read()).encode('utf-8')
+
+            digest = hashlib.sha256(data).hexdigest()[:10]
+            built = f"{name[:-len(ext)]}.{digest}{ext}"
+            target = os.path.join(dist_root, built)
+            _write(target, data)
+            # mtime=0 keeps the .gz byte-identical between builds
+            _write(target + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+            written.update((target, target + '.gz'))
+            if brotli is not None:
+                _write(target + '.br', brotli.compress(data, quality=11))
+                written.add(target + '.br')
+            manifest[name] = built
+
+    _write(os.path.join(dist_root, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+    if clean:
+        # Old builds are kept by default: pages rendered before a deploy still link them
+        for directory, _, files in os.walk(dist_root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                if path not in written:
+                    os.remove(path)
+    return manifest
+
+
+def load_manifest(app):
+    path = os.path.join(app.static_folder, DIST_DIR, MANIFEST)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(name):
+    """URL of a static asset: the fingerprinted build if there is one, else the source."""
+    manifest = current_app.extensions.get('assets_manifest')
+    built = manifest.get(name) if manifest and not current_app.debug else None
+    if built is None:
+        return url_for('static', filename=f'{SOURCE_DIR}/{name}')
+    return url_for('assets.asset', filename=built)
+
+
+@assets_bp.route('/assets/<path:filename>')
+def asset(filename):
+    directory = os.path.join(current_app.static_folder, DIST_DIR)
+    max_age = current_app.config.get('ASSETS_MAX_AGE', 31536000)
+    mimetype = mimetypes.guess_type(filename)[0]
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if request.accept_encodings[name] and os.path.isfile(os.path.join(directory, filename + suffix)):
+            encoding, filename = name, filename + suffix
+            break
+
+    response = send_from_directory(directory, filename, mimetype=mimetype, max_age=max_age)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # The name changes with the content, so browsers never need to revalidate
+    response.headers['Cache-Control'] = f'public, max-age={max_age}, immutable'
+    return response
+
+
+@assets_cli.command('build')
+@click.option('--clean', is_flag=True, help='Delete built files that are not in the new manifest.')
+def build_command(clean):
+    """Minify, fingerprint and precompress static/src into static/dist."""
+    manifest = build(current_app.static_folder, clean=clean)
+    current_app.extensions['assets_manifest'] = manifest
+    click.echo(f"Built {len(manifest)} assets{'' if brotli else ' (install brotli for .br copies)'}")
+
+
+def init_app(app):
+    app.extensions['assets_manifest'] = load_manifest(app)
+    app.add_template_global(asset_url)
+    app.register_blueprint(assets_bp)
+    app.cli.add_command(assets_cli)
@@ -0,0 +1,98 @@
+"""
+Per-purchase latency of payment_gateway's booking finalisation.
+
+Compares the original chain (create_booking + commit, then SET/CALL/SELECT
+complete_booking + commit) with the single finalize_booking call. Each
+purchase first holds a fresh available ticket of the given concert, which
+is not timed.
+
+    python benchmarks/bench_payment.py --concert-id 1 --user-id 2 -n 200
+
+Uses the DB_* settings from .env. Needs 2 * n available tickets; run
+against a scratch database, the tickets end up sold (or released again
+with --status failed).
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import mysql.connector
+from dotenv import load_dotenv
+
+
+def legacy_finalize(db, cursor, user_id, ticket_id, amount, method, success):
+    cursor.callproc('create_booking', (user_id, ticket_id, amount, method))
+    db.commit()
+    if success:
+        cursor.execute("SET @p_user_id = %s, @p_ticket_id = %s;", (user_id, ticket_id))
+        cursor.execute("CALL complete_booking(@p_user_id, @p_ticket_id, @p_booking_id);")
+        cursor.execute("SELECT @p_booking_id;")
+    else:
+        cursor.execute("SET @u=%s, @t=%s;", (user_id, ticket_id))
+        cursor.execute("CALL cancel_booking(@u, @t, @b);")
+        cursor.execute("SELECT @b;")
+    booking_id = cursor.fetchone()[0]
+    db.commit()
+    return booking_id
+
+
+def single_call_finalize(db, cursor, user_id, ticket_id, amount, method, success):
+    result = cursor.callproc('finalize_booking', (user_id, ticket_id, amount, method, success, 0))
+    db.commit()
+    return result[5]
+
+
+def run(db, name, finalize, ticket_ids, user_id, method, success):
+    cursor = db.cursor()
+    timings = []
+    for ticket_id, price in ticket_ids:
+        cursor.callproc('hold_ticket', (user_id, ticket_id))
+        db.commit()
+
+        started = time.perf_counter()
+        finalize(db, cursor, user_id, ticket_id, price, method, success)
+        timings.append((time.perf_counter() - started) * 1000)
+    cursor.close()
+
+    timings.sort()
+    p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+    print(f"{name:<14} n={len(timings):<5} mean={statistics.mean(timings):7.2f} ms  "
+          f"p50={statistics.median(timings):7.2f} ms  p95={p95:7.2f} ms")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--concert-id', type=int, required=True)
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('-n', type=int, default=100, help='purchases per variant')
+    parser.add_argument('--status', choices=['success', 'failed'], default='success')
+    parser.add_argument('--method', default='upi')
+    args = parser.parse_args()
+
+    load_dotenv(override=True)
+    db = mysql.connector.connect(host=os.environ.get('DB_HOST'), user=os.environ.get('DB_USER'),
+                                 password=os.environ.get('DB_PASSWORD'),
+                                 database=os.environ.get('DB_NAME'))
+    cursor = db.cursor()
+    cursor.execute("""
+        SELECT ticket_id, price FROM Tickets
+        WHERE concert_id = %s AND status = 'available'
+        ORDER BY ticket_id LIMIT %s
+    """, (args.concert_id, args.n * 2))
+    tickets = cursor.fetchall()
+    cursor.close()
+    if len(tickets) < args.n * 2:
+        sys.exit(f"Need {args.n * 2} available tickets for concert {args.concert_id}, found {len(tickets)}")
+
+    success = args.status == 'success'
+    before = run(db, 'legacy chain', legacy_finalize, tickets[:args.n], args.user_id, args.method, success)
+    after = run(db, 'single call', single_call_finalize, tickets[args.n:], args.user_id, args.method, success)
+    print(f"median speed-up: {statistics.median(before) / statistics.median(after):.2f}x")
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+Render time of the booking page for large seat maps.
+
+Builds an in-memory ConcertSeatMap of each size (no database needed) and
+renders booking.html the way book.book_concert does:
+
+  cold        first render of a freshly loaded map: grid plus every row
+  warm        nothing changed since the last render, all rows reused
+  one change  one seat changes status before each render (one row redone)
+  legacy      with --legacy, the old page that grouped and re-sorted every
+              ticket in Jinja on every request
+
+    python benchmarks/bench_seat_render.py --sizes 500 5000 50000 -n 20 --legacy
+
+A tenth of the seats are sold; rows hold --per-row seats. Every size is a
+single section, so above --row-cache-seats (SEATMAP_ROW_CACHE_SEATS) only
+the first rows stay cached and "warm" re-renders the rest.
+"""
+import argparse
+import itertools
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import render_template  # noqa: E402
+
+from app import app  # noqa: E402
+from book import _render_seat_row  # noqa: E402
+from seatmap import STATUS_AVAILABLE, STATUS_HELD, STATUS_SOLD, ConcertSeatMap  # noqa: E402
+
+# The seat loop booking.html used before the grid moved into seatmap.py,
+# iterating over every row instead of a hard-coded A-E list
+LEGACY_SEATS = """
+{% set rows = {} %}
+{% for ticket in tickets %}
+    {% set row = ticket[1] %}
+    {% set seat_no = ticket[2] %}
+    {% set seat_type = ticket[3]|lower %}
+    {% set price = ticket[4] %}
+    {% set ticket_id = ticket[0] %}
+    {% set status = ticket[5]|lower %}
+    {% if row not in rows %}
+        {% set _ = rows.update({row: []}) %}
+    {% endif %}
+    {% set _ = rows[row].append((ticket_id, seat_no, seat_type, price, status)) %}
+{% endfor %}
+{% for row in rows %}
+    {% if row in rows %}
+        <div class="seat-row"><div class="row-label">{{ row }}</div><div class="seats">
+        {% for ticket_id, seat_no, seat_type, price, status in rows[row]|sort(attribute='1') %}
+            <div class="seat {{ seat_type }} {% if status == 'sold' %}sold{% endif %}"
+                 data-ticket-id="{{ ticket_id }}" data-seat-label="{{ row }}{{ seat_no }}"
+                 data-seat-no="{{ seat_no }}" data-price="{{ price }}" data-seat-type="{{ seat_type|title }}"
+                 {% if status != 'sold' %}onclick="selectSeat('{{ ticket_id }}', '{{ row }}{{ seat_no }}', '{{ price }}', '{{ seat_type|title }}', this)"{% endif %}>
+                {% if status != 'sold' %}
+                    <input type="checkbox" name="ticket_id" value="{{ ticket_id }}" id="seat_{{ ticket_id }}" class="booking-form">
+                    <label class="seat-label"><span class="seat-number">{{ seat_no }}</span><span class="seat-price">₹{{ price }}</span></label>
+                {% else %}
+                    <span class="seat-number">{{ seat_no }}</span><span class="seat-price">₹{{ price }}</span>
+                {% endif %}
+            </div>
+        {% endfor %}
+        </div></div>
+    {% endif %}
+{% endfor %}
+"""
+
+
+def row_label(index):
+    label = ''
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        label = chr(ord('A') + rest) + label
+    return label
+
+
+def build_seat_map(size, per_row, row_cache_seats=10000):
+    layout, statuses = [], []
+    for i in range(size):
+        row, seat_no = row_label(i // per_row), i % per_row + 1
+        seat_type = 'Gold' if seat_no <= per_row // 5 else 'Silver' if seat_no <= per_row // 2 else 'Bronze'
+        layout.append((i + 1, row, seat_no, seat_type, 500))
+        statuses.append(STATUS_SOLD if i % 10 == 0 else STATUS_AVAILABLE)
+    return ConcertSeatMap(1, ('Benchmark Night', 'Arena', 'City', '2030-01-01 20:00'), layout, statuses,
+                          row_cache_seats=row_cache_seats)
+
+
+def render_page(seat_map):
+    concert = seat_map.concert
+    sections = seat_map.overview()
+    return render_template('booking.html',
+                           sections=sections,
+                           section=sections[0]['section'],
+                           seat_rows=seat_map.render_rows(_render_seat_row, sections[0]['section']),
+                           concert_name=concert[0],
+                           concert_venue=concert[1] + ', ' + concert[2],
+                           concert_date=concert[3],
+                           seatmap_version=seat_map.token,
+                           max_tickets=10)
+
+
+def legacy_page():
+    """booking.html with its seat loop swapped for LEGACY_SEATS."""
+    source = app.jinja_env.loader.get_source(app.jinja_env, 'booking.html')[0]
+    start = source.index('{% for row_html in seat_rows %}')
+    end = source.index('<div class="selected-info"')
+    return source[:start] + LEGACY_SEATS + source[end:]
+
+
+def render_legacy(seat_map, _compiled=[]):
+    if not _compiled:
+        # Compiled once, like render_template's cached booking.html
+        _compiled.append(app.jinja_env.from_string(legacy_page()))
+    concert = seat_map.concert
+    context = dict(tickets=seat_map.tickets(),
+                   sections=[],
+                   section=None,
+                   concert_name=concert[0],
+                   concert_venue=concert[1] + ', ' + concert[2],
+                   concert_date=concert[3],
+                   seatmap_version=seat_map.token,
+                   max_tickets=10)
+    app.update_template_context(context)
+    return _compiled[0].render(context)
+
+
+def time_it(render, n, before=None):
+    timings = []
+    for _ in range(n):
+        if before:
+            before()
+        started = time.perf_counter()
+        html = render()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[max(0, int(len(timings) * 0.95) - 1)], len(html)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 5000, 50000])
+    parser.add_argument('--per-row', type=int, default=50, help='seats per row')
+    parser.add_argument('-n', type=int, default=20, help='renders per size and variant')
+    parser.add_argument('--legacy', action='store_true', help='also time the old in-template grouping')
+    parser.add_argument('--row-cache-seats', type=int, default=10000,
+                        help='rendered-row cache budget per map (SEATMAP_ROW_CACHE_SEATS)')
+    args = parser.parse_args()
+
+    print(f"{'seats':>8} {'variant':<12} {'median ms':>10} {'p95 ms':>10} {'html KB':>9}")
+    with app.test_request_context('/book/1'):
+        render_page(build_seat_map(10, args.per_row))  # compile the templates outside the timings
+        for size in args.sizes:
+            maps = []
+            results = [('cold', time_it(lambda: render_page(maps[-1]), args.n,
+                                        lambda: maps.append(build_seat_map(size, args.per_row, args.row_cache_seats))))]
+
+            seat_map = build_seat_map(size, args.per_row, args.row_cache_seats)
+            render_page(seat_map)
+            results.append(('warm', time_it(lambda: render_page(seat_map), args.n)))
+
+            # Toggle one seat between available and held, so one row changes per render
+            ticket_id = seat_map.layout[size // 2][0]
+            statuses = itertools.cycle([STATUS_HELD, STATUS_AVAILABLE])
+            results.append(('one change', time_it(lambda: render_page(seat_map), args.n,
+                                                  lambda: seat_map.set_status(ticket_id, next(statuses)))))
+            if args.legacy:
+                render_legacy(seat_map)
+                results.append(('legacy', time_it(lambda: render_legacy(seat_map), args.n)))
+
+            for name, (median, p95, length) in results:
+                print(f"{size:>8} {name:<12} {median:>10.2f} {p95:>10.2f} {length / 1024:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
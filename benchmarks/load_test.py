@@ -0,0 +1,272 @@
+"""
+On-sale rush load test for the booking funnel.
+
+Every virtual user logs in and walks index -> book -> confirm_booking ->
+initiate_payment -> simulate_payment -> payment_gateway for the same
+concert, picking random free seats from the page it was served, so users
+compete for seats exactly like a real on-sale. For venues with several
+sections the booking page is only an overview, so the user then opens a
+random section with free seats (/book/<id>/sections/<section>) and picks
+from its rows.
+
+    python app.py &                      # or gunicorn app:app -w 4 --threads 8
+    python benchmarks/load_test.py --concert-id 1 --users 2000 --concurrency 200 --signup
+
+Reports throughput, p50/p95/p99 latency per route, hold conflicts, errors
+and, with DB_* settings in .env, checks MySQL for double-sold seats.
+Only the standard library and mysql-connector-python are needed.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+SEAT_RE = re.compile(r'<div class="seat ([^"]*)"\s+data-ticket-id="(\d+)"[^>]*?\sdata-price="([^"]*)"')
+IDEMPOTENCY_RE = re.compile(r'name="idempotency_key" value="([^"]+)"')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Each funnel step is timed on its own, so redirects are not followed."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Results:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.outcomes = defaultdict(int)
+
+    def record(self, route, status, seconds):
+        with self._lock:
+            self.latencies[route].append(seconds * 1000)
+            self.statuses[route][status] += 1
+
+    def outcome(self, name):
+        with self._lock:
+            self.outcomes[name] += 1
+
+
+class VirtualUser:
+
+    def __init__(self, base_url, results, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.results = results
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect)
+
+    def request(self, route, path, data=None):
+        """Returns (status, location, body); status 0 means a network error."""
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        started = time.perf_counter()
+        try:
+            response = self.opener.open(self.base_url + path, data=body, timeout=self.timeout)
+            status, location, text = response.status, None, response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as e:
+            status, location, text = e.code, e.headers.get('Location'), ''
+        except Exception:
+            status, location, text = 0, None, ''
+        self.results.record(route, status, time.perf_counter() - started)
+        return status, location or '', text
+
+    def signup(self, email, password):
+        self.request('signup', '/signup', {'email': email, 'password': password})
+
+    def login(self, email, password):
+        status, location, _ = self.request('login', '/login', {'username': email, 'password': password})
+        return status == 302 and '/login' not in location
+
+    def open_section(self, concert_id):
+        """Seat rows of a random section that still has free seats, like a visitor picking one."""
+        status, _, body = self.request('sections', f'/book/{concert_id}/sections')
+        if status != 200:
+            return None
+        sections = [s['section'] for s in json.loads(body)['sections'] if s['available']]
+        if not sections:
+            return ''
+        section = urllib.parse.quote(random.choice(sections))
+        status, _, body = self.request('section_seats', f'/book/{concert_id}/sections/{section}')
+        return json.loads(body)['html'] if status == 200 else None
+
+    def buy(self, concert_id, max_seats):
+        results = self.results
+        self.request('index', '/index')
+
+        status, _, page = self.request('book', f'/book/{concert_id}')
+        if status != 200:
+            results.outcome('book_failed')
+            return
+        if 'data-ticket-id=' not in page:
+            # Sectioned venue: the page is only the overview, open a section
+            page = self.open_section(concert_id)
+            if page is None:
+                results.outcome('book_failed')
+                return
+        free = {int(ticket_id): price for classes, ticket_id, price in SEAT_RE.findall(page)
+                if 'sold' not in classes.split()}
+        if not free:
+            results.outcome('sold_out')
+            return
+        seats = random.sample(sorted(free), min(len(free), random.randint(1, max_seats)))
+        # payment_gateway refuses any amount other than the seats' total
+        amount = str(sum(Decimal(free[ticket_id]) for ticket_id in seats))
+
+        status, _, _ = self.request('confirm_booking', '/confirm_booking', {'ticket_id': seats})
+        if status != 200:
+            results.outcome('seat_gone_at_confirm')
+            return
+
+        status, location, _ = self.request('initiate_payment', '/initiate_payment',
+                                           {'ticket_id': seats, 'payment_method': 'upi'})
+        if 'simulate_payment' not in location:
+            results.outcome('hold_conflict')
+            return
+
+        path = urllib.parse.urlsplit(location)
+        _, _, page = self.request('simulate_payment', f'{path.path}?{path.query}')
+        key = IDEMPOTENCY_RE.search(page)
+
+        form = {'ticket_id': seats, 'payment_method': 'upi', 'payment_status': 'success', 'amount': amount}
+        if key:
+            form['idempotency_key'] = key.group(1)
+        status, location, _ = self.request('payment_gateway', '/payment_gateway', form)
+        if status == 302 and ('ticket_details' in location or '/profile' in location):
+            results.outcome('purchased')
+            results.outcome(f'seats_purchased_{len(seats)}')
+        else:
+            results.outcome('payment_failed')
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def double_sale_check(concert_id):
+    """Seats of the concert with more than one confirmed booking, via MySQL."""
+    try:
+        import mysql.connector
+        from dotenv import load_dotenv
+    except ImportError:
+        return None
+    load_dotenv(override=True)
+    if not os.environ.get('DB_HOST'):
+        return None
+    db = mysql.connector.connect(host=os.environ.get('DB_HOST'), user=os.environ.get('DB_USER'),
+                                 password=os.environ.get('DB_PASSWORD'),
+                                 database=os.environ.get('DB_NAME'))
+    cursor = db.cursor()
+    cursor.execute("""
+        SELECT b.ticket_id, COUNT(*)
+        FROM Bookings b
+        JOIN Tickets t ON b.ticket_id = t.ticket_id
+        WHERE t.concert_id = %s AND b.status = 'confirmed'
+        GROUP BY b.ticket_id
+        HAVING COUNT(*) > 1
+    """, (concert_id,))
+    duplicates = cursor.fetchall()
+    cursor.close()
+    db.close()
+    return duplicates
+
+
+def report(results, elapsed, users, concert_id, as_json):
+    routes = {}
+    total_requests = 0
+    for route, values in results.latencies.items():
+        values.sort()
+        total_requests += len(values)
+        routes[route] = {
+            'count': len(values),
+            'p50_ms': round(percentile(values, 50), 2),
+            'p95_ms': round(percentile(values, 95), 2),
+            'p99_ms': round(percentile(values, 99), 2),
+            'mean_ms': round(statistics.mean(values), 2),
+            'statuses': dict(results.statuses[route]),
+        }
+    duplicates = double_sale_check(concert_id)
+    summary = {
+        'users': users,
+        'elapsed_s': round(elapsed, 2),
+        'journeys_per_s': round(users / elapsed, 2) if elapsed else 0,
+        'requests_per_s': round(total_requests / elapsed, 2) if elapsed else 0,
+        'outcomes': dict(results.outcomes),
+        'routes': routes,
+        'double_sold_tickets': None if duplicates is None else [d[0] for d in duplicates],
+    }
+    if as_json:
+        print(json.dumps(summary, indent=2))
+        return summary
+
+    print(f"\n{users} virtual users in {summary['elapsed_s']}s: "
+          f"{summary['journeys_per_s']} journeys/s, {summary['requests_per_s']} requests/s\n")
+    print(f"{'route':<18}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  statuses")
+    for route in ['login', 'index', 'book', 'sections', 'section_seats', 'confirm_booking',
+                  'initiate_payment', 'simulate_payment', 'payment_gateway']:
+        if route in routes:
+            r = routes[route]
+            print(f"{route:<18}{r['count']:>8}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}  {r['statuses']}")
+    print("\noutcomes:", ', '.join(f"{k}={v}" for k, v in sorted(results.outcomes.items())))
+    if duplicates is None:
+        print("double-sale check: skipped (no DB_* settings)")
+    elif duplicates:
+        print(f"double-sale check: FAILED, {len(duplicates)} ticket(s) sold more than once: {summary['double_sold_tickets']}")
+    else:
+        print("double-sale check: ok, no ticket sold twice")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--concert-id', type=int, required=True)
+    parser.add_argument('--users', type=int, default=500, help='virtual users (one journey each)')
+    parser.add_argument('--concurrency', type=int, default=100, help='journeys in flight at once')
+    parser.add_argument('--max-seats', type=int, default=4, help='most seats one user tries to buy')
+    parser.add_argument('--signup', action='store_true', help='create the virtual users first')
+    parser.add_argument('--email-pattern', default='vu{n}@loadtest.local')
+    parser.add_argument('--password', default='loadtest')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args()
+
+    results = Results()
+
+    def journey(n):
+        user = VirtualUser(args.base_url, results, args.timeout)
+        email = args.email_pattern.format(n=n)
+        if args.signup:
+            user.signup(email, args.password)
+        if not user.login(email, args.password):
+            results.outcome('login_failed')
+            return
+        user.buy(args.concert_id, args.max_seats)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(journey, range(args.users)))
+    summary = report(results, time.perf_counter() - started, args.users, args.concert_id, args.json)
+    if summary['double_sold_tickets']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
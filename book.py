@@ -1,91 +1,268 @@
-from flask import Flask, session, render_template, Blueprint, sessions, flash, redirect, url_for, request
+import json
+import time
+from markupsafe import Markup
+from flask import Flask, session, render_template, Blueprint, sessions, flash, redirect, url_for, request, jsonify, Response, current_app
 from db import get_db_connection
+from http_cache import conditional
+from seatmap import STATUS_SOLD, get_seat_map, seat_maps, status_code
+from seat_events import broker, event_type, stream_limit
+from waiting_room import check_admission, guard_tickets
 
 book_bp = Blueprint('book', __name__)
 
+@book_bp.before_request
+def waiting_room_gate():
+    """Hot concerts admit visitors to seat selection at a controlled rate"""
+    if not session.get('user_id'):
+        return None
+    if request.endpoint in ('book.book_concert', 'book.section_seats'):
+        return check_admission(request.view_args['concert_id'])
+    if request.endpoint == 'book.confirm_booking':
+        return guard_tickets(parse_ticket_ids(request.form.getlist('ticket_id')))
+    return None
+
+def parse_ticket_ids(values):
+    """Distinct integer ticket ids from form/query values, in submission order"""
+    ticket_ids = []
+    for value in values:
+        try:
+            ticket_id = int(value)
+        except (TypeError, ValueError):
+            continue
+        if ticket_id not in ticket_ids:
+            ticket_ids.append(ticket_id)
+    return ticket_ids
+
+def _render_seat_row(row_no, seats, row_codes):
+    return Markup(render_template('booking_seat_row.html', row=row_no, seats=seats,
+                                  row_codes=row_codes, sold_code=status_code(STATUS_SOLD)))
+
+def _seat_page_version(concert_id):
+    """
+    The seat map token the page embeds, so a 304 never leaves the browser
+    holding a page whose `since` token belongs to another copy of the map
+    """
+    if not session.get('user_id'):
+        return None
+    seat_map = get_seat_map(concert_id)
+    if not seat_map:
+        return None
+    return (seat_map.concert, seat_map.token)
+
 @book_bp.route('/book/<int:concert_id>')
+@conditional(_seat_page_version)
 def book_concert(concert_id):
     user_id = session.get('user_id')
     if not user_id:
         flash('You need to log in first to book a concert!', 'error')
         return redirect(url_for('auth.login'))
     
-    db = get_db_connection()
-    if not db:
-        flash('Database connection error!', 'error')
-        return redirect(url_for('index'))
-    
     try:
-        cursor = db.cursor()
-        
-        # Get tickets
-        cursor.execute("""
-            SELECT t.ticket_id, s.row_no, s.seat_no, s.seat_type, t.price, t.status
-            FROM Tickets t
-            JOIN Seats s ON t.seat_id = s.seat_id
-            WHERE t.concert_id = %s
-            ORDER BY s.row_no, s.seat_no
-        """, (concert_id,))
-        tickets = cursor.fetchall()
-        
-        # Get concert details
-        cursor.execute("""
-            SELECT c.title, v.venue_name, v.location, c.date_time 
-            FROM Concerts c
-            JOIN Venues v ON c.venue_id = v.venue_id
-            WHERE c.concert_id = %s
-        """, (concert_id,))
-        concert = cursor.fetchone()
+        # Layout and statuses come from the in-process cache (seatmap.py)
+        seat_map = get_seat_map(concert_id)
         
         # Check if concert exists
-        if not concert:
+        if not seat_map:
             flash('Concert not found!', 'error')
             return redirect(url_for('index'))
         
+        concert = seat_map.concert
+        sections = seat_map.overview()
+        # Big venues open on the section overview; the seats of a section
+        # are only rendered once the visitor picks it
+        section = request.args.get('section')
+        if section not in seat_map.section_bounds:
+            section = sections[0]['section'] if len(sections) == 1 else None
         # Pass concert details separately to match your template
         return render_template('booking.html', 
-                             tickets=tickets,
+                             sections=sections,
+                             section=section,
+                             # Rows are rendered once and reused until one of their seats changes
+                             seat_rows=seat_map.render_rows(_render_seat_row, section) if section else [],
                              concert_name=concert[0],  # title
                              concert_venue=concert[1] + ', ' + concert[2],  # venue
-                             concert_date=concert[3])   # date
+                             concert_date=concert[3],   # date
+                             seatmap_version=seat_map.token,
+                             max_tickets=current_app.config.get('CART_MAX_TICKETS', 10))
         
     except Exception as e:
         print(f"Error details: {e}")
         flash(f'An error occurred: {str(e)}', 'error')
         return redirect(url_for('index'))  # Redirect on error instead of rendering
-    finally:
-        if cursor:
-            cursor.close()
-        if db:
-            db.close()
+
+@book_bp.route('/book/<int:concert_id>/availability')
+def seat_availability(concert_id):
+    """Seats whose status changed since ?since=<token>, or a full snapshot"""
+    since = request.args.get('since')
+    section = request.args.get('section') or None
+    try:
+        seat_map = get_seat_map(concert_id)
+    except Exception as e:
+        print(f"Error details: {e}")
+        return jsonify({'error': 'Seat map unavailable'}), 503
+    
+    if not seat_map:
+        return jsonify({'error': 'Concert not found'}), 404
+    
+    if section is not None and section not in seat_map.section_bounds:
+        return jsonify({'error': 'Section not found'}), 404
+    
+    token = seat_map.token
+    changes = seat_map.changes_since(seat_map.version_of(since), section)
+    if changes is None:
+        # The client is too far behind the change log, or its token is from
+        # another copy of the map: resend everything
+        return jsonify({'version': token, 'full': True, 'seats': seat_map.snapshot(section)})
+    return jsonify({'version': token, 'full': False, 'seats': changes})
+
+@book_bp.route('/book/<int:concert_id>/sections')
+def seat_sections(concert_id):
+    """Section overview: seat counts per status and price range of every section"""
+    try:
+        seat_map = get_seat_map(concert_id)
+    except Exception as e:
+        print(f"Error details: {e}")
+        return jsonify({'error': 'Seat map unavailable'}), 503
+    
+    if not seat_map:
+        return jsonify({'error': 'Concert not found'}), 404
+    return jsonify({'version': seat_map.token, 'sections': seat_map.overview()})
+
+@book_bp.route('/book/<int:concert_id>/sections/<path:section>')
+def section_seats(concert_id, section):
+    """Rendered seat rows of one section, loaded when the visitor opens it"""
+    if not session.get('user_id'):
+        return jsonify({'error': 'Login required'}), 401
+    try:
+        seat_map = get_seat_map(concert_id)
+    except Exception as e:
+        print(f"Error details: {e}")
+        return jsonify({'error': 'Seat map unavailable'}), 503
+    
+    if not seat_map:
+        return jsonify({'error': 'Concert not found'}), 404
+    if section not in seat_map.section_bounds:
+        return jsonify({'error': 'Section not found'}), 404
+    
+    token = seat_map.token
+    start, end = seat_map.section_bounds[section]
+    return jsonify({'version': token,
+                    'section': section,
+                    'seats': end - start,
+                    'html': ''.join(seat_map.render_rows(_render_seat_row, section))})
+
+def _seat_event_stream(concert_id, seat_map, since, heartbeat, max_age, retry_ms):
+    """Server-sent events for one watcher; runs after the request context is gone."""
+    started = time.monotonic()
+    yield f"retry: {retry_ms}\n\n"
+    version = seat_map.version_of(since)
+    if since and seat_map.changes_since(version) is None:
+        # The client's token is from another copy of the map or too old for
+        # the change log: send every seat once, then changes from there on
+        version = seat_map.version
+        payload = json.dumps({'version': seat_map.token_at(version), 'seats': seat_map.snapshot()})
+        yield f"id: {seat_map.token_at(version)}\nevent: snapshot\ndata: {payload}\n\n"
+    elif not since:
+        # No baseline: only stream what happens from now on
+        version = seat_map.version
+    while time.monotonic() - started < max_age:
+        if seat_maps.get(concert_id) is not seat_map:
+            # Cache was reloaded or invalidated: the client reconnects for a snapshot
+            yield "event: resync\ndata: {}\n\n"
+            return
+
+        changes = seat_map.changes_since(version)
+        latest = seat_map.version
+        if changes is None:
+            yield "event: resync\ndata: {}\n\n"
+            return
+        for ticket_id, status in changes:
+            payload = json.dumps({'ticket_id': ticket_id, 'status': status,
+                                  'version': seat_map.token_at(latest)})
+            yield f"id: {seat_map.token_at(latest)}\nevent: {event_type(status)}\ndata: {payload}\n\n"
+        version = latest
+
+        if not broker.wait(concert_id, lambda: seat_map.version != version
+                           or seat_maps.get(concert_id) is not seat_map, heartbeat):
+            # Comment line keeps proxies from closing an idle connection
+            yield ": keepalive\n\n"
+
+@book_bp.route('/book/<int:concert_id>/stream')
+def seat_stream(concert_id):
+    """Push seat hold/sold/release events for a concert as server-sent events"""
+    config = current_app.config
+    # EventSource resends the last id it saw when it reconnects
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        seat_map = get_seat_map(concert_id)
+    except Exception as e:
+        print(f"Error details: {e}")
+        return jsonify({'error': 'Seat map unavailable'}), 503
+    
+    if not seat_map:
+        return jsonify({'error': 'Concert not found'}), 404
+    
+    if seat_maps.get(concert_id) is not seat_map:
+        # Not kept in the cache (the concert is over): nothing will be pushed
+        return jsonify({'error': 'No live updates for this concert, poll instead'}), 503
+    
+    # Too many open streams: the page falls back to polling /availability.
+    # With threaded workers this is a small share of the threads, so streams
+    # can never take every thread away from ordinary requests
+    if not broker.try_attach(stream_limit(config)):
+        return jsonify({'error': 'Too many live connections, poll instead'}), 503
+    
+    stream = _seat_event_stream(concert_id, seat_map, since,
+                                heartbeat=config.get('SEAT_STREAM_HEARTBEAT', 15),
+                                max_age=config.get('SEAT_STREAM_MAX_AGE', 300),
+                                retry_ms=config.get('SEAT_STREAM_RETRY_MS', 3000))
+    response = Response(stream, mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs even if the client disconnects before the stream starts
+    response.call_on_close(broker.detach)
+    return response
 
 @book_bp.route('/confirm_booking', methods=['POST', 'GET'])
 def confirm_booking():
     user_id = session.get('user_id')
-    ticket_id = request.form.get('ticket_id')
+    # One order may cover several seats of the same concert
+    ticket_ids = parse_ticket_ids(request.form.getlist('ticket_id'))
     if not user_id:
         flash('You need to log in first to proceed with booking!', 'error')
         return redirect(url_for('auth.login'))
+    if not ticket_ids:
+        flash('Please select at least one seat!', 'error')
+        return redirect(url_for('index'))
+    max_tickets = current_app.config.get('CART_MAX_TICKETS', 10)
+    if len(ticket_ids) > max_tickets:
+        flash(f'You can book at most {max_tickets} seats per order!', 'error')
+        return redirect(url_for('index'))
     db = get_db_connection()
     if not db:
         flash('Database connection error!', 'error')
         return redirect(url_for('index'))    
     try:
         cursor = db.cursor()
-        cursor.execute("""SELECT c.title, a.artist_name, v.venue_name, v.location,
-                       c.date_time, s.row_no, s.seat_no, t.price
+        placeholders = ', '.join(['%s'] * len(ticket_ids))
+        cursor.execute(f"""SELECT c.title, a.artist_name, v.venue_name, v.location,
+                       c.date_time, s.row_no, s.seat_no, t.price, t.ticket_id, t.concert_id
                        FROM Tickets t
                        JOIN Seats s ON t.seat_id = s.seat_id
                        JOIN Concerts c ON t.concert_id = c.concert_id
                        JOIN Artists a ON c.artist_id = a.artist_id
                        JOIN Venues v ON c.venue_id = v.venue_id
-                       WHERE t.ticket_id = %s AND t.status != 'sold'""",
-                       (ticket_id,))
-        ticket_details = cursor.fetchone()
+                       WHERE t.ticket_id IN ({placeholders}) AND t.status != 'sold'
+                       ORDER BY s.row_no, s.seat_no""",
+                       tuple(ticket_ids))
+        rows = cursor.fetchall()
         
-        if not ticket_details:
+        if len(rows) != len(ticket_ids):
             flash('Ticket not found or unavailable!', 'error')
             return redirect(url_for('index'))
+        
+        if len({row[9] for row in rows}) > 1:
+            flash('All seats in one order must be for the same concert!', 'error')
+            return redirect(url_for('index'))
 
     except Exception as e:
         print(f"Error details: {e}")
@@ -97,8 +274,13 @@ def confirm_booking():
         if db:
             db.close()
 
+    ticket_details = rows[0]
+    seats = [{'ticket_id': row[8], 'row_no': row[5], 'seat_no': row[6], 'price': row[7]}
+             for row in rows]
     return render_template('confirm_booking.html',
-                            ticket_id=ticket_id,
+                            ticket_id=ticket_details[8],
+                            ticket_ids=[seat['ticket_id'] for seat in seats],
+                            seats=seats,
                             concert_name=ticket_details[0],
                             artist_name=ticket_details[1],
                             venue_name=ticket_details[2],
@@ -106,7 +288,7 @@ def confirm_booking():
                             concert_date=ticket_details[4],
                             row_no=ticket_details[5],
                             seat_no=ticket_details[6],
-                            price=ticket_details[7]
+                            price=sum(seat['price'] for seat in seats)
                     )
 
 @book_bp.route('/ticket_details')
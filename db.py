@@ -1,36 +1,467 @@
+import queue
+import re
+import threading
+import time
+from functools import lru_cache
+
 import mysql.connector
-from flask import current_app
+from flask import current_app, g, has_request_context, request
+from metrics import db_checkout_duration
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became free within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    A small thread-safe pool of MySQL connections.
+
+    `size` connections are kept open between requests; up to `max_overflow`
+    extra connections may be opened during a spike and are closed again as
+    soon as they are returned. When every connection is checked out, callers
+    wait up to `timeout` seconds for one to be released.
+    """
+
+    def __init__(self, connect_args, size=5, max_overflow=10, timeout=5.0, pre_ping=True):
+        self.connect_args = connect_args
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._open = 0
+
+        # Runtime statistics, read through stats()
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._discarded = 0
+
+    def _connect(self):
+        return mysql.connector.connect(**self.connect_args)
+
+    def _is_healthy(self, connection):
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def acquire(self):
+        """Borrow a connection, opening a new one if the pool is allowed to grow."""
+        waited = False
+        started = time.perf_counter()
+        deadline = started + self.timeout
+
+        with self._lock:
+            while True:
+                try:
+                    connection = self._idle.get_nowait()
+                    break
+                except queue.Empty:
+                    pass
+
+                if self._open < self.size + self.max_overflow:
+                    # Reserve the slot now, connect outside the lock
+                    self._open += 1
+                    connection = None
+                    break
+
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(
+                        f"No database connection available after {self.timeout}s "
+                        f"({self._open} open)"
+                    )
+                waited = True
+                self._released.wait(remaining)
+
+            self._in_use += 1
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+                self._wait_time += time.perf_counter() - started
+
+        try:
+            if connection is None:
+                connection = self._connect()
+            elif self.pre_ping and not self._is_healthy(connection):
+                self._close_quietly(connection)
+                with self._lock:
+                    self._discarded += 1
+                connection = self._connect()
+        except Exception:
+            with self._lock:
+                self._open -= 1
+                self._in_use -= 1
+                self._released.notify()
+            raise
+
+        return connection
+
+    def release(self, connection):
+        """Return a borrowed connection; overflow and broken connections are closed."""
+        keep = False
+        try:
+            # Never hand an open transaction to the next borrower
+            connection.rollback()
+            keep = True
+        except Exception:
+            pass
+
+        with self._lock:
+            self._in_use -= 1
+            if keep and self._idle.qsize() < self.size:
+                self._idle.put(connection)
+            else:
+                self._open -= 1
+                self._close_quietly(connection)
+            self._released.notify()
+
+    def dispose(self):
+        """Close every idle connection (e.g. after the database restarted)."""
+        with self._lock:
+            while True:
+                try:
+                    connection = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                self._open -= 1
+                self._close_quietly(connection)
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': self._idle.qsize(),
+                'in_use': self._in_use,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time_total': round(self._wait_time, 6),
+                'wait_time_avg': round(self._wait_time / self._waits, 6) if self._waits else 0.0,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+            }
+
+
+_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """
+    Normalised statement text: literals become ?, IN lists of any length
+    collapse to IN (...), whitespace is squeezed. Statements that differ
+    only in their parameters share a fingerprint.
+    """
+    sql = _LITERAL_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryLog:
+    """
+    Statements run through one request's (or background job's) connection.
+
+    `statements` maps fingerprint -> [count, seconds, rows]. Kept as plain
+    lists so recording a statement is a couple of additions.
+    """
+
+    def __init__(self, route, slow_threshold):
+        self.route = route
+        self.slow_threshold = slow_threshold
+        self.statements = {}
+        self.count = 0
+        self.seconds = 0.0
+
+    def record(self, sql, seconds, rows):
+        fp = fingerprint(sql)
+        entry = self.statements.get(fp)
+        if entry is None:
+            entry = self.statements[fp] = [0, 0.0, 0]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] += max(rows, 0)
+        self.count += 1
+        self.seconds += seconds
+        if self.slow_threshold is not None and seconds >= self.slow_threshold:
+            print(f"Slow query ({seconds * 1000:.1f} ms, {self.route}): {fp}")
+        return entry
+
+    def add_rows(self, entry, rows):
+        entry[2] += rows
+
+    def repeated(self, threshold):
+        """SELECT fingerprints run at least `threshold` times: likely N+1 loops."""
+        return {fp: entry[0] for fp, entry in self.statements.items()
+                if entry[0] >= threshold and fp[:6].upper() == 'SELECT'}
+
+
+class QueryMetrics:
+    """Process-wide totals of finished QueryLogs, per route and per fingerprint."""
+
+    def __init__(self, max_fingerprints=500):
+        self.max_fingerprints = max_fingerprints
+        self.routes = {}          # route -> [requests, queries, seconds, max_queries, n_plus_one]
+        self.statements = {}      # fingerprint -> [count, seconds, rows]
+        self._lock = threading.Lock()
+
+    def add(self, log, n_plus_one):
+        with self._lock:
+            route = self.routes.get(log.route)
+            if route is None:
+                route = self.routes[log.route] = [0, 0, 0.0, 0, 0]
+            route[0] += 1
+            route[1] += log.count
+            route[2] += log.seconds
+            route[3] = max(route[3], log.count)
+            route[4] += 1 if n_plus_one else 0
+            for fp, (count, seconds, rows) in log.statements.items():
+                entry = self.statements.get(fp)
+                if entry is None:
+                    if len(self.statements) >= self.max_fingerprints:
+                        continue
+                    entry = self.statements[fp] = [0, 0.0, 0]
+                entry[0] += count
+                entry[1] += seconds
+                entry[2] += rows
+
+    def snapshot(self, top=20):
+        with self._lock:
+            routes = {route: {
+                'requests': r[0],
+                'queries': r[1],
+                'queries_per_request': round(r[1] / r[0], 2) if r[0] else 0,
+                'db_seconds': round(r[2], 6),
+                'max_queries': r[3],
+                'n_plus_one_requests': r[4],
+            } for route, r in self.routes.items()}
+            statements = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return {
+            'routes': routes,
+            'top_statements': [{
+                'fingerprint': fp,
+                'count': e[0],
+                'seconds': round(e[1], 6),
+                'avg_ms': round(e[1] / e[0] * 1000, 3) if e[0] else 0,
+                'rows': e[2],
+            } for fp, e in statements],
+        }
+
+
+query_metrics = QueryMetrics()
+
+
+class InstrumentedCursor:
+    """Cursor wrapper that times every statement into a QueryLog."""
+
+    def __init__(self, cursor, log):
+        self._cursor = cursor
+        self._log = log
+        self._entry = None
+
+    def _affected_rows(self):
+        # Result sets are counted as they are fetched; DML reports rowcount
+        if getattr(self._cursor, 'with_rows', False):
+            return 0
+        return self._cursor.rowcount or 0
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            self._entry = self._log.record(operation, time.perf_counter() - started,
+                                           self._affected_rows())
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            self._entry = self._log.record(operation, time.perf_counter() - started,
+                                           self._affected_rows())
+
+    def callproc(self, procname, args=()):
+        started = time.perf_counter()
+        try:
+            return self._cursor.callproc(procname, args)
+        finally:
+            self._entry = self._log.record(f"CALL {procname}", time.perf_counter() - started, 0)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None and self._entry is not None:
+            self._log.add_rows(self._entry, 1)
+        return row
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if self._entry is not None:
+            self._log.add_rows(self._entry, len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class PooledConnection:
+    """
+    Request-scoped handle around a pooled connection.
+
+    Blueprints keep calling `db.close()` in their `finally` blocks; that is a
+    no-op here because the connection goes back to the pool when the
+    application context is torn down. With DB_QUERY_STATS on, its cursors
+    record every statement into `query_log`.
+    """
+
+    def __init__(self, connection, query_log=None):
+        self._connection = connection
+        self.query_log = query_log
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._connection.cursor(*args, **kwargs)
+        if self.query_log is None:
+            return cursor
+        return InstrumentedCursor(cursor, self.query_log)
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def _create_pool(app):
+    connect_args = {
+        'host': app.config.get('DB_HOST'),
+        'user': app.config.get('DB_USER'),
+        'password': app.config.get('DB_PASSWORD'),
+        'database': app.config.get('DB_NAME'),
+    }
+    return ConnectionPool(
+        connect_args,
+        size=int(app.config.get('DB_POOL_SIZE', 5)),
+        max_overflow=int(app.config.get('DB_POOL_MAX_OVERFLOW', 10)),
+        timeout=float(app.config.get('DB_POOL_TIMEOUT', 5)),
+        pre_ping=bool(app.config.get('DB_POOL_PRE_PING', True)),
+    )
+
+
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the connection pool of the current app, creating it on first use."""
+    app = current_app._get_current_object()
+    pool = app.extensions.get('db_pool')
+    if pool is None:
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None:
+                pool = _create_pool(app)
+                app.extensions['db_pool'] = pool
+    return pool
+
+
+def get_pool_stats():
+    """Snapshot of the pool counters (in-use, waits, wait time, ...)."""
+    pool = current_app.extensions.get('db_pool')
+    if pool is None:
+        return {}
+    return pool.stats()
+
 
 def get_db_connection():
     """
-    Establishes a connection to the MySQL database using credentials 
-    stored in the Flask application's configuration (loaded from .env).
+    Returns the database connection for the current request.
+
+    The first call in a request borrows a connection from the pool and stores
+    it on `flask.g`; later calls in the same request reuse it. The connection
+    is returned to the pool on teardown (see init_app).
 
     Returns: A MySQL Connection object, or None if the connection fails.
     """
-    
+    if 'db_conn' in g:
+        return g.db_conn
+
     # The Config class in app.py loaded these from the .env file.
     db_host = current_app.config.get('DB_HOST')
     db_user = current_app.config.get('DB_USER')
     db_password = current_app.config.get('DB_PASSWORD')
     db_name = current_app.config.get('DB_NAME')
 
-
-
     # Basic check to ensure credentials are set
     if not all([db_host, db_user, db_password, db_name]):
         print("ERROR: Database connection settings are missing. Please check your .env file and Config class in app.py.")
         return None
 
+    started = time.perf_counter()
     try:
-        connection = mysql.connector.connect(
-            host=db_host,
-            user=db_user,
-            password=db_password,
-            database=db_name
-        )
-        return connection
-    
+        connection = get_pool().acquire()
+    except PoolTimeout as err:
+        print(f"Error borrowing MySQL connection: {err}")
+        return None
     except mysql.connector.Error as err:
         print(f"Error connecting to MySQL: {err}")
-        return None
\ No newline at end of file
+        return None
+
+    db_checkout_duration.observe(time.perf_counter() - started)
+
+    g.db_conn = PooledConnection(connection, _new_query_log())
+    return g.db_conn
+
+
+def _new_query_log():
+    if not current_app.config.get('DB_QUERY_STATS', True):
+        return None
+    route = (request.endpoint or request.path) if has_request_context() else 'background'
+    slow_ms = current_app.config.get('DB_SLOW_QUERY_MS', 200)
+    return QueryLog(route, slow_ms / 1000 if slow_ms else None)
+
+
+def _finish_query_log(log):
+    threshold = current_app.config.get('DB_N_PLUS_ONE_THRESHOLD', 10)
+    repeated = log.repeated(threshold) if threshold else {}
+    for fp, count in repeated.items():
+        print(f"Possible N+1 in {log.route}: {count} x {fp}")
+    query_metrics.add(log, bool(repeated))
+
+
+def get_query_stats(top=20):
+    """Per-route query counts and the most expensive statement fingerprints."""
+    return query_metrics.snapshot(top)
+
+
+def release_db_connection(exception=None):
+    """Give the request's connection (if any) back to the pool."""
+    pooled = g.pop('db_conn', None)
+    if pooled is not None:
+        get_pool().release(pooled._connection)
+        if pooled.query_log is not None:
+            _finish_query_log(pooled.query_log)
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db_connection)
@@ -0,0 +1,181 @@
+# fragment_cache.py
+"""
+Cache for rendered page fragments that are the same for every visitor.
+
+Entries are keyed strings with a TTL and any number of tags. Writes that
+change what a fragment shows call `invalidate('concert:42')` or
+`invalidate('catalog')` and every entry carrying that tag is dropped at
+once; the TTL (FRAGMENT_CACHE_TTL by default) bounds how long other
+worker processes can keep serving the old fragment.
+
+Templates use the {% cache %} tag:
+
+    {% cache 'concert-header', concert_id, ttl=300, tags=['concert:%s' % concert_id] %}
+        ...
+    {% endcache %}
+
+The key parts are joined into the cache key, so never put per-user
+values inside a cached block unless they are part of the key. Views that
+also want to skip the queries behind a fragment use `fragment_cache.get`
+and `fragment_cache.set` directly.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+# Tag of every fragment that lists concerts (the index page)
+TAG_CATALOG = 'catalog'
+
+
+def concert_tag(concert_id):
+    return f'concert:{concert_id}'
+
+
+class FragmentCache:
+    """LRU of rendered fragments with per-entry TTL and tag invalidation."""
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # key -> (expires_at, tags, value)
+        self._tags = {}                 # tag -> set of keys
+        self._generations = {}          # tag -> times it was invalidated
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl, tags=()):
+        tags = frozenset(tags)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, tags, value)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, *tags):
+        """Drop every fragment carrying any of `tags`; returns how many went."""
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.pop(tag, set())
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def generation(self, tag):
+        """Bumped by every invalidate(tag): a cheap version of what the tag covers."""
+        with self._lock:
+            return self._generations.get(tag, 0)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _drop(self, key):
+        # Caller holds the lock
+        _, tags, _ = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'tags': len(self._tags),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+            }
+
+
+fragment_cache = FragmentCache()
+
+
+def make_key(*parts):
+    return ':'.join(str(part) for part in parts)
+
+
+def invalidate(*tags):
+    return fragment_cache.invalidate(*tags)
+
+
+def invalidate_concert(concert_id):
+    """Call after any write to a concert: its own fragments and the listings."""
+    return fragment_cache.invalidate(TAG_CATALOG, concert_tag(concert_id))
+
+
+def default_ttl():
+    return current_app.config.get('FRAGMENT_CACHE_TTL', 60)
+
+
+def enabled():
+    return current_app.config.get('FRAGMENT_CACHE_ENABLED', True)
+
+
+class FragmentCacheExtension(Extension):
+    """The {% cache key, parts..., ttl=..., tags=[...] %} ... {% endcache %} tag."""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        ttl = nodes.Const(None)
+        tags = nodes.List([])
+        while parser.stream.skip_if('comma'):
+            if parser.stream.current.type == 'name' and parser.stream.look().type == 'assign':
+                name = next(parser.stream).value
+                next(parser.stream)
+                if name == 'ttl':
+                    ttl = parser.parse_expression()
+                elif name == 'tags':
+                    tags = parser.parse_expression()
+                else:
+                    parser.fail(f"unknown cache option '{name}'", lineno)
+            else:
+                parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(parts), ttl, tags]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, ttl, tags, caller):
+        if not enabled():
+            return caller()
+        key = make_key('fragment', *parts)
+        value = fragment_cache.get(key)
+        if value is None:
+            value = caller()
+            fragment_cache.set(key, value, default_ttl() if ttl is None else ttl, tags)
+        return value
+
+
+def init_app(app):
+    fragment_cache.max_entries = int(app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 2000))
+    app.jinja_env.add_extension(FragmentCacheExtension)
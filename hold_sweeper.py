@@ -0,0 +1,124 @@
+# hold_sweeper.py
+"""
+Background release of abandoned ticket holds.
+
+initiate_payment puts a ticket on hold; if the buyer never finishes
+simulate_payment the seat would stay held forever. A daemon thread wakes
+every HOLD_SWEEP_INTERVAL seconds and releases holds older than
+HOLD_TTL_SECONDS, HOLD_SWEEP_BATCH tickets per UPDATE.
+"""
+import threading
+import time
+
+from db import get_db_connection
+from metrics import funnel, FUNNEL_HOLD_EXPIRED
+from seatmap import STATUS_AVAILABLE, STATUS_HELD, set_ticket_statuses
+
+
+def sweep_expired_holds(ttl_seconds, batch_size):
+    """
+    Release every hold older than `ttl_seconds`, one batch per transaction.
+
+    Must run inside an application context. Returns the number of tickets
+    released.
+    """
+    db = get_db_connection()
+    if not db:
+        return 0
+
+    freed = 0
+    cursor = None
+    try:
+        cursor = db.cursor()
+        while True:
+            # SKIP LOCKED lets several workers sweep without blocking buyers
+            cursor.execute("""
+                SELECT ticket_id FROM Tickets
+                WHERE status = %s AND held_at < NOW() - INTERVAL %s SECOND
+                ORDER BY held_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (STATUS_HELD, int(ttl_seconds), int(batch_size)))
+            ticket_ids = [row[0] for row in cursor.fetchall()]
+            if not ticket_ids:
+                break
+
+            placeholders = ', '.join(['%s'] * len(ticket_ids))
+            cursor.execute(f"""
+                UPDATE Tickets SET status = %s
+                WHERE ticket_id IN ({placeholders}) AND status = %s
+            """, (STATUS_AVAILABLE, *ticket_ids, STATUS_HELD))
+            db.commit()
+            freed += cursor.rowcount
+            funnel(FUNNEL_HOLD_EXPIRED, cursor.rowcount)
+
+            # Patches cached seat maps and wakes live seat streams
+            set_ticket_statuses({ticket_id: STATUS_AVAILABLE for ticket_id in ticket_ids})
+
+            if len(ticket_ids) < batch_size:
+                break
+    except Exception as e:
+        db.rollback()
+        print(f"Error sweeping expired holds: {e}")
+    finally:
+        if cursor:
+            cursor.close()
+        if db:
+            db.close()
+    return freed
+
+
+class HoldSweeper(threading.Thread):
+
+    def __init__(self, app):
+        super().__init__(name='hold-sweeper', daemon=True)
+        self.app = app
+        self.interval = float(app.config.get('HOLD_SWEEP_INTERVAL', 30))
+        self.ttl = int(app.config.get('HOLD_TTL_SECONDS', 600))
+        self.batch_size = int(app.config.get('HOLD_SWEEP_BATCH', 500))
+        self.stats = {'passes': 0, 'last_freed': 0, 'total_freed': 0, 'last_run': None}
+        self._stop_event = threading.Event()
+
+    def run_once(self):
+        with self.app.app_context():
+            freed = sweep_expired_holds(self.ttl, self.batch_size)
+        self.stats['passes'] += 1
+        self.stats['last_freed'] = freed
+        self.stats['total_freed'] += freed
+        self.stats['last_run'] = time.time()
+        if freed:
+            print(f"Hold sweeper released {freed} expired hold(s)")
+        return freed
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Hold sweeper pass failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_start_lock = threading.Lock()
+
+
+def init_app(app):
+    """
+    Start the sweeper with the first request the process serves, so the
+    debug reloader's parent process and one-off scripts never run one.
+    Disabled with HOLD_SWEEP_ENABLED = False.
+    """
+    if not app.config.get('HOLD_SWEEP_ENABLED', True):
+        return
+
+    @app.before_request
+    def _start_hold_sweeper():
+        if 'hold_sweeper' in app.extensions:
+            return
+        with _start_lock:
+            if 'hold_sweeper' not in app.extensions:
+                sweeper = HoldSweeper(app)
+                app.extensions['hold_sweeper'] = sweeper
+                sweeper.start()
@@ -0,0 +1,160 @@
+# http_cache.py
+"""
+Response compression and data-version ETags.
+
+Compression: an after_request hook gzips (or brotli-compresses, when the
+optional `brotli` package is installed) text responses the client accepts
+once they reach COMPRESS_MIN_SIZE bytes. Streamed responses such as the
+seat event stream are compressed chunk by chunk with a sync flush, so every
+event still reaches the browser as soon as it is yielded.
+
+Conditional GET: views decorated with `@conditional(version)` get a weak
+ETag built from the data the page is rendered from (the version token of the
+concert's seat map, a generation bumped on writes, ...) plus the
+user, the query string and the deployed templates/assets. When the browser's
+If-None-Match still matches, the view is never called and a bodiless 304
+goes back, so neither the queries nor the template run.
+"""
+import hashlib
+import os
+import zlib
+from functools import wraps
+
+from flask import current_app, g, make_response, message_flashed, request, session
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/event-stream',
+    'application/json', 'application/javascript', 'text/javascript', 'image/svg+xml',
+}
+
+
+def _gzip_stream(chunks, level):
+    """gzip an iterable of chunks, flushing after each one."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _compress(response):
+    config = current_app.config
+    if (response.direct_passthrough
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    accepted = request.accept_encodings
+    level = config.get('COMPRESS_LEVEL', 6)
+
+    if response.is_streamed:
+        if not accepted['gzip']:
+            return response
+        response.response = _gzip_stream(response.response, level)
+        response.headers.pop('Content-Length', None)
+        encoding = 'gzip'
+    else:
+        data = response.get_data()
+        if len(data) < config.get('COMPRESS_MIN_SIZE', 500):
+            return response
+        if brotli is not None and accepted['br']:
+            # Dynamic pages: a middle quality compresses well without costing much CPU
+            data, encoding = brotli.compress(data, quality=config.get('COMPRESS_BROTLI_QUALITY', 5)), 'br'
+        elif accepted['gzip']:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            data, encoding = compressor.compress(data) + compressor.flush(), 'gzip'
+        else:
+            return response
+        response.set_data(data)
+
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # A strong ETag names exact bytes, and these bytes are new
+        response.set_etag(f'{etag}-{encoding}')
+    return response
+
+
+def _release_token(app):
+    """Changes whenever templates or built assets change, so old ETags stop matching."""
+    digest = hashlib.sha1()
+    for root in (app.template_folder and os.path.join(app.root_path, app.template_folder),
+                 app.static_folder and os.path.join(app.static_folder, 'dist')):
+        if not root or not os.path.isdir(root):
+            continue
+        for directory, _, files in sorted(os.walk(root)):
+            for filename in sorted(files):
+                stat = os.stat(os.path.join(directory, filename))
+                digest.update(f'{filename}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    return digest.hexdigest()[:12]
+
+
+def _note_flash(sender, message, category, **extra):
+    g.flashed_message = True
+
+
+def _etag(data_version):
+    parts = (current_app.extensions.get('etag_release'), request.endpoint,
+             sorted(request.view_args.items()) if request.view_args else None,
+             request.query_string, session.get('user_id'), session.get('name'), session.get('role'),
+             data_version)
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+
+def conditional(version):
+    """
+    Answer GETs with 304 Not Modified while `version(**view_args)` is
+    unchanged, without calling the view. `version` returns any value with a
+    stable repr, or None to skip validation for this request.
+
+    Pages carrying a flash message are never validated: the message is
+    rendered once and must not be answered from the browser cache later.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if (request.method != 'GET' or session.get('_flashes')
+                    or not current_app.config.get('HTTP_ETAGS', True)):
+                return view(*args, **kwargs)
+            try:
+                data_version = version(*args, **kwargs)
+            except Exception as e:
+                print(f"Error computing data version for {request.endpoint}: {e}")
+                data_version = None
+            if data_version is None:
+                return view(*args, **kwargs)
+
+            etag = _etag(data_version)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or g.get('flashed_message'):
+                    return response
+            response.set_etag(etag, weak=True)
+            # Always revalidate; the 304 is cheap
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """Compression (COMPRESS_ENABLED) and the release part of every ETag."""
+    app.extensions['etag_release'] = _release_token(app)
+    message_flashed.connect(_note_flash, app)
+    if app.config.get('COMPRESS_ENABLED', True):
+        app.after_request(_compress)
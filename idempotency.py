@@ -0,0 +1,209 @@
+# idempotency.py
+"""
+Idempotency keys for the payment path.
+
+The payment form carries a one-time key. The first request with a key runs
+the view and records the outcome (redirect target and flashed messages).
+Repeats of the same key, from a double-submit or a retried callback, replay
+that outcome without touching the booking procedures.
+
+Keys live in a bounded in-process store with a TTL. With IDEMPOTENCY_USE_DB
+they are also written to the IdempotencyKeys table, so repeats that reach
+another worker process are caught too.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, flash, g, redirect, request, session, url_for
+from db import get_db_connection
+
+PENDING = 'pending'
+DONE = 'done'
+
+
+class IdempotencyStore:
+    """Thread-safe LRU of key -> (state, result, expires_at)."""
+
+    def __init__(self, max_entries=10000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """
+        Claim a key. Returns (None, None) if the caller should run the
+        request, otherwise (PENDING, None) or (DONE, result).
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                return entry[0], entry[1]
+            self._entries[key] = (PENDING, None, now + self.ttl)
+            self._entries.move_to_end(key)
+            self._evict(now)
+        return None, None
+
+    def complete(self, key, result):
+        with self._lock:
+            self._entries[key] = (DONE, result, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+
+    def forget(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _evict(self, now):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        # Entries are roughly in expiry order, so expired ones sit at the front
+        while self._entries:
+            oldest_key, entry = next(iter(self._entries.items()))
+            if entry[2] > now:
+                break
+            del self._entries[oldest_key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = IdempotencyStore(
+                    max_entries=int(current_app.config.get('IDEMPOTENCY_MAX_KEYS', 10000)),
+                    ttl=float(current_app.config.get('IDEMPOTENCY_TTL', 3600)),
+                )
+    return _store
+
+
+def _db_begin(key, user_id):
+    """Claim the key in MySQL; returns the same tuple as IdempotencyStore.begin."""
+    db = get_db_connection()
+    if not db:
+        return None, None
+    cursor = db.cursor()
+    try:
+        cursor.execute("""
+            DELETE FROM IdempotencyKeys
+            WHERE idem_key = %s AND created_at < NOW() - INTERVAL %s SECOND
+        """, (key, int(current_app.config.get('IDEMPOTENCY_TTL', 3600))))
+        cursor.execute("""
+            INSERT IGNORE INTO IdempotencyKeys (idem_key, user_id, status, created_at)
+            VALUES (%s, %s, %s, NOW())
+        """, (key, user_id, PENDING))
+        claimed = cursor.rowcount == 1
+        db.commit()
+        if claimed:
+            return None, None
+        cursor.execute("SELECT status, result FROM IdempotencyKeys WHERE idem_key = %s", (key,))
+        row = cursor.fetchone()
+        if not row:
+            return None, None
+        return row[0], json.loads(row[1]) if row[1] else None
+    finally:
+        cursor.close()
+
+
+def _db_finish(key, result):
+    db = get_db_connection()
+    if not db:
+        return
+    cursor = db.cursor()
+    try:
+        if result is None:
+            cursor.execute("DELETE FROM IdempotencyKeys WHERE idem_key = %s", (key,))
+        else:
+            cursor.execute("""
+                UPDATE IdempotencyKeys SET status = %s, result = %s WHERE idem_key = %s
+            """, (DONE, json.dumps(result), key))
+        db.commit()
+    finally:
+        cursor.close()
+
+
+def mark_retryable():
+    """Tell @idempotent not to record this outcome, e.g. the database was down."""
+    g.idempotency_retryable = True
+
+
+def _replay(result):
+    for category, message in result.get('flashes', []):
+        flash(message, category)
+    return redirect(result['location'])
+
+
+def idempotent(view):
+    """
+    Replay the recorded outcome when a request repeats an idempotency key.
+
+    The key comes from the `Idempotency-Key` header or the `idempotency_key`
+    form field and is scoped to the logged-in user. Requests without a key
+    run normally.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user_id = session.get('user_id')
+        client_key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+        if not user_id or not client_key:
+            return view(*args, **kwargs)
+
+        key = f"{user_id}:{client_key[:64]}"
+        use_db = current_app.config.get('IDEMPOTENCY_USE_DB', False)
+        store = get_store()
+
+        state, result = store.begin(key)
+        if state is None and use_db:
+            try:
+                state, result = _db_begin(key, user_id)
+            except Exception as e:
+                print(f"Error checking idempotency key: {e}")
+            if state is not None:
+                store.forget(key)
+
+        if state == DONE and result:
+            return _replay(result)
+        if state == PENDING:
+            flash('Your payment is already being processed.', 'info')
+            return redirect(url_for('profile.profile'))
+
+        flashes_before = len(session.get('_flashes', []))
+        try:
+            response = view(*args, **kwargs)
+        except Exception:
+            store.forget(key)
+            if use_db:
+                try:
+                    _db_finish(key, None)
+                except Exception as e:
+                    # Report the view's exception, not this one
+                    print(f"Error releasing idempotency key: {e}")
+            raise
+
+        if g.pop('idempotency_retryable', False) or not response.location:
+            store.forget(key)
+            result = None
+        else:
+            result = {
+                'location': response.location,
+                'flashes': [list(f) for f in session.get('_flashes', [])[flashes_before:]],
+            }
+            store.complete(key, result)
+        if use_db:
+            try:
+                _db_finish(key, result)
+            except Exception as e:
+                print(f"Error recording idempotency key: {e}")
+        return response
+
+    return wrapper
@@ -0,0 +1,299 @@
+# metrics.py
+"""
+Prometheus-format metrics for the app, served at /metrics.
+
+Every thread records into its own shard (a plain dict reached through
+threading.local), so observing a request or a funnel event takes no lock.
+A scrape walks the shards and adds them up; the only lock is the one
+taken the first time a thread registers its shard and when it exits and
+its counts are folded into the process total.
+
+Request counts and latency histograms are labelled by endpoint (the
+blueprint-qualified view name), never by raw path, to keep the number of
+series bounded. Pool gauges and query totals are read from db.py at
+scrape time.
+"""
+import threading
+import time
+import weakref
+
+from flask import Blueprint, Response, abort, current_app, g, request
+
+metrics_bp = Blueprint('metrics', __name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+FUNNEL_HOLD = 'hold'
+FUNNEL_HOLD_CONFLICT = 'hold_conflict'
+FUNNEL_HOLD_ERROR = 'hold_error'
+FUNNEL_CONFIRMATION = 'confirmation'
+FUNNEL_CANCELLATION = 'cancellation'
+FUNNEL_HOLD_EXPIRED = 'hold_expired'
+
+
+class _Shards:
+    """
+    One dict per thread; values() iterates over all of them.
+
+    When a thread exits, its thread-local storage is released and a
+    finalizer folds the thread's shard into `_retired`, so short-lived
+    request threads do not leave a shard behind each.
+    """
+
+    def __init__(self, merge):
+        self._local = threading.local()
+        self._live = {}        # id(owner token) -> shard of a running thread
+        self._retired = {}     # everything recorded by threads that have exited
+        self._merge = merge
+        self._lock = threading.Lock()
+
+    def mine(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = {}
+            # Only the thread-local holds the token, so it dies with the thread
+            token = self._local.token = _ShardOwner()
+            with self._lock:
+                self._live[id(token)] = shard
+            weakref.finalize(token, self._retire, id(token))
+            self._local.shard = shard
+        return shard
+
+    def _retire(self, key):
+        with self._lock:
+            shard = self._live.pop(key, None)
+            if shard:
+                self._merge(self._retired, shard)
+
+    def values(self):
+        with self._lock:
+            shards = list(self._live.values())
+            retired = dict(self._retired)
+        yield retired
+        for shard in shards:
+            # The owning thread may add a key while we copy; just try again
+            while True:
+                try:
+                    yield dict(shard)
+                    break
+                except RuntimeError:
+                    continue
+
+
+class _ShardOwner:
+    """Weak-referenceable token kept in a thread's local storage."""
+    __slots__ = ('__weakref__',)
+
+
+def _merge_counts(totals, shard):
+    for key, value in shard.items():
+        totals[key] = totals.get(key, 0) + value
+
+
+def _merge_series(totals, shard):
+    for key, series in shard.items():
+        total = totals.get(key)
+        if total is None:
+            totals[key] = list(series)
+        else:
+            for i, value in enumerate(series):
+                total[i] += value
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._shards = _Shards(_merge_counts)
+
+    def inc(self, *labelvalues, amount=1):
+        shard = self._shards.mine()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    def collect(self):
+        totals = {}
+        for shard in self._shards.values():
+            _merge_counts(totals, shard)
+        return totals
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key, value in sorted(self.collect().items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, key)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._shards = _Shards(_merge_series)
+
+    def observe(self, value, *labelvalues):
+        shard = self._shards.mine()
+        series = shard.get(labelvalues)
+        if series is None:
+            # Per-bucket (non-cumulative) counts, then sum and count
+            series = shard[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        else:
+            series[len(self.buckets)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def collect(self):
+        totals = {}
+        for shard in self._shards.values():
+            _merge_series(totals, shard)
+        return totals
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, series in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, [le])} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {series[-1]}')
+        return lines
+
+
+def _gauge_lines(name, help_text, samples, kind='gauge'):
+    """samples: [(labels dict, value)]"""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        lines.append(f'{name}{_labels(labels.keys(), labels.values())} {_number(value)}')
+    return lines
+
+
+requests_total = Counter(
+    'concerto_http_requests_total', 'HTTP requests by endpoint, method and status code.',
+    ('endpoint', 'blueprint', 'method', 'status'))
+request_errors_total = Counter(
+    'concerto_http_request_errors_total', 'HTTP requests that ended in a 5xx or an exception.',
+    ('endpoint', 'blueprint'))
+request_duration = Histogram(
+    'concerto_http_request_duration_seconds', 'Time to produce the response, by endpoint.',
+    ('endpoint', 'blueprint'))
+db_checkout_duration = Histogram(
+    'concerto_db_pool_checkout_seconds', 'Time spent borrowing a connection from the pool.',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+funnel_events_total = Counter(
+    'concerto_booking_funnel_events_total',
+    'Booking funnel events in tickets: hold, hold_conflict, hold_error, confirmation, cancellation, hold_expired.',
+    ('event',))
+
+
+def funnel(event, tickets=1):
+    """Count a booking funnel event for `tickets` seats."""
+    funnel_events_total.inc(event, amount=tickets)
+
+
+def _route_labels():
+    endpoint = request.endpoint or 'unmatched'
+    return endpoint, request.blueprint or ''
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _record_response(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        endpoint, blueprint = _route_labels()
+        request_duration.observe(time.perf_counter() - started, endpoint, blueprint)
+        requests_total.inc(endpoint, blueprint, request.method, str(response.status_code))
+        if response.status_code >= 500:
+            request_errors_total.inc(endpoint, blueprint)
+    return response
+
+
+def _record_exception(exception=None):
+    # after_request does not run when the view raised
+    started = g.pop('metrics_started', None)
+    if started is not None and exception is not None:
+        endpoint, blueprint = _route_labels()
+        request_duration.observe(time.perf_counter() - started, endpoint, blueprint)
+        requests_total.inc(endpoint, blueprint, request.method, '500')
+        request_errors_total.inc(endpoint, blueprint)
+
+
+def _db_lines():
+    from db import get_pool_stats, get_query_stats
+
+    lines = []
+    pool = get_pool_stats()
+    if pool:
+        for key, help_text in (('open', 'Connections currently open.'),
+                               ('idle', 'Open connections waiting in the pool.'),
+                               ('in_use', 'Connections checked out by requests.')):
+            lines += _gauge_lines(f'concerto_db_pool_{key}', help_text, [({}, pool[key])])
+        for key, help_text in (('checkouts', 'Connections borrowed from the pool.'),
+                               ('waits', 'Checkouts that had to wait for a free connection.'),
+                               ('timeouts', 'Checkouts that gave up waiting.'),
+                               ('discarded', 'Pooled connections dropped after a failed ping.')):
+            lines += _gauge_lines(f'concerto_db_pool_{key}_total', help_text, [({}, pool[key])], 'counter')
+        lines += _gauge_lines('concerto_db_pool_wait_seconds_total', 'Time spent waiting for a free connection.',
+                              [({}, pool['wait_time_total'])], 'counter')
+    lines += db_checkout_duration.render()
+
+    routes = get_query_stats(top=0)['routes']
+    lines += _gauge_lines('concerto_db_queries_total', 'SQL statements run, by route.',
+                          [({'endpoint': route}, r['queries']) for route, r in sorted(routes.items())],
+                          'counter')
+    lines += _gauge_lines('concerto_db_query_seconds_total', 'Time spent in SQL statements, by route.',
+                          [({'endpoint': route}, r['db_seconds']) for route, r in sorted(routes.items())],
+                          'counter')
+    return lines
+
+
+def render_metrics():
+    lines = []
+    for metric in (requests_total, request_errors_total, request_duration, funnel_events_total):
+        lines += metric.render()
+    lines += _db_lines()
+    return '\n'.join(lines) + '\n'
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app):
+    """Time every request and register /metrics. Off with METRICS_ENABLED = False."""
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    app.before_request(_start_timer)
+    app.after_request(_record_response)
+    app.teardown_request(_record_exception)
+    app.register_blueprint(metrics_bp)
@@ -0,0 +1,22 @@
+# pagination.py
+"""
+Keyset pagination cursors.
+
+A cursor is the sort key of the last row of a page plus its id, as
+'<iso datetime>_<id>'. The next page seeks past that position instead of
+using OFFSET, so every page costs the same no matter how deep it is.
+"""
+from datetime import datetime
+
+
+def encode_cursor(sort_value, row_id):
+    return f"{sort_value.isoformat()}_{row_id}"
+
+
+def decode_cursor(value):
+    """(datetime, id) from a cursor string, or None if it is missing or malformed"""
+    try:
+        sort_part, id_part = value.rsplit('_', 1)
+        return datetime.fromisoformat(sort_part), int(id_part)
+    except (AttributeError, ValueError):
+        return None
@@ -1,36 +1,199 @@
-from flask import Blueprint, render_template, session, flash, redirect, url_for, request
+import uuid
+from decimal import Decimal, InvalidOperation
+from flask import Blueprint, render_template, session, flash, redirect, url_for, request, current_app
 from db import get_db_connection
+from seatmap import sync_tickets, set_ticket_statuses, STATUS_AVAILABLE, STATUS_HELD, STATUS_SOLD
+from book import parse_ticket_ids
+from idempotency import idempotent, mark_retryable
+from metrics import (funnel, FUNNEL_CANCELLATION, FUNNEL_CONFIRMATION, FUNNEL_HOLD,
+                     FUNNEL_HOLD_CONFLICT, FUNNEL_HOLD_ERROR)
+from waiting_room import guard_tickets
 
 payment_bp = Blueprint('payment', __name__)
 
+@payment_bp.before_request
+def waiting_room_gate():
+    """
+    Only visitors admitted from the waiting room may hold seats. Paying for
+    seats already held is never gated: the admission may expire mid-checkout
+    and the hold itself is the proof the buyer got through.
+    """
+    if not session.get('user_id') or request.endpoint != 'payment.initiate_payment':
+        return None
+    return guard_tickets(parse_ticket_ids(request.form.getlist('ticket_id')))
+
+def finalize_booking(cursor, user_id, ticket_id, amount, payment_method, payment_success):
+    """
+    Create the booking and confirm or cancel it in one stored procedure call.
+
+    The OUT booking id comes straight back from callproc; the caller commits.
+    """
+    result = cursor.callproc('finalize_booking',
+                             (user_id, ticket_id, amount, payment_method, payment_success, 0))
+    return result[5]
+
+def is_hold_refused(error):
+    """
+    True when hold_ticket refused the seat (the procedure SIGNALs a
+    user-defined error, SQLSTATE 45000, when it is not available), as
+    opposed to a database or connection failure.
+    """
+    return getattr(error, 'sqlstate', None) == '45000' or getattr(error, 'errno', None) == 1644
+
+def _in_clause(ticket_ids):
+    return ', '.join(['%s'] * len(ticket_ids))
+
+def hold_ticket_group(cursor, user_id, ticket_ids):
+    """
+    Hold all tickets of a multi-seat order with one conditional UPDATE.
+
+    Returns False if any seat was no longer available; the caller must then
+    roll back so that none of them stay held.
+    """
+    cursor.execute(f"""
+        UPDATE Tickets SET status = %s, held_by = %s
+        WHERE ticket_id IN ({_in_clause(ticket_ids)}) AND status = %s
+    """, (STATUS_HELD, user_id, *ticket_ids, STATUS_AVAILABLE))
+    return cursor.rowcount == len(ticket_ids)
+
+class AmountMismatch(Exception):
+    """The amount paid is not the order total; `total` is what it should be."""
+
+    def __init__(self, total):
+        super().__init__(f"amount does not match order total {total}")
+        self.total = total
+
+def _parse_amount(value):
+    try:
+        return Decimal(str(value).strip())
+    except (InvalidOperation, TypeError):
+        return None
+
+def check_ticket_amount(cursor, user_id, ticket_id, amount):
+    """
+    Lock a single held seat and check the gateway's `amount` against its
+    price, raising AmountMismatch if they differ. Returns the price to
+    record, or the `amount` unchanged if the seat is not held by this user
+    (the hold was lost, or made before holds recorded their buyer), in
+    which case finalize_booking has the last word as before.
+    """
+    cursor.execute("""
+        SELECT price FROM Tickets
+        WHERE ticket_id = %s AND status = %s AND held_by = %s
+        FOR UPDATE
+    """, (ticket_id, STATUS_HELD, user_id))
+    row = cursor.fetchone()
+    if row is None:
+        return amount
+    price = Decimal(str(row[0]))
+    if _parse_amount(amount) != price:
+        raise AmountMismatch(price)
+    return price
+
+def purchase_ticket_group(cursor, user_id, ticket_ids, amount, payment_method):
+    """
+    Sell a held multi-seat order: one payment row, one booking per seat.
+
+    The payment is recorded at the seats' total price, summed in MySQL;
+    raises AmountMismatch if the `amount` the gateway reports differs.
+    Runs a fixed number of statements whatever the group size; the caller
+    commits. Returns the payment id, or None if the holds were lost.
+    """
+    cursor.execute(f"""
+        SELECT ticket_id, price FROM Tickets
+        WHERE ticket_id IN ({_in_clause(ticket_ids)}) AND status = %s AND held_by = %s
+        FOR UPDATE
+    """, (*ticket_ids, STATUS_HELD, user_id))
+    held = cursor.fetchall()
+    if len(held) != len(ticket_ids):
+        return None
+    total = sum(Decimal(str(price)) for _, price in held)
+    if _parse_amount(amount) != total:
+        raise AmountMismatch(total)
+
+    # The rows are locked above, so this sums the prices just checked
+    cursor.execute(f"""
+        INSERT INTO Payments (user_id, amount, payment_method, status, payment_time)
+        SELECT %s, SUM(price), %s, 'completed', NOW()
+        FROM Tickets
+        WHERE ticket_id IN ({_in_clause(ticket_ids)}) AND status = %s AND held_by = %s
+    """, (user_id, payment_method, *ticket_ids, STATUS_HELD, user_id))
+    payment_id = cursor.lastrowid
+
+    cursor.execute(f"""
+        INSERT INTO Bookings (user_id, ticket_id, payment_id, status, booking_time)
+        SELECT %s, ticket_id, %s, 'confirmed', NOW()
+        FROM Tickets WHERE ticket_id IN ({_in_clause(ticket_ids)})
+    """, (user_id, payment_id, *ticket_ids))
+
+    cursor.execute(f"""
+        UPDATE Tickets SET status = %s WHERE ticket_id IN ({_in_clause(ticket_ids)})
+    """, (STATUS_SOLD, *ticket_ids))
+    return payment_id
+
+def release_ticket_group(cursor, user_id, ticket_ids):
+    """Give back the seats of a multi-seat order whose payment failed."""
+    cursor.execute(f"""
+        UPDATE Tickets SET status = %s
+        WHERE ticket_id IN ({_in_clause(ticket_ids)}) AND status = %s AND held_by = %s
+    """, (STATUS_AVAILABLE, *ticket_ids, STATUS_HELD, user_id))
+    return cursor.rowcount
+
 @payment_bp.route('/initiate_payment', methods=['POST'])
 def initiate_payment():
     user_id = session.get('user_id')
-    ticket_id = request.form.get('ticket_id')
+    ticket_ids = parse_ticket_ids(request.form.getlist('ticket_id'))
 
     if not user_id:
         flash('You need to log in first!', 'error')
         return redirect(url_for('auth.login'))
 
+    if not ticket_ids or len(ticket_ids) > current_app.config.get('CART_MAX_TICKETS', 10):
+        flash('Invalid seat selection!', 'error')
+        return redirect(url_for('index'))
+
     db = get_db_connection()
     if not db:
         flash('Database connection failed!', 'error')
         return redirect(url_for('index'))
     try:
         cursor = db.cursor()
-        # Call stored procedure to hold the ticket
-        cursor.callproc('hold_ticket', (user_id, ticket_id))
-        db.commit()
-
-        flash('Ticket temporarily held. Proceed to payment.', 'info')
+        if len(ticket_ids) == 1:
+            # Call stored procedure to hold the ticket
+            cursor.callproc('hold_ticket', (user_id, ticket_ids[0]))
+            # hold_ticket predates held_by; record the buyer as group holds do
+            cursor.execute("""
+                UPDATE Tickets SET held_by = %s
+                WHERE ticket_id = %s AND status = %s AND held_by IS NULL
+            """, (user_id, ticket_ids[0], STATUS_HELD))
+            db.commit()
+            sync_tickets(cursor, ticket_ids)
+            funnel(FUNNEL_HOLD)
+            flash('Ticket temporarily held. Proceed to payment.', 'info')
+        else:
+            # All seats or none: a partial group is never left on hold
+            if not hold_ticket_group(cursor, user_id, ticket_ids):
+                db.rollback()
+                funnel(FUNNEL_HOLD_CONFLICT, len(ticket_ids))
+                flash('Some of the selected seats were just taken. Please choose again.', 'error')
+                return redirect(url_for('index'))
+            db.commit()
+            set_ticket_statuses({ticket_id: STATUS_HELD for ticket_id in ticket_ids})
+            funnel(FUNNEL_HOLD, len(ticket_ids))
+            flash(f'{len(ticket_ids)} tickets temporarily held. Proceed to payment.', 'info')
         
         # Redirect user to payment page
-        return redirect(url_for('payment.simulate_payment', ticket_id=ticket_id))
+        return redirect(url_for('payment.simulate_payment', ticket_id=ticket_ids))
 
     except Exception as e:
         db.rollback()
-        print(f"Error during hold_ticket: {e}")
-        flash('Could not hold ticket. It may already be reserved.', 'error')
+        if is_hold_refused(e):
+            funnel(FUNNEL_HOLD_CONFLICT, len(ticket_ids))
+            flash('Could not hold ticket. It may already be reserved.', 'error')
+        else:
+            funnel(FUNNEL_HOLD_ERROR, len(ticket_ids))
+            print(f"Error during hold_ticket: {e}")
+            flash('Could not hold ticket right now. Please try again.', 'error')
         return redirect(url_for('index'))
 
     finally:
@@ -40,10 +203,12 @@ def initiate_payment():
             db.close()
 
 @payment_bp.route('/payment_gateway', methods=['POST',])
+@idempotent
 def payment_gateway():
     
     user_id = session.get('user_id')
-    ticket_id = request.form.get('ticket_id')
+    ticket_ids = parse_ticket_ids(request.form.getlist('ticket_id'))
+    ticket_id = ticket_ids[0] if ticket_ids else None
     payment_method = request.form.get('payment_method')
     payment_status = request.form.get('payment_status')  # e.g., 'success' or 'failed'
     amount = request.form.get('amount')
@@ -53,47 +218,99 @@ def payment_gateway():
         flash('You need to log in first!', 'error')
         return redirect(url_for('auth.login'))
 
+    if not ticket_ids:
+        flash('No ticket to pay for!', 'error')
+        return redirect(url_for('index'))
+
+    if len(ticket_ids) > 1:
+        return _pay_for_ticket_group(user_id, ticket_ids, amount, payment_method, payment_status)
+
     db = get_db_connection()
     if not db:
+        mark_retryable()
         flash('Database connection error!', 'error')
         return redirect(url_for('index'))
 
     try:
         cursor = db.cursor()
+        if payment_status == 'success':
+            amount = check_ticket_amount(cursor, user_id, ticket_id, amount)
 
-        cursor.callproc('create_booking', (user_id, ticket_id, amount, payment_method))
-
+        booking_id = finalize_booking(cursor, user_id, ticket_id, amount,
+                                      payment_method, payment_status == 'success')
         db.commit()
 
-
         if payment_status == 'success':
+            funnel(FUNNEL_CONFIRMATION)
+            flash('Payment successful! Your booking is confirmed.', 'success')
+        else:
+            # Payment failed — the reservation was cancelled
+            funnel(FUNNEL_CANCELLATION)
+            flash('Payment failed. Ticket released.', 'error')
 
-            # Call confirm_booking stored procedure
-            cursor.execute("SET @p_user_id = %s, @p_ticket_id = %s;", (user_id, ticket_id))
-            cursor.execute("CALL complete_booking(@p_user_id, @p_ticket_id, @p_booking_id);")
-            cursor.execute("SELECT @p_booking_id;")
-            booking_id = cursor.fetchone()[0]
+        sync_tickets(cursor, [ticket_id])
+        return redirect(url_for('book.ticket_details', booking_id=booking_id))
 
-            db.commit()
+    except AmountMismatch as e:
+        # The seat stays held, so the buyer can pay the right amount
+        db.rollback()
+        flash(f'The amount paid does not match the ticket price of ₹{e.total}.', 'error')
+        return redirect(url_for('payment.simulate_payment', ticket_id=ticket_ids))
 
-            flash('Payment successful! Your booking is confirmed.', 'success')
-        else:
+    except Exception as e:
+        db.rollback()
+        mark_retryable()
+        print(f"Error during payment_gateway: {e}")
+        flash('An error occurred while confirming payment.', 'error')
+        return redirect(url_for('index'))
 
-            # Payment failed — rollback the reservation
-            cursor.execute("SET @u=%s, @t=%s;", (user_id, ticket_id))
-            cursor.execute("CALL cancel_booking(@u, @t, @b);")
-            cursor.execute("SELECT @b;")
-            booking_id = cursor.fetchone()[0]
+    finally:
+        if cursor:
+            cursor.close()
+        if db:
+            db.close()
 
+
+def _pay_for_ticket_group(user_id, ticket_ids, amount, payment_method, payment_status):
+    """payment_gateway for multi-seat orders: a single transaction and commit"""
+    db = get_db_connection()
+    if not db:
+        mark_retryable()
+        flash('Database connection error!', 'error')
+        return redirect(url_for('index'))
+
+    cursor = None
+    try:
+        cursor = db.cursor()
+        if payment_status == 'success':
+            payment_id = purchase_ticket_group(cursor, user_id, ticket_ids, amount, payment_method)
+            if payment_id is None:
+                db.rollback()
+                flash('Your hold on these seats has expired. Please book again.', 'error')
+                return redirect(url_for('index'))
             db.commit()
-            
-            flash('Payment failed. Ticket released.', 'error')
+            set_ticket_statuses({ticket_id: STATUS_SOLD for ticket_id in ticket_ids})
+            funnel(FUNNEL_CONFIRMATION, len(ticket_ids))
+            flash(f'Payment successful! {len(ticket_ids)} seats are confirmed.', 'success')
+        else:
+            release_ticket_group(cursor, user_id, ticket_ids)
+            db.commit()
+            set_ticket_statuses({ticket_id: STATUS_AVAILABLE for ticket_id in ticket_ids})
+            funnel(FUNNEL_CANCELLATION, len(ticket_ids))
+            flash('Payment failed. Tickets released.', 'error')
 
-        return redirect(url_for('book.ticket_details', booking_id=booking_id))
+        return redirect(url_for('profile.profile'))
+
+    except AmountMismatch as e:
+        # The seats stay held, so the buyer can pay the right amount
+        db.rollback()
+        flash(f'The amount paid does not match the order total of ₹{e.total}.', 'error')
+        return redirect(url_for('payment.simulate_payment', ticket_id=ticket_ids))
 
     except Exception as e:
         db.rollback()
-        print(f"Error during payment_gateway: {e}")
+        mark_retryable()
+        print(f"Error during group payment: {e}")
         flash('An error occurred while confirming payment.', 'error')
         return redirect(url_for('index'))
 
@@ -106,7 +323,7 @@ def payment_gateway():
 
 @payment_bp.route('/simulate_payment', methods=['GET', 'POST'])
 def simulate_payment():
-    ticket_id = request.args.get('ticket_id')  # passed in URL
+    ticket_ids = parse_ticket_ids(request.args.getlist('ticket_id'))  # passed in URL
     user_id = session.get('user_id')
 
     if not user_id:
@@ -120,9 +337,13 @@ def simulate_payment():
 
         # Redirect to your existing /payment_gateway route
         return redirect(url_for('payment.payment_gateway',
-                                ticket_id=ticket_id,
+                                ticket_id=ticket_ids,
                                 payment_method=payment_method,
                                 status=payment_status,
                                 amount=amount))
 
-    return render_template('simulate_payment.html', ticket_id=ticket_id)
+    return render_template('simulate_payment.html',
+                           ticket_id=ticket_ids[0] if ticket_ids else None,
+                           ticket_ids=ticket_ids,
+                           # Lets payment_gateway recognise a resubmitted form
+                           idempotency_key=uuid.uuid4().hex)
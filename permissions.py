@@ -0,0 +1,100 @@
+# permissions.py
+"""
+Role checks without a query per request.
+
+A user's role is looked up at most once per request (memoised on flask.g)
+and is shared across requests through a small user_id -> role cache that
+expires after ROLE_CACHE_TTL seconds. Code that changes a role calls
+invalidate_role() after committing; other worker processes see the change
+once their cached entry expires.
+"""
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, flash, g, jsonify, redirect, session, url_for
+from db import get_db_connection
+
+_roles = {}   # user_id -> (role, expires_at)
+_roles_lock = threading.Lock()
+
+
+def _load_role(user_id):
+    db = get_db_connection()
+    if not db:
+        return None
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT role FROM Users WHERE user_id = %s", (user_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        cursor.close()
+
+
+def get_role(user_id=None):
+    """
+    Role of `user_id` (default: the logged-in user), or None if there is
+    no such user or it could not be looked up.
+    """
+    if user_id is None:
+        user_id = session.get('user_id')
+    if not user_id:
+        return None
+
+    request_roles = g.setdefault('user_roles', {})
+    if user_id in request_roles:
+        return request_roles[user_id]
+
+    now = time.monotonic()
+    with _roles_lock:
+        cached = _roles.get(user_id)
+    if cached is not None and cached[1] > now:
+        role = cached[0]
+    else:
+        try:
+            role = _load_role(user_id)
+        except Exception as e:
+            print(f"Error loading role for user {user_id}: {e}")
+            return None
+        if role is not None:
+            with _roles_lock:
+                _roles[user_id] = (role, now + current_app.config.get('ROLE_CACHE_TTL', 30))
+
+    request_roles[user_id] = role
+    # Keep the role shown in the navigation in step, e.g. after approval
+    if user_id == session.get('user_id') and role is not None and session.get('role') != role:
+        session['role'] = role
+    return role
+
+
+def invalidate_role(user_id):
+    with _roles_lock:
+        _roles.pop(user_id, None)
+    if 'user_roles' in g:
+        g.user_roles.pop(user_id, None)
+
+
+def role_required(*roles, api=False, message='Access denied! You do not have permission to view that page.'):
+    """
+    Only let logged-in users with one of `roles` into the view.
+
+    Others are sent to the login page or their profile with a flash
+    message, or get a JSON 401/403 when `api` is set.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not session.get('user_id'):
+                if api:
+                    return jsonify({'error': 'Login required'}), 401
+                flash('You need to log in first!', 'error')
+                return redirect(url_for('auth.login'))
+            if get_role() not in roles:
+                if api:
+                    return jsonify({'error': message}), 403
+                flash(message, 'error')
+                return redirect(url_for('profile.profile'))
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,5 +1,6 @@
-from flask import Flask, session, render_template, Blueprint, flash, redirect, url_for, request
+from flask import Flask, session, render_template, Blueprint, flash, redirect, url_for, request, current_app
 from db import get_db_connection
+from pagination import decode_cursor, encode_cursor
 
 profile_bp = Blueprint('profile', __name__)
 
@@ -21,6 +22,9 @@ def profile():
     user_role = 'customer'
     artist_genre = None
     cursor = None
+    next_cursor = None
+    page_size = current_app.config.get('PROFILE_PAGE_SIZE', 10)
+    after = decode_cursor(request.args.get('after'))
     
     try:
         cursor = db.cursor()
@@ -44,16 +48,19 @@ def profile():
             if artist_data:
                 artist_genre = artist_data[0]
             
-            # Get artist's concerts
+            # Get artist's concerts; ticket counters are kept up to date by
+            # triggers on Tickets, so only each concert's few counter slots
+            # are summed here, never its Tickets
             cursor.execute("""
                 SELECT c.concert_id, c.title, c.date_time, v.venue_name, v.location,
-                       COUNT(DISTINCT t.ticket_id) as total_tickets
+                       COALESCE(SUM(s.total_tickets), 0), COALESCE(SUM(s.held_tickets), 0),
+                       COALESCE(SUM(s.sold_tickets), 0), COALESCE(SUM(s.revenue), 0), c.published
                 FROM Concerts c
                 JOIN Artists a ON c.artist_id = a.artist_id
                 JOIN Venues v ON c.venue_id = v.venue_id
-                LEFT JOIN Tickets t ON c.concert_id = t.concert_id
+                LEFT JOIN ConcertTicketStats s ON c.concert_id = s.concert_id
                 WHERE a.user_id = %s
-                GROUP BY c.concert_id, c.title, c.date_time, v.venue_name, v.location
+                GROUP BY c.concert_id, c.title, c.date_time, v.venue_name, v.location, c.published
                 ORDER BY c.date_time DESC
             """, (user_id,))
             concerts = cursor.fetchall()
@@ -64,23 +71,39 @@ def profile():
                 'date_time': c[2],
                 'venue_name': c[3],
                 'location': c[4],
-                'total_tickets': c[5]
+                'total_tickets': c[5],
+                'held_tickets': c[6],
+                'sold_tickets': c[7],
+                'revenue': c[8],
+                'published': bool(c[9])
             } for c in concerts]
         
-        # Get bookings (for all users)
-        cursor.execute("""
+        # Get one page of bookings (for all users), newest first. The page is
+        # found on the (user_id, booking_time, booking_id) index before the
+        # other tables are joined.
+        keyset = ""
+        params = [user_id]
+        if after:
+            keyset = "AND (b.booking_time < %s OR (b.booking_time = %s AND b.booking_id < %s))"
+            params.extend([after[0], after[0], after[1]])
+        cursor.execute(f"""
             SELECT c.title, a.artist_name, v.venue_name, v.location,
-                   c.date_time, s.row_no, s.seat_no, t.price, b.status, b.booking_id
+                   c.date_time, s.row_no, s.seat_no, t.price, b.status, b.booking_id,
+                   b.booking_time
             FROM Bookings b
             JOIN Tickets t ON b.ticket_id = t.ticket_id
             JOIN Seats s ON t.seat_id = s.seat_id
             JOIN Concerts c ON t.concert_id = c.concert_id
             JOIN Artists a ON c.artist_id = a.artist_id
             JOIN Venues v ON c.venue_id = v.venue_id
-            WHERE b.user_id = %s 
-            ORDER BY b.booking_time DESC
-        """, (user_id,))
+            WHERE b.user_id = %s {keyset}
+            ORDER BY b.booking_time DESC, b.booking_id DESC
+            LIMIT %s
+        """, (*params, page_size + 1))
         bookings_data = cursor.fetchall()
+        if len(bookings_data) > page_size:
+            bookings_data = bookings_data[:page_size]
+            next_cursor = encode_cursor(bookings_data[-1][10], bookings_data[-1][9])
         
         bookings = [{
             'concert_name': b[0],
@@ -116,7 +139,9 @@ def profile():
                           user_role=user_role,
                           artist_genre=artist_genre,
                           artist_concerts=artist_concerts,
-                          bookings=bookings)
+                          bookings=bookings,
+                          next_cursor=next_cursor,
+                          is_first_page=after is None)
 
 @profile_bp.route('/edit_profile', methods=['GET', 'POST'])
 def edit_profile():
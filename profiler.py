@@ -0,0 +1,159 @@
+# profiler.py
+"""
+On-demand sampling profiler for single requests.
+
+A request is profiled when an admin sends `X-Profile: 1`, or for one in
+every PROFILER_SAMPLE_RATE requests. While it runs, a sampler thread reads
+the request thread's Python stack every PROFILER_INTERVAL_MS and counts
+identical stacks. When the request finishes two files are written to
+PROFILER_DIR:
+
+  <name>.collapsed  one "frame;frame;frame count" line per stack, the input
+                    format of flamegraph.pl and speedscope
+  <name>.json       route, wall time, sample count and the split between
+                    SQL, Jinja rendering and other Python
+
+Each stack is rooted at its category (sql, jinja or python) so the flame
+graph shows the split as well. Nothing is registered unless
+PROFILER_ENABLED is set, so a disabled profiler costs nothing.
+"""
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, request
+
+CATEGORY_SQL = 'sql'
+CATEGORY_JINJA = 'jinja'
+CATEGORY_PYTHON = 'python'
+
+# Path fragments that put a frame in the SQL or Jinja bucket
+_SQL_PATHS = (os.sep + 'mysql' + os.sep,)
+_JINJA_PATHS = (os.sep + 'jinja2' + os.sep, '<template>')
+# Our own cursor wrapper counts as SQL even if the driver is a C extension
+_SQL_FUNCTIONS = {('db.py', 'execute'), ('db.py', 'executemany'), ('db.py', 'callproc')}
+
+_request_counter = itertools.count(1)
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _classify(codes):
+    """Category of a stack given innermost frame first: SQL wins over Jinja."""
+    category = CATEGORY_PYTHON
+    for code in codes:
+        filename = code.co_filename
+        if (os.path.basename(filename), code.co_name) in _SQL_FUNCTIONS \
+                or any(path in filename for path in _SQL_PATHS):
+            return CATEGORY_SQL
+        if any(path in filename for path in _JINJA_PATHS):
+            category = CATEGORY_JINJA
+    return category
+
+
+class RequestSampler(threading.Thread):
+    """Samples one thread's stack until stopped."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='request-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.categories = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            category = _classify(codes)
+            self.categories[category] += 1
+            self.stacks[(category,) + tuple(_frame_label(code) for code in reversed(codes))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1)
+
+
+def _should_profile():
+    if request.headers.get('X-Profile') == '1':
+        # Imported here so the role cache is only touched for requests that ask
+        from permissions import get_role
+        return get_role() == 'admin'
+    rate = current_app.config.get('PROFILER_SAMPLE_RATE', 0)
+    return bool(rate) and next(_request_counter) % rate == 0
+
+
+def _start():
+    if not _should_profile():
+        return
+    sampler = RequestSampler(threading.get_ident(),
+                             current_app.config.get('PROFILER_INTERVAL_MS', 5) / 1000)
+    g.profiler = (sampler, time.perf_counter(), request.endpoint or request.path)
+    sampler.start()
+
+
+def _write(sampler, elapsed, route):
+    directory = current_app.config.get('PROFILER_DIR', 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{route.replace('/', '_').replace('.', '-')}-{int(elapsed * 1000)}ms"
+    path = os.path.join(directory, name)
+
+    with open(path + '.collapsed', 'w') as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(';'.join(stack) + f' {count}\n')
+
+    samples = sum(sampler.categories.values())
+    summary = {
+        'route': route,
+        'wall_ms': round(elapsed * 1000, 2),
+        'samples': samples,
+        'interval_ms': round(sampler.interval * 1000, 3),
+        'split': {category: round(sampler.categories[category] / samples, 3) if samples else 0
+                  for category in (CATEGORY_SQL, CATEGORY_JINJA, CATEGORY_PYTHON)},
+    }
+    # Exact SQL time from the query instrumentation, when it is on
+    conn = g.get('db_conn')
+    if conn is not None and getattr(conn, 'query_log', None) is not None:
+        summary['sql_ms_measured'] = round(conn.query_log.seconds * 1000, 2)
+        summary['sql_statements'] = conn.query_log.count
+    with open(path + '.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+    return name
+
+
+def _finish(response=None):
+    profile = g.pop('profiler', None)
+    if profile is None:
+        return response
+    sampler, started, route = profile
+    elapsed = time.perf_counter() - started
+    sampler.stop()
+    try:
+        name = _write(sampler, elapsed, route)
+        if response is not None:
+            response.headers['X-Profile-Output'] = name
+    except OSError as e:
+        print(f"Error writing request profile: {e}")
+    return response
+
+
+def init_app(app):
+    """Register the profiling hooks when PROFILER_ENABLED is set."""
+    if not app.config.get('PROFILER_ENABLED', False):
+        return
+    app.before_request(_start)
+    app.after_request(_finish)
+    # Requests that raised never reach after_request
+    app.teardown_request(lambda exception=None: _finish())
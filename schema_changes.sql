@@ -0,0 +1,249 @@
+-- Schema changes required by the application on top of the base Concerto
+-- schema. Apply in order; each block notes the feature that needs it.
+
+-- 1. Hold expiry (hold_sweeper.py)
+-- Remember when a ticket was put on hold so stale holds can be released in
+-- bulk. The trigger stamps every path that holds a ticket, including the
+-- hold_ticket stored procedure. `held_by` (set by multi-seat holds, block
+-- 2) is cleared with it whenever a ticket leaves the held state.
+ALTER TABLE Tickets ADD COLUMN held_at DATETIME NULL;
+ALTER TABLE Tickets ADD COLUMN held_by INT NULL;
+CREATE INDEX idx_tickets_status_held_at ON Tickets (status, held_at);
+
+DELIMITER //
+CREATE TRIGGER trg_tickets_held_at
+BEFORE UPDATE ON Tickets
+FOR EACH ROW
+BEGIN
+    IF NEW.status = 'held' AND OLD.status <> 'held' THEN
+        SET NEW.held_at = NOW();
+    ELSEIF NEW.status <> 'held' THEN
+        SET NEW.held_at = NULL;
+        SET NEW.held_by = NULL;
+    END IF;
+END //
+DELIMITER ;
+
+-- 2. Multi-seat orders (payment.hold_ticket_group / purchase_ticket_group)
+-- A group hold records its buyer so only they can complete the purchase.
+-- A group purchase writes one Payments row and links every booking to it.
+-- Tickets.held_by is added in block 1.
+ALTER TABLE Bookings ADD COLUMN payment_id INT NULL;
+CREATE INDEX idx_bookings_payment_id ON Bookings (payment_id);
+
+-- 3. Single-call booking finalisation (payment.payment_gateway)
+-- Creates the booking and confirms or cancels it in one server-side call,
+-- reusing the existing procedures. The caller commits once.
+DROP PROCEDURE IF EXISTS finalize_booking;
+DELIMITER //
+CREATE PROCEDURE finalize_booking(
+    IN p_user_id INT,
+    IN p_ticket_id INT,
+    IN p_amount DECIMAL(10, 2),
+    IN p_payment_method VARCHAR(50),
+    IN p_payment_success BOOLEAN,
+    OUT p_booking_id INT
+)
+BEGIN
+    CALL create_booking(p_user_id, p_ticket_id, p_amount, p_payment_method);
+    IF p_payment_success THEN
+        CALL complete_booking(p_user_id, p_ticket_id, p_booking_id);
+    ELSE
+        CALL cancel_booking(p_user_id, p_ticket_id, p_booking_id);
+    END IF;
+END //
+DELIMITER ;
+
+-- 4. Idempotency keys for payment retries (idempotency.py)
+-- Only needed with IDEMPOTENCY_USE_DB = 1.
+CREATE TABLE IF NOT EXISTS IdempotencyKeys (
+    idem_key VARCHAR(80) NOT NULL PRIMARY KEY,
+    user_id INT NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    result TEXT NULL,
+    created_at DATETIME NOT NULL,
+    INDEX idx_idempotency_created_at (created_at)
+);
+
+-- 5. Keyset-paginated concert listing (app.index)
+-- Listing pages seek on (date_time, concert_id); each filter has an index
+-- that leads with its column so the seek stays a range scan.
+CREATE INDEX idx_concerts_date_id ON Concerts (date_time, concert_id);
+CREATE INDEX idx_concerts_venue_date ON Concerts (venue_id, date_time, concert_id);
+CREATE INDEX idx_concerts_artist_date ON Concerts (artist_id, date_time, concert_id);
+CREATE INDEX idx_artists_genre ON Artists (genre, artist_id);
+CREATE INDEX idx_venues_name ON Venues (venue_name, venue_id);
+CREATE INDEX idx_venues_location ON Venues (location, venue_id);
+
+-- 6. Keyset-paginated admin dashboard tabs (admin.fetch_applications)
+-- Approved artists are paged by approved_date; give older rows one.
+UPDATE Artists SET approved_date = application_date
+WHERE status = 'approved' AND approved_date IS NULL;
+CREATE INDEX idx_artists_status_applied ON Artists (status, application_date, artist_id);
+CREATE INDEX idx_artists_status_approved ON Artists (status, approved_date, artist_id);
+CREATE INDEX idx_artists_applied ON Artists (application_date, artist_id);
+
+-- 7. Profile page (profile.profile)
+-- Booking history is paged per user by (booking_time, booking_id).
+CREATE INDEX idx_bookings_user_time ON Bookings (user_id, booking_time, booking_id);
+
+-- Per-concert ticket counters, maintained by triggers on every path that
+-- creates tickets or changes their status (stored procedures, group orders,
+-- the hold sweeper), so the artist profile reads them instead of
+-- aggregating Tickets on every view.
+-- Each concert has up to 16 counter rows (slots) and readers SUM them. A
+-- trigger writes the slot of its connection (CONNECTION_ID() MOD 16), so
+-- concurrent holds and sales of one concert update different rows instead
+-- of queueing on a single row lock until commit, and one transaction never
+-- locks two slots. A slot on its own can go negative (a ticket created in
+-- one slot and sold in another); only the sums mean anything.
+CREATE TABLE ConcertTicketStats (
+    concert_id INT NOT NULL,
+    slot TINYINT UNSIGNED NOT NULL,
+    total_tickets INT NOT NULL DEFAULT 0,
+    available_tickets INT NOT NULL DEFAULT 0,
+    held_tickets INT NOT NULL DEFAULT 0,
+    sold_tickets INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (concert_id, slot),
+    FOREIGN KEY (concert_id) REFERENCES Concerts(concert_id) ON DELETE CASCADE
+);
+
+INSERT INTO ConcertTicketStats
+    (concert_id, slot, total_tickets, available_tickets, held_tickets, sold_tickets, revenue)
+SELECT concert_id, 0,
+       COUNT(*),
+       SUM(status = 'available'),
+       SUM(status = 'held'),
+       SUM(status = 'sold'),
+       COALESCE(SUM(CASE WHEN status = 'sold' THEN price END), 0)
+FROM Tickets
+GROUP BY concert_id;
+
+DELIMITER //
+CREATE TRIGGER trg_tickets_stats_insert
+AFTER INSERT ON Tickets
+FOR EACH ROW
+BEGIN
+    INSERT INTO ConcertTicketStats
+        (concert_id, slot, total_tickets, available_tickets, held_tickets, sold_tickets, revenue)
+    VALUES (NEW.concert_id, CONNECTION_ID() MOD 16, 1,
+            NEW.status = 'available', NEW.status = 'held', NEW.status = 'sold',
+            IF(NEW.status = 'sold', NEW.price, 0))
+    ON DUPLICATE KEY UPDATE
+        total_tickets = total_tickets + 1,
+        available_tickets = available_tickets + (NEW.status = 'available'),
+        held_tickets = held_tickets + (NEW.status = 'held'),
+        sold_tickets = sold_tickets + (NEW.status = 'sold'),
+        revenue = revenue + IF(NEW.status = 'sold', NEW.price, 0);
+END //
+
+CREATE TRIGGER trg_tickets_stats_update
+AFTER UPDATE ON Tickets
+FOR EACH ROW
+BEGIN
+    IF NEW.status <> OLD.status OR NEW.price <> OLD.price THEN
+        INSERT INTO ConcertTicketStats
+            (concert_id, slot, total_tickets, available_tickets, held_tickets, sold_tickets, revenue)
+        VALUES (NEW.concert_id, CONNECTION_ID() MOD 16, 0,
+                (NEW.status = 'available') - (OLD.status = 'available'),
+                (NEW.status = 'held') - (OLD.status = 'held'),
+                (NEW.status = 'sold') - (OLD.status = 'sold'),
+                IF(NEW.status = 'sold', NEW.price, 0) - IF(OLD.status = 'sold', OLD.price, 0))
+        ON DUPLICATE KEY UPDATE
+            available_tickets = available_tickets - (OLD.status = 'available') + (NEW.status = 'available'),
+            held_tickets = held_tickets - (OLD.status = 'held') + (NEW.status = 'held'),
+            sold_tickets = sold_tickets - (OLD.status = 'sold') + (NEW.status = 'sold'),
+            revenue = revenue - IF(OLD.status = 'sold', OLD.price, 0) + IF(NEW.status = 'sold', NEW.price, 0);
+    END IF;
+END //
+
+CREATE TRIGGER trg_tickets_stats_delete
+AFTER DELETE ON Tickets
+FOR EACH ROW
+BEGIN
+    INSERT INTO ConcertTicketStats
+        (concert_id, slot, total_tickets, available_tickets, held_tickets, sold_tickets, revenue)
+    VALUES (OLD.concert_id, CONNECTION_ID() MOD 16, -1,
+            -(OLD.status = 'available'), -(OLD.status = 'held'), -(OLD.status = 'sold'),
+            -IF(OLD.status = 'sold', OLD.price, 0))
+    ON DUPLICATE KEY UPDATE
+        total_tickets = total_tickets - 1,
+        available_tickets = available_tickets - (OLD.status = 'available'),
+        held_tickets = held_tickets - (OLD.status = 'held'),
+        sold_tickets = sold_tickets - (OLD.status = 'sold'),
+        revenue = revenue - IF(OLD.status = 'sold', OLD.price, 0);
+END //
+DELIMITER ;
+
+-- 8. Background ticket generation (ticket_jobs.py)
+-- New concerts are inserted unpublished and published by the ticket job
+-- once every seat has a ticket. Existing concerts stay published. The
+-- public listing and search only read published concerts.
+ALTER TABLE Concerts ADD COLUMN published TINYINT(1) NOT NULL DEFAULT 1;
+CREATE INDEX idx_concerts_published_date ON Concerts (published, date_time, concert_id);
+-- The job inserts tickets in seat_id ranges per venue and resumes from the
+-- highest seat_id already ticketed for the concert.
+CREATE INDEX idx_seats_venue_seat ON Seats (venue_id, seat_id);
+CREATE INDEX idx_tickets_concert_seat ON Tickets (concert_id, seat_id);
+
+-- 9. Venue sections (seatmap.py, booking page)
+-- Seats belong to a named section and rows can be any label (A..Z, AA..,
+-- numbers). Existing seats become the single 'Main' section, which the
+-- booking page shows directly without a section overview.
+ALTER TABLE Seats ADD COLUMN section VARCHAR(50) NOT NULL DEFAULT 'Main' AFTER venue_id;
+CREATE INDEX idx_seats_venue_section_row ON Seats (venue_id, section, row_no, seat_no);
+
+-- 10. Ticket job bookkeeping (ticket_jobs.py)
+-- Prices and state of each concert's ticket generation, written with the
+-- concert. A job interrupted by a restart is requeued at startup or from
+-- the Retry button; updated_at is the running job's per-batch heartbeat.
+CREATE TABLE ConcertTicketJobs (
+    concert_id INT PRIMARY KEY,
+    gold_price DECIMAL(10, 2) NOT NULL,
+    silver_price DECIMAL(10, 2) NOT NULL,
+    bronze_price DECIMAL(10, 2) NOT NULL,
+    state VARCHAR(10) NOT NULL DEFAULT 'queued',
+    error VARCHAR(255) NULL,
+    updated_at DATETIME NOT NULL,
+    FOREIGN KEY (concert_id) REFERENCES Concerts(concert_id) ON DELETE CASCADE
+);
+
+-- 11. One pricing rule for ticket generation (ticket_jobs.py)
+-- The batched job and the generate_concert_tickets procedure both price a
+-- seat with ticket_price(), from the gold/silver/bronze prices passed in.
+DROP FUNCTION IF EXISTS ticket_price;
+DELIMITER //
+CREATE FUNCTION ticket_price(
+    p_seat_type VARCHAR(20),
+    p_gold DECIMAL(10, 2),
+    p_silver DECIMAL(10, 2),
+    p_bronze DECIMAL(10, 2)
+) RETURNS DECIMAL(10, 2)
+DETERMINISTIC
+BEGIN
+    RETURN CASE LOWER(p_seat_type)
+        WHEN 'gold' THEN p_gold
+        WHEN 'silver' THEN p_silver
+        ELSE p_bronze
+    END;
+END //
+DELIMITER ;
+
+DROP PROCEDURE IF EXISTS generate_concert_tickets;
+DELIMITER //
+CREATE PROCEDURE generate_concert_tickets(
+    IN p_concert_id INT,
+    IN p_gold DECIMAL(10, 2),
+    IN p_silver DECIMAL(10, 2),
+    IN p_bronze DECIMAL(10, 2)
+)
+BEGIN
+    INSERT INTO Tickets (concert_id, seat_id, price, status)
+    SELECT p_concert_id, s.seat_id, ticket_price(s.seat_type, p_gold, p_silver, p_bronze), 'available'
+    FROM Concerts c
+    JOIN Seats s ON s.venue_id = c.venue_id
+    WHERE c.concert_id = p_concert_id
+    ORDER BY s.seat_id;
+END //
+DELIMITER ;
@@ -0,0 +1,412 @@
+# search.py
+"""
+In-process search over upcoming concerts, approved artists and venues.
+
+Concerts.title, Artists.artist_name/genre and Venues.venue_name/location
+are tokenised into an inverted index kept in memory, so search and
+autocomplete never run LIKE '%x%' scans against MySQL. Each query term
+matches index terms exactly, by prefix, or with one typo (insertion,
+deletion, substitution or transposition), found through a
+deletion-neighbourhood table instead of scanning the vocabulary.
+
+The index is built on first use. artist.create_concert and
+admin.approve_artist update it in place; changes made by other worker
+processes show up after the periodic rebuild (SEARCH_REBUILD_INTERVAL).
+"""
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from datetime import datetime
+
+from flask import Blueprint, current_app, jsonify, render_template, request, session, url_for
+from markupsafe import Markup
+from db import get_db_connection
+
+search_bp = Blueprint('search', __name__)
+
+KIND_CONCERT = 'concert'
+KIND_ARTIST = 'artist'
+KIND_VENUE = 'venue'
+
+# Concerts first: they are what people come to book
+KIND_ORDER = {KIND_CONCERT: 0, KIND_ARTIST: 1, KIND_VENUE: 2}
+
+SCORE_EXACT = 3.0
+SCORE_PREFIX = 2.0
+SCORE_TYPO = 1.0
+
+# Typo matching only kicks in from this many characters; shorter terms match
+# far too much of the vocabulary with a single edit.
+MIN_TYPO_LENGTH = 4
+# Cap on vocabulary terms one short prefix expands to
+MAX_PREFIX_EXPANSION = 64
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """Lower-cased, accent-folded alphanumeric terms of `text`."""
+    if not text:
+        return []
+    folded = unicodedata.normalize('NFKD', str(text).lower())
+    folded = ''.join(ch for ch in folded if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(folded)
+
+
+def _deletes(term):
+    """`term` with each single character removed."""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a, b):
+    """Damerau-Levenshtein distance <= 1."""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diffs = [i for i in range(la) if a[i] != b[i]]
+        if len(diffs) == 1:
+            return True
+        return (len(diffs) == 2 and diffs[1] == diffs[0] + 1
+                and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]])
+    if la > lb:
+        a, b = b, a
+    # b is a with one extra character
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+class SearchIndex:
+    """
+    Inverted index of documents keyed by (kind, id).
+
+    Every document carries a `payload` dict that is returned as-is with
+    results, so answering a query needs nothing but this object.
+    """
+
+    def __init__(self):
+        self._docs = {}        # key -> (terms, payload)
+        self._postings = {}    # term -> set of keys
+        self._terms = []       # sorted vocabulary, for prefix lookups
+        self._deletions = {}   # term or single-deletion variant -> set of terms
+        self._lock = threading.RLock()
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, kind, doc_id, texts, payload):
+        """Index (or re-index) a document from a list of text fields."""
+        key = (kind, doc_id)
+        terms = set()
+        for text in texts:
+            terms.update(tokenize(text))
+        with self._lock:
+            self._remove(key)
+            self._docs[key] = (terms, payload)
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = set()
+                    self._add_term(term)
+                postings.add(key)
+
+    def remove(self, kind, doc_id):
+        with self._lock:
+            self._remove((kind, doc_id))
+
+    def _remove(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        for term in doc[0]:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.discard(key)
+            if not postings:
+                del self._postings[term]
+                self._drop_term(term)
+
+    def _add_term(self, term):
+        self._terms.insert(bisect_left(self._terms, term), term)
+        if len(term) >= MIN_TYPO_LENGTH - 1:
+            for variant in _deletes(term) | {term}:
+                self._deletions.setdefault(variant, set()).add(term)
+
+    def _drop_term(self, term):
+        i = bisect_left(self._terms, term)
+        if i < len(self._terms) and self._terms[i] == term:
+            del self._terms[i]
+        if len(term) >= MIN_TYPO_LENGTH - 1:
+            for variant in _deletes(term) | {term}:
+                terms = self._deletions.get(variant)
+                if terms is not None:
+                    terms.discard(term)
+                    if not terms:
+                        del self._deletions[variant]
+
+    def _expand(self, query_term, allow_prefix):
+        """Vocabulary terms matching `query_term`, with their match scores."""
+        matches = {}
+        if query_term in self._postings:
+            matches[query_term] = SCORE_EXACT
+        if allow_prefix:
+            start = bisect_left(self._terms, query_term)
+            for term in self._terms[start:start + MAX_PREFIX_EXPANSION]:
+                if not term.startswith(query_term):
+                    break
+                matches.setdefault(term, SCORE_PREFIX)
+        if len(query_term) >= MIN_TYPO_LENGTH:
+            candidates = set()
+            for variant in _deletes(query_term) | {query_term}:
+                candidates.update(self._deletions.get(variant, ()))
+            for term in candidates:
+                if term not in matches and _within_one_edit(query_term, term):
+                    matches[term] = SCORE_TYPO
+        return matches
+
+    def search(self, query, limit=10, kinds=None, prefix=True):
+        """
+        Payloads of the best matching documents, each with a `score`.
+
+        Every query term has to match (exactly, by prefix, or with one typo).
+        With `prefix` only the last term is completed as a prefix, the way
+        someone is typing it; earlier terms are taken as whole words.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            scores = None
+            for position, term in enumerate(terms):
+                term_scores = {}
+                allow_prefix = prefix and position == len(terms) - 1
+                for match, score in self._expand(term, allow_prefix).items():
+                    for key in self._postings[match]:
+                        if score > term_scores.get(key, 0):
+                            term_scores[key] = score
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {key: scores[key] + s for key, s in term_scores.items() if key in scores}
+                if not scores:
+                    return []
+            now = datetime.now()
+            results = []
+            for key, score in scores.items():
+                if kinds and key[0] not in kinds:
+                    continue
+                payload = self._docs[key][1]
+                # Concerts that have started since the index was built
+                if key[0] == KIND_CONCERT and payload['date_time'] < now:
+                    continue
+                results.append((score, key, payload))
+        results.sort(key=lambda r: (-r[0], KIND_ORDER[r[1][0]], r[2]['label'].lower()))
+        return [dict(payload, score=score) for score, _, payload in results[:limit]]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'documents': len(self._docs),
+                'terms': len(self._terms),
+                'deletion_variants': len(self._deletions),
+                'age_seconds': round(time.monotonic() - self.built_at, 1),
+            }
+
+
+def _concert_payload(row):
+    concert_id, title, date_time, artist_name, genre, venue_name, location = row
+    return {
+        'type': KIND_CONCERT,
+        'id': concert_id,
+        'label': title,
+        'detail': f"{artist_name} · {venue_name}, {location}",
+        'date_time': date_time,
+        'row': row,
+    }
+
+
+def _add_concert(index, row):
+    # Artist, genre and venue words find the concert too
+    index.add(KIND_CONCERT, row[0], [row[1], row[3], row[4], row[5], row[6]], _concert_payload(row))
+
+
+def _add_artist(index, row):
+    artist_id, artist_name, genre = row
+    index.add(KIND_ARTIST, artist_id, [artist_name, genre], {
+        'type': KIND_ARTIST,
+        'id': artist_id,
+        'label': artist_name,
+        'detail': genre or '',
+    })
+
+
+def _add_venue(index, row):
+    venue_id, venue_name, location = row
+    index.add(KIND_VENUE, venue_id, [venue_name, location], {
+        'type': KIND_VENUE,
+        'id': venue_id,
+        'label': venue_name,
+        'detail': location or '',
+    })
+
+
+def result_url(result):
+    """Where a suggestion links to; built per request, not stored in the index."""
+    if result['type'] == KIND_CONCERT:
+        return url_for('book.book_concert', concert_id=result['id'])
+    if result['type'] == KIND_ARTIST:
+        return url_for('search.search', q=result['label'])
+    return url_for('index', venue=result['label'])
+
+
+_CONCERT_SQL = """
+    SELECT c.concert_id, c.title, c.date_time, a.artist_name,
+    a.genre, v.venue_name, v.location
+    FROM Concerts c
+    JOIN Artists a ON c.artist_id = a.artist_id
+    JOIN Venues v ON c.venue_id = v.venue_id
+"""
+
+
+def build_index(cursor):
+    index = SearchIndex()
+    cursor.execute(_CONCERT_SQL + " WHERE c.published = 1 AND c.date_time >= %s", (datetime.now(),))
+    for row in cursor.fetchall():
+        _add_concert(index, row)
+    cursor.execute("SELECT artist_id, artist_name, genre FROM Artists WHERE status = 'approved'")
+    for row in cursor.fetchall():
+        _add_artist(index, row)
+    cursor.execute("SELECT venue_id, venue_name, location FROM Venues")
+    for row in cursor.fetchall():
+        _add_venue(index, row)
+    return index
+
+
+_index = None
+_build_lock = threading.Lock()
+
+
+def get_search_index():
+    """
+    The shared SearchIndex, built on first use and rebuilt every
+    SEARCH_REBUILD_INTERVAL seconds. While one request rebuilds, the others
+    keep answering from the previous index. Raises on database errors when
+    there is no index to fall back to.
+    """
+    global _index
+    interval = current_app.config.get('SEARCH_REBUILD_INTERVAL', 300)
+    index = _index
+    if index is not None and (not interval or time.monotonic() - index.built_at < interval):
+        return index
+    if index is not None and not _build_lock.acquire(blocking=False):
+        return index
+    if index is None:
+        _build_lock.acquire()
+    try:
+        if _index is not None and _index is not index:
+            return _index
+        db = get_db_connection()
+        if not db:
+            if index is not None:
+                return index
+            raise RuntimeError('Database connection error')
+        cursor = db.cursor()
+        try:
+            _index = build_index(cursor)
+        except Exception:
+            if index is None:
+                raise
+            print("Error rebuilding search index, serving the previous one")
+            return index
+        finally:
+            cursor.close()
+        return _index
+    finally:
+        _build_lock.release()
+
+
+def index_concert(cursor, concert_id):
+    """Add, refresh or drop one concert depending on whether it is published."""
+    if _index is None:
+        return
+    try:
+        cursor.execute(_CONCERT_SQL + " WHERE c.concert_id = %s AND c.published = 1", (concert_id,))
+        row = cursor.fetchone()
+        if row:
+            _add_concert(_index, row)
+        else:
+            _index.remove(KIND_CONCERT, concert_id)
+    except Exception as e:
+        print(f"Error indexing concert {concert_id}: {e}")
+
+
+def index_artist(cursor, artist_id):
+    """Add, refresh or drop one artist depending on its approval status."""
+    if _index is None:
+        return
+    try:
+        cursor.execute("SELECT artist_id, artist_name, genre, status FROM Artists WHERE artist_id = %s",
+                       (artist_id,))
+        row = cursor.fetchone()
+        if row and row[3] == 'approved':
+            _add_artist(_index, row[:3])
+        else:
+            _index.remove(KIND_ARTIST, artist_id)
+    except Exception as e:
+        print(f"Error indexing artist {artist_id}: {e}")
+
+
+def search_stats():
+    return _index.stats() if _index is not None else None
+
+
+@search_bp.route('/search/autocomplete')
+def autocomplete():
+    """Suggestions for the search box, answered from memory."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'query': query, 'results': []})
+    try:
+        limit = max(1, min(int(request.args.get('limit', 8)), 20))
+    except ValueError:
+        limit = 8
+    try:
+        index = get_search_index()
+    except Exception as e:
+        print(f"Error loading search index: {e}")
+        return jsonify({'error': 'Search is unavailable right now'}), 503
+    results = index.search(query, limit=limit)
+    return jsonify({
+        'query': query,
+        'results': [dict({key: r[key] for key in ('type', 'id', 'label', 'detail')}, url=result_url(r))
+                    for r in results],
+    })
+
+
+@search_bp.route('/search')
+def search():
+    """Concert results for a full query, rendered like the listing page."""
+    query = request.args.get('q', '').strip()
+    username = session.get('name') or "Guest"
+    concerts = []
+    if query:
+        try:
+            index = get_search_index()
+            results = index.search(query, limit=current_app.config.get('INDEX_PAGE_SIZE', 12) * 4,
+                                   kinds={KIND_CONCERT})
+            concerts = [r['row'] for r in results]
+        except Exception as e:
+            print(f"Error searching concerts: {e}")
+    # Results depend on the query, so they are rendered but not cached
+    concert_list = Markup(render_template('index_concerts.html', concerts=concerts, filters={},
+                                          next_cursor=None, is_first_page=True, query=query))
+    return render_template('index.html', username=username, filters={}, query=query,
+                           concert_list=concert_list)
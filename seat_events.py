@@ -0,0 +1,100 @@
+# seat_events.py
+"""
+Fan-out of seat status changes to streaming clients.
+
+The seat map cache (seatmap.py) is the single event source: its change log
+already records which seats changed at which version. This module only
+wakes the streams watching a concert when that log grows, so N watchers
+cost N sleeping generators rather than N database polls.
+
+Under threaded workers (the dev server, gunicorn --threads) each open
+stream still pins one worker thread for up to SEAT_STREAM_MAX_AGE, so
+`stream_limit` keeps streams to a share of the threads and everyone past
+that polls /availability. Under gevent or eventlet workers a stream is a
+cheap greenlet and SEAT_STREAM_MAX_CLIENTS applies as is.
+"""
+import sys
+import threading
+
+
+class SeatEventBroker:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conditions = {}
+        self._watchers = 0
+
+    def _condition(self, concert_id):
+        with self._lock:
+            condition = self._conditions.get(concert_id)
+            if condition is None:
+                condition = self._conditions[concert_id] = threading.Condition()
+            return condition
+
+    def try_attach(self, limit):
+        """Reserve a stream slot; False once `limit` streams are open."""
+        with self._lock:
+            if limit and self._watchers >= limit:
+                return False
+            self._watchers += 1
+            return True
+
+    def detach(self):
+        with self._lock:
+            self._watchers -= 1
+
+    @property
+    def watchers(self):
+        return self._watchers
+
+    def wait(self, concert_id, changed, timeout):
+        """
+        Block until `changed()` is true or `timeout` seconds pass.
+
+        The predicate is checked under the condition's lock, so a change
+        published just before the wait starts is not missed.
+        """
+        condition = self._condition(concert_id)
+        with condition:
+            return condition.wait_for(changed, timeout)
+
+    def notify(self, concert_ids):
+        for concert_id in concert_ids:
+            with self._lock:
+                condition = self._conditions.get(concert_id)
+            if condition is not None:
+                with condition:
+                    condition.notify_all()
+
+
+broker = SeatEventBroker()
+
+
+def cooperative_workers():
+    """True when gevent or eventlet has patched threading (async workers)."""
+    gevent_monkey = sys.modules.get('gevent.monkey')
+    if gevent_monkey is not None and gevent_monkey.is_module_patched('threading'):
+        return True
+    eventlet_patcher = sys.modules.get('eventlet.patcher')
+    return eventlet_patcher is not None and eventlet_patcher.is_monkey_patched('thread')
+
+
+def stream_limit(config):
+    """Open streams this process allows before sending clients to polling."""
+    limit = config.get('SEAT_STREAM_MAX_CLIENTS', 1000)
+    if cooperative_workers():
+        return limit
+    threads = config.get('SERVER_THREADS', 8)
+    share = max(1, int(threads * config.get('SEAT_STREAM_THREAD_SHARE', 0.25)))
+    return min(limit, share) if limit else share
+
+# Event names sent to the browser for each ticket status
+EVENT_TYPES = {
+    'available': 'release',
+    'held': 'hold',
+    'sold': 'sold',
+}
+
+
+def event_type(status):
+    return EVENT_TYPES.get(status, 'status')
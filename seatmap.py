@@ -0,0 +1,444 @@
+# seatmap.py
+"""
+In-process seat map cache for the booking page.
+
+The seat layout of a concert (ticket, row, seat, type, price) never changes
+once its tickets are generated, so it is loaded once and kept. Only ticket
+statuses move; they live in a versioned one-byte-per-seat overlay that
+payment.py patches after every hold/booking/cancellation, and that is
+re-read from MySQL at most every SEATMAP_STATUS_TTL seconds to pick up
+writes made by other processes.
+
+Seats are ordered by section, then row, then seat number, so every section
+is one contiguous range of ordinals. The booking page shows a per-section
+overview and renders the seats of one section at a time.
+"""
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+from flask import current_app
+from db import get_db_connection
+from seat_events import broker
+
+STATUS_AVAILABLE = 'available'
+STATUS_HELD = 'held'
+STATUS_SOLD = 'sold'
+
+# Section of seats created before venues had sections
+DEFAULT_SECTION = 'Main'
+
+
+# Seat statuses are stored as one byte per seat; unknown statuses coming from
+# the stored procedures get the next free code the first time they are seen.
+STATUS_NAMES = [STATUS_AVAILABLE, STATUS_HELD, STATUS_SOLD]
+STATUS_CODES = {name: code for code, name in enumerate(STATUS_NAMES)}
+_codes_lock = threading.Lock()
+
+
+def status_code(status):
+    code = STATUS_CODES.get(status)
+    if code is None:
+        with _codes_lock:
+            code = STATUS_CODES.get(status)
+            if code is None:
+                code = len(STATUS_NAMES)
+                STATUS_NAMES.append(status)
+                STATUS_CODES[status] = code
+    return code
+
+
+class ConcertSeatMap:
+    """
+    Cached layout plus status overlay of one concert.
+
+    `codes` holds one status byte per seat, indexed by the seat's ordinal in
+    `layout`. Every change bumps `version` and is appended to a bounded
+    change log so clients can ask for just the seats changed since the
+    version they last saw. Clients get versions as `token`s,
+    "<epoch>:<version>", where the epoch is random per loaded map: a token
+    from another worker process or an earlier load of the concert never
+    matches, so its holder resyncs. `sections` lists (name, first_ordinal,
+    end_ordinal) in layout order.
+
+    Rendered rows are kept for at most `row_cache_seats` seats (about 380
+    bytes of HTML each), least recently rendered rows going first, so only
+    the sections people are looking at stay rendered.
+    """
+
+    def __init__(self, concert_id, concert, layout, statuses, changelog_size=1024, sections=None,
+                 row_cache_seats=10000):
+        self.concert_id = concert_id
+        self.concert = concert  # (title, venue_name, location, date_time)
+        self.layout = layout    # [(ticket_id, row_no, seat_no, seat_type, price), ...]
+        self.positions = {seat[0]: i for i, seat in enumerate(layout)}
+        self.codes = array('B', (status_code(status) for status in statuses))
+        self.epoch = secrets.token_hex(4)
+        self.version = 1
+        self.changelog = deque(maxlen=changelog_size)  # (version, ordinal)
+        self.refreshed_at = time.monotonic()
+        self.sections = sections or [(DEFAULT_SECTION, 0, len(layout))]
+        self.section_bounds = {name: (start, end) for name, start, end in self.sections}
+        self._grid = None
+        self._section_rows = {}  # section name -> (first row index, end row index)
+        self.row_cache_seats = row_cache_seats
+        self._row_cache = OrderedDict()  # row index -> (status bytes, rendered row), LRU order
+        self._row_cache_size = 0         # seats covered by _row_cache
+        self._row_cache_lock = threading.Lock()
+
+    @property
+    def grid(self):
+        """
+        The layout grouped by row, in seat order:
+        [(row_no, first_ordinal, [(ticket_id, seat_no, seat_type, type_label, price), ...]), ...]
+
+        Rows never span two sections, even when both use the same row names.
+
+        `seat_type` is lowercased for the CSS class and `type_label` is
+        title-cased for display. Built on first use and kept until the
+        layout is reloaded.
+        """
+        grid = self._grid
+        if grid is None:
+            grid = []
+            section_rows = {}
+            for name, start, end in self.sections:
+                first_row = len(grid)
+                for ordinal in range(start, end):
+                    ticket_id, row_no, seat_no, seat_type, price = self.layout[ordinal]
+                    if len(grid) == first_row or grid[-1][0] != row_no:
+                        grid.append((row_no, ordinal, []))
+                    seat_type = (seat_type or '').lower()
+                    grid[-1][2].append((ticket_id, seat_no, seat_type, seat_type.title(), price))
+                section_rows[name] = (first_row, len(grid))
+            self._section_rows = section_rows
+            self._grid = grid
+        return grid
+
+    def render_rows(self, render_row, section=None):
+        """
+        Rendered markup of every row of `section` (default: the whole
+        venue), from `render_row(row_no, seats, row_codes)`.
+
+        Each row's output is kept together with the status bytes it was
+        rendered from, so a request only re-renders the rows in which a
+        seat changed since the last render; the rest is reused as is.
+        """
+        grid = self.grid
+        first, end = (0, len(grid)) if section is None else self._section_rows[section]
+        rendered = []
+        for i in range(first, end):
+            row_no, start, seats = grid[i]
+            row_codes = self.codes[start:start + len(seats)].tobytes()
+            cached = self._cached_row(i)
+            if cached is None or cached[0] != row_codes:
+                cached = (row_codes, render_row(row_no, seats, row_codes))
+                self._cache_row(i, cached, first)
+            rendered.append(cached[1])
+        return rendered
+
+    def _cached_row(self, i):
+        with self._row_cache_lock:
+            cached = self._row_cache.get(i)
+            if cached is not None:
+                self._row_cache.move_to_end(i)
+            return cached
+
+    def _cache_row(self, i, entry, first):
+        """
+        Keep row `i`, evicting the least recently rendered rows to stay in
+        budget. Rows `first`..`i` were just used by the same render; when
+        only those are left to evict, row `i` is not kept instead, so a
+        section larger than the budget keeps its first rows cached rather
+        than evicting itself row by row.
+        """
+        # One status byte per seat, so len(status bytes) is the row's seat count
+        with self._row_cache_lock:
+            cache = self._row_cache
+            old = cache.pop(i, None)
+            if old is not None:
+                self._row_cache_size -= len(old[0])
+            cache[i] = entry
+            self._row_cache_size += len(entry[0])
+            while self._row_cache_size > self.row_cache_seats:
+                oldest = next(iter(cache))
+                if first <= oldest <= i:
+                    oldest = i
+                evicted = cache.pop(oldest)
+                self._row_cache_size -= len(evicted[0])
+                if oldest == i:
+                    break
+
+    def overview(self):
+        """Per-section seat counts and price range, in layout order."""
+        self.grid  # builds the section -> rows index
+        available, held, sold = (status_code(status) for status in (STATUS_AVAILABLE, STATUS_HELD, STATUS_SOLD))
+        sections = []
+        for name, start, end in self.sections:
+            codes = self.codes[start:end]
+            prices = [seat[4] for seat in self.layout[start:end]]
+            first_row, end_row = self._section_rows[name]
+            sections.append({
+                'section': name,
+                'rows': end_row - first_row,
+                'seats': end - start,
+                'available': codes.count(available),
+                'held': codes.count(held),
+                'sold': codes.count(sold),
+                'min_price': min(prices, default=None),
+                'max_price': max(prices, default=None),
+            })
+        return sections
+
+    def status_at(self, ordinal):
+        return STATUS_NAMES[self.codes[ordinal]]
+
+    def tickets(self):
+        """Rows in the shape of the original Tickets⋈Seats query."""
+        return [seat + (STATUS_NAMES[code],) for seat, code in zip(self.layout, self.codes)]
+
+    def set_status(self, ticket_id, status):
+        ordinal = self.positions.get(ticket_id)
+        if ordinal is None:
+            return False
+        code = status_code(status)
+        if self.codes[ordinal] == code:
+            return False
+        self.codes[ordinal] = code
+        self.version += 1
+        self.changelog.append((self.version, ordinal))
+        return True
+
+    @property
+    def token(self):
+        return self.token_at(self.version)
+
+    def token_at(self, version):
+        return f"{self.epoch}:{version}"
+
+    def version_of(self, token):
+        """The version a client's token names, or None if it is not one of this map's."""
+        epoch, _, version = (token or '').partition(':')
+        if epoch != self.epoch or not version.isdigit() or int(version) > self.version:
+            return None
+        return int(version)
+
+    def changes_since(self, version, section=None):
+        """
+        Returns [(ticket_id, status), ...] changed after `version`, or None
+        when that version has already fallen out of the change log (or is
+        None), so the client has to resync. With a section, only that
+        section's seats are reported.
+        """
+        if version is None or version > self.version:
+            return None
+        if version == self.version:
+            return []
+        if not self.changelog or self.changelog[0][0] > version + 1:
+            return None
+        ordinals = {ordinal for v, ordinal in self.changelog if v > version}
+        if section is not None:
+            start, end = self.section_bounds[section]
+            ordinals = {ordinal for ordinal in ordinals if start <= ordinal < end}
+        return [(self.layout[o][0], self.status_at(o)) for o in sorted(ordinals)]
+
+    def snapshot(self, section=None):
+        start, end = (0, len(self.layout)) if section is None else self.section_bounds[section]
+        return [(seat[0], STATUS_NAMES[code])
+                for seat, code in zip(self.layout[start:end], self.codes[start:end])]
+
+
+# A concert's map is dropped once its start is this far behind
+FINISHED_AFTER = timedelta(hours=6)
+# Cold loads of concerts hashing to the same stripe wait for each other
+LOAD_LOCK_STRIPES = 64
+
+
+def concert_finished(seat_map, now=None):
+    starts_at = seat_map.concert[3]
+    return isinstance(starts_at, datetime) and starts_at + FINISHED_AFTER < (now or datetime.now())
+
+
+class SeatMapCache:
+    """
+    Seat maps of at most `max_maps` concerts, least recently used dropped
+    first. Concerts that are over are dropped whenever a map is added.
+    """
+
+    def __init__(self, max_maps=50):
+        self.max_maps = max_maps
+        self._maps = OrderedDict()
+        self._ticket_concert = {}
+        self._lock = threading.Lock()
+        self._load_locks = [threading.Lock() for _ in range(LOAD_LOCK_STRIPES)]
+
+    def get(self, concert_id):
+        with self._lock:
+            seat_map = self._maps.get(concert_id)
+            if seat_map is not None:
+                self._maps.move_to_end(concert_id)
+            return seat_map
+
+    def load_lock(self, concert_id):
+        """Cold pages are loaded once, not once per visitor."""
+        return self._load_locks[hash(concert_id) % LOAD_LOCK_STRIPES]
+
+    def put(self, seat_map):
+        dropped = []
+        with self._lock:
+            old = self._maps.pop(seat_map.concert_id, None)
+            if old is not None:
+                self._drop(old)
+            # Tokens handed out for any earlier map of the concert are void
+            seat_map.epoch = secrets.token_hex(4)
+            self._maps[seat_map.concert_id] = seat_map
+            for ticket_id in seat_map.positions:
+                self._ticket_concert[ticket_id] = seat_map.concert_id
+
+            now = datetime.now()
+            for other in list(self._maps.values()):
+                if other is not seat_map and concert_finished(other, now):
+                    dropped.append(self._maps.pop(other.concert_id))
+            while len(self._maps) > self.max_maps:
+                dropped.append(self._maps.popitem(last=False)[1])
+            for other in dropped:
+                self._drop(other)
+        # Streams of the replaced or dropped maps resync (and reload if needed)
+        broker.notify([m.concert_id for m in dropped] + ([seat_map.concert_id] if old is not None else []))
+
+    def _drop(self, seat_map):
+        # Caller holds the lock
+        for ticket_id in seat_map.positions:
+            if self._ticket_concert.get(ticket_id) == seat_map.concert_id:
+                del self._ticket_concert[ticket_id]
+
+    def invalidate(self, concert_id):
+        with self._lock:
+            seat_map = self._maps.pop(concert_id, None)
+            if seat_map is not None:
+                self._drop(seat_map)
+        broker.notify([concert_id])
+
+    def concert_of(self, ticket_id):
+        return self._ticket_concert.get(ticket_id)
+
+    def apply(self, changes):
+        """Patch cached statuses from {ticket_id: status}; returns changed concert ids."""
+        touched = set()
+        with self._lock:
+            for ticket_id, status in changes.items():
+                seat_map = self._maps.get(self._ticket_concert.get(ticket_id))
+                if seat_map is not None and seat_map.set_status(ticket_id, status):
+                    touched.add(seat_map.concert_id)
+        broker.notify(touched)
+        return touched
+
+
+seat_maps = SeatMapCache()
+
+
+def _load_seat_map(cursor, concert_id):
+    cursor.execute("""
+        SELECT c.title, v.venue_name, v.location, c.date_time
+        FROM Concerts c
+        JOIN Venues v ON c.venue_id = v.venue_id
+        WHERE c.concert_id = %s AND c.published = 1
+    """, (concert_id,))
+    concert = cursor.fetchone()
+    if not concert:
+        return None
+
+    # Row names sort naturally (A..Z, AA..) by length first
+    cursor.execute("""
+        SELECT t.ticket_id, s.row_no, s.seat_no, s.seat_type, t.price, t.status, s.section
+        FROM Tickets t
+        JOIN Seats s ON t.seat_id = s.seat_id
+        WHERE t.concert_id = %s
+        ORDER BY s.section, CHAR_LENGTH(s.row_no), s.row_no, s.seat_no
+    """, (concert_id,))
+    rows = cursor.fetchall()
+
+    layout = [tuple(row[:5]) for row in rows]
+    statuses = [row[5] for row in rows]
+    sections = []
+    for ordinal, row in enumerate(rows):
+        if not sections or sections[-1][0] != row[6]:
+            if sections:
+                sections[-1][2] = ordinal
+            sections.append([row[6], ordinal, len(rows)])
+    return ConcertSeatMap(concert_id, tuple(concert), layout, statuses,
+                          current_app.config.get('SEATMAP_CHANGELOG_SIZE', 1024),
+                          [tuple(section) for section in sections],
+                          current_app.config.get('SEATMAP_ROW_CACHE_SEATS', 10000))
+
+
+def _refresh_statuses(cursor, seat_map):
+    cursor.execute("SELECT ticket_id, status FROM Tickets WHERE concert_id = %s",
+                   (seat_map.concert_id,))
+    seat_maps.apply(dict(cursor.fetchall()))
+    seat_map.refreshed_at = time.monotonic()
+
+
+def get_seat_map(concert_id):
+    """
+    Returns the cached ConcertSeatMap for a concert, loading it on first use.
+
+    Returns None if the concert does not exist. Raises on database errors.
+    """
+    ttl = current_app.config.get('SEATMAP_STATUS_TTL', 10)
+    seat_map = seat_maps.get(concert_id)
+    if seat_map is not None and (not ttl or time.monotonic() - seat_map.refreshed_at < ttl):
+        return seat_map
+
+    with seat_maps.load_lock(concert_id):
+        # Another request may have loaded or refreshed it while we waited
+        seat_map = seat_maps.get(concert_id)
+        if seat_map is not None and (not ttl or time.monotonic() - seat_map.refreshed_at < ttl):
+            return seat_map
+
+        db = get_db_connection()
+        if not db:
+            raise RuntimeError('Database connection error')
+        cursor = db.cursor()
+        try:
+            if seat_map is None:
+                seat_map = _load_seat_map(cursor, concert_id)
+                # A concert that is over is still shown, but not kept
+                if seat_map is not None and not concert_finished(seat_map):
+                    seat_maps.max_maps = current_app.config.get('SEATMAP_MAX_CONCERTS', 50)
+                    seat_maps.put(seat_map)
+            else:
+                _refresh_statuses(cursor, seat_map)
+        finally:
+            cursor.close()
+    return seat_map
+
+
+def sync_tickets(cursor, ticket_ids):
+    """
+    Re-read the committed status of the given tickets and patch the cache.
+
+    Called by payment.py right after hold_ticket/create_booking/
+    complete_booking/cancel_booking commit. Tickets of concerts that are not
+    cached are skipped without touching the database.
+    """
+    ticket_ids = [int(t) for t in ticket_ids if t and seat_maps.concert_of(int(t)) is not None]
+    if not ticket_ids:
+        return set()
+
+    placeholders = ', '.join(['%s'] * len(ticket_ids))
+    cursor.execute(f"SELECT ticket_id, status FROM Tickets WHERE ticket_id IN ({placeholders})",
+                   tuple(ticket_ids))
+    return seat_maps.apply(dict(cursor.fetchall()))
+
+
+def set_ticket_statuses(changes):
+    """Patch the cache when the new status is already known (e.g. bulk updates)."""
+    return seat_maps.apply(changes)
+
+
+def invalidate_concert(concert_id):
+    seat_maps.invalidate(concert_id)
@@ -0,0 +1,63 @@
+// Fetch the next page of a tab and append its rows
+function loadApplications(content) {
+    const button = content.querySelector('.load-more-btn');
+    const params = new URLSearchParams({ status: content.dataset.status });
+    if (content.dataset.nextCursor) {
+        params.set('after', content.dataset.nextCursor);
+    }
+    button.disabled = true;
+
+    fetch(applicationsUrl + '?' + params.toString())
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                throw new Error(data.error);
+            }
+            content.querySelector('.application-rows').insertAdjacentHTML('beforeend', data.html);
+            content.dataset.loaded = '1';
+            content.dataset.nextCursor = data.next_cursor || '';
+
+            const hasRows = content.querySelector('.application-rows tr') !== null;
+            content.querySelector('.applications-table-wrapper').hidden = !hasRows;
+            content.querySelector('.empty-state').hidden = hasRows;
+            button.hidden = !data.next_cursor;
+        })
+        .catch(() => {
+            button.hidden = false;
+            button.textContent = 'Retry';
+        })
+        .finally(() => {
+            button.disabled = false;
+        });
+}
+
+// Tab switching
+const tabs = document.querySelectorAll('.tab');
+const tabContents = document.querySelectorAll('.tab-content');
+
+tabs.forEach(tab => {
+    tab.addEventListener('click', () => {
+        const targetTab = tab.getAttribute('data-tab');
+
+        // Remove active class from all tabs and contents
+        tabs.forEach(t => t.classList.remove('active'));
+        tabContents.forEach(tc => tc.classList.remove('active'));
+
+        // Add active class to clicked tab and corresponding content
+        tab.classList.add('active');
+        const content = document.getElementById(targetTab);
+        content.classList.add('active');
+
+        // Tabs other than the default one load their first page when opened
+        if (content.dataset.loaded !== '1') {
+            loadApplications(content);
+        }
+    });
+});
+
+document.querySelectorAll('.load-more-btn').forEach(button => {
+    button.addEventListener('click', () => {
+        button.textContent = 'Load more';
+        loadApplications(button.closest('.tab-content'));
+    });
+});
@@ -0,0 +1,21 @@
+function toggleMobileMenu() {
+    const nav = document.getElementById('navbarNav');
+    nav.classList.toggle('active');
+}
+
+// Close mobile menu when clicking outside
+document.addEventListener('click', function(event) {
+    const nav = document.getElementById('navbarNav');
+    const toggle = document.querySelector('.mobile-menu-toggle');
+
+    if (!nav.contains(event.target) && !toggle.contains(event.target)) {
+        nav.classList.remove('active');
+    }
+});
+
+// Close mobile menu when window is resized to desktop
+window.addEventListener('resize', function() {
+    if (window.innerWidth > 768) {
+        document.getElementById('navbarNav').classList.remove('active');
+    }
+});
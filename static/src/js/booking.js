@@ -0,0 +1,222 @@
+// Seats picked for this order, keyed by ticket id
+const selectedSeats = {};
+
+function updateSelectionSummary() {
+    const seats = Object.values(selectedSeats);
+    const bookButton = document.getElementById('bookButton');
+    const selectedInfo = document.getElementById('selectedInfo');
+
+    if (seats.length === 0) {
+        bookButton.classList.remove('show');
+        selectedInfo.classList.remove('show');
+        return;
+    }
+
+    const total = seats.reduce(function (sum, seat) { return sum + parseFloat(seat.price); }, 0);
+    document.getElementById('selectedSeatText').textContent = seats.map(function (seat) {
+        return 'Row ' + seat.label + ' (' + seat.type + ')';
+    }).join(', ');
+    document.getElementById('selectedPriceText').textContent = 'Total: ₹' + total.toFixed(2);
+
+    bookButton.classList.add('show');
+    selectedInfo.classList.add('show');
+}
+
+function selectSeat(ticketId, seatLabel, price, seatType, seatElement) {
+    const checkbox = document.getElementById('seat_' + ticketId);
+
+    if (selectedSeats[ticketId]) {
+        // Clicking a selected seat removes it from the order
+        delete selectedSeats[ticketId];
+        seatElement.classList.remove('selected');
+        checkbox.checked = false;
+    } else {
+        if (Object.keys(selectedSeats).length >= maxSeatsPerOrder) {
+            alert('You can book at most ' + maxSeatsPerOrder + ' seats per order.');
+            return;
+        }
+        selectedSeats[ticketId] = {
+            label: multipleSections ? currentSection + ' ' + seatLabel : seatLabel,
+            price: price,
+            type: seatType
+        };
+        seatElement.classList.add('selected');
+        checkbox.checked = true;
+    }
+
+    updateSelectionSummary();
+}
+
+// Keep seat statuses fresh: live server-sent events when the browser and
+// server allow it, otherwise poll only the seats changed since the
+// version this page was rendered with. Versions are opaque tokens; one
+// from another copy of the server's seat map gets a full snapshot back.
+const seatPollInterval = 5000;
+
+function applySeatStatus(ticketId, status) {
+    const seat = document.querySelector('.seat[data-ticket-id="' + ticketId + '"]');
+    if (!seat) {
+        return;
+    }
+    const taken = status === 'sold';
+    if (taken === seat.classList.contains('sold')) {
+        return;
+    }
+    const seatNo = seat.dataset.seatNo;
+    const price = seat.dataset.price;
+
+    if (taken) {
+        if (selectedSeats[ticketId]) {
+            delete selectedSeats[ticketId];
+            updateSelectionSummary();
+        }
+        seat.classList.remove('selected');
+        seat.classList.add('sold');
+        seat.onclick = null;
+        seat.innerHTML = '<span class="seat-number">' + seatNo + '</span>' +
+                         '<span class="seat-price">₹' + price + '</span>';
+    } else {
+        seat.classList.remove('sold');
+        seat.onclick = function () {
+            selectSeat(ticketId, seat.dataset.seatLabel, price, seat.dataset.seatType, seat);
+        };
+        seat.innerHTML = '<input type="checkbox" name="ticket_id" value="' + ticketId + '" id="seat_' + ticketId + '" class="booking-form">' +
+                         '<label class="seat-label">' +
+                         '<span class="seat-number">' + seatNo + '</span>' +
+                         '<span class="seat-price">₹' + price + '</span></label>';
+    }
+}
+
+function markSelectedSeats() {
+    Object.keys(selectedSeats).forEach(function (ticketId) {
+        const checkbox = document.getElementById('seat_' + ticketId);
+        if (checkbox) {
+            checkbox.checked = true;
+            checkbox.closest('.seat').classList.add('selected');
+        }
+    });
+}
+
+function refreshSectionCounts() {
+    return fetch(sectionsUrl)
+        .then(function (response) { return response.ok ? response.json() : null; })
+        .then(function (data) {
+            if (!data) {
+                return;
+            }
+            data.sections.forEach(function (s) {
+                const card = document.querySelector('.section-card[data-section="' + CSS.escape(s.section) + '"]');
+                if (card) {
+                    card.querySelector('[data-role="available"]').textContent =
+                        s.available + ' of ' + s.seats + ' seats free';
+                    card.classList.toggle('full', s.available === 0);
+                }
+            });
+        })
+        .catch(function () {});
+}
+
+function openSection(card) {
+    const section = card.dataset.section;
+    return fetch(sectionsUrl + '/' + encodeURIComponent(section))
+        .then(function (response) {
+            if (!response.ok) {
+                throw new Error('section unavailable');
+            }
+            return response.json();
+        })
+        .then(function (data) {
+            document.getElementById('sectionSeats').innerHTML = data.html;
+            currentSection = section;
+            document.querySelectorAll('.section-card').forEach(function (other) {
+                other.classList.toggle('active', other === card);
+            });
+            history.replaceState(null, '', card.href);
+            markSelectedSeats();
+            refreshSectionCounts();
+        })
+        .catch(function () {
+            // Waiting room redirects and errors get the full page instead
+            window.location.href = card.href;
+        });
+}
+
+if (multipleSections) {
+    document.querySelectorAll('.section-card').forEach(function (card) {
+        card.addEventListener('click', function (event) {
+            event.preventDefault();
+            openSection(card);
+        });
+    });
+}
+
+// Seats picked in sections that are no longer on the page still belong to the order
+document.getElementById('bookingForm').addEventListener('submit', function () {
+    const form = this;
+    Object.keys(selectedSeats).forEach(function (ticketId) {
+        if (!document.getElementById('seat_' + ticketId)) {
+            const input = document.createElement('input');
+            input.type = 'hidden';
+            input.name = 'ticket_id';
+            input.value = ticketId;
+            form.appendChild(input);
+        }
+    });
+});
+
+function fetchSeatChanges() {
+    const sectionParam = currentSection ? '&section=' + encodeURIComponent(currentSection) : '';
+    return fetch(availabilityUrl + '?since=' + encodeURIComponent(seatmapVersion) + sectionParam)
+        .then(function (response) { return response.ok ? response.json() : null; })
+        .then(function (data) {
+            if (!data) {
+                return;
+            }
+            data.seats.forEach(function (seat) { applySeatStatus(seat[0], seat[1]); });
+            seatmapVersion = data.version;
+        })
+        .catch(function () {});
+}
+
+function pollSeats() {
+    fetchSeatChanges().finally(function () { setTimeout(pollSeats, seatPollInterval); });
+}
+
+function streamSeats() {
+    const source = new EventSource(streamUrl + '?since=' + encodeURIComponent(seatmapVersion));
+
+    function onSeatEvent(event) {
+        const data = JSON.parse(event.data);
+        applySeatStatus(data.ticket_id, data.status);
+        seatmapVersion = data.version;
+    }
+    ['hold', 'sold', 'release', 'status'].forEach(function (type) {
+        source.addEventListener(type, onSeatEvent);
+    });
+
+    source.addEventListener('snapshot', function (event) {
+        // Our version was not the server's: every seat's status, then changes
+        const data = JSON.parse(event.data);
+        data.seats.forEach(function (seat) { applySeatStatus(seat[0], seat[1]); });
+        seatmapVersion = data.version;
+    });
+
+    source.addEventListener('resync', function () {
+        // The server's seat map was replaced: reconnect for a snapshot
+        source.close();
+        streamSeats();
+    });
+
+    source.onerror = function () {
+        // CLOSED means the server refused the stream (e.g. 503)
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(pollSeats, seatPollInterval);
+        }
+    };
+}
+
+if (window.EventSource) {
+    streamSeats();
+} else {
+    setTimeout(pollSeats, seatPollInterval);
+}
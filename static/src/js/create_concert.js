@@ -0,0 +1,32 @@
+// Live pricing preview
+const goldInput = document.getElementById('gold_price');
+const silverInput = document.getElementById('silver_price');
+const bronzeInput = document.getElementById('bronze_price');
+
+const goldPreview = document.getElementById('gold_preview');
+const silverPreview = document.getElementById('silver_preview');
+const bronzePreview = document.getElementById('bronze_preview');
+
+function updatePreview() {
+    goldPreview.textContent = goldInput.value || '0';
+    silverPreview.textContent = silverInput.value || '0';
+    bronzePreview.textContent = bronzeInput.value || '0';
+}
+
+goldInput.addEventListener('input', updatePreview);
+silverInput.addEventListener('input', updatePreview);
+bronzeInput.addEventListener('input', updatePreview);
+
+// Validate pricing (Gold > Silver > Bronze)
+const form = document.getElementById('concertForm');
+form.addEventListener('submit', function(e) {
+    const gold = parseFloat(goldInput.value);
+    const silver = parseFloat(silverInput.value);
+    const bronze = parseFloat(bronzeInput.value);
+
+    if (gold <= silver || silver <= bronze) {
+        e.preventDefault();
+        alert('⚠️ Pricing hierarchy error!\n\nGold price must be greater than Silver price.\nSilver price must be greater than Bronze price.\n\nPlease adjust your prices accordingly.');
+        return false;
+    }
+});
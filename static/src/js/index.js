@@ -0,0 +1,49 @@
+(function () {
+    const input = document.getElementById('searchInput');
+    const list = document.getElementById('searchSuggestions');
+    let timer = null;
+    let latest = 0;
+
+    function render(results) {
+        list.innerHTML = '';
+        results.forEach(function (result) {
+            const item = document.createElement('li');
+            const link = document.createElement('a');
+            link.href = result.url;
+            const type = document.createElement('span');
+            type.className = 'suggestion-type';
+            type.textContent = result.type;
+            const detail = document.createElement('span');
+            detail.className = 'suggestion-detail';
+            detail.textContent = result.detail;
+            link.appendChild(type);
+            link.appendChild(document.createTextNode(result.label));
+            link.appendChild(detail);
+            item.appendChild(link);
+            list.appendChild(item);
+        });
+    }
+
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        const query = input.value.trim();
+        if (!query) {
+            render([]);
+            return;
+        }
+        timer = setTimeout(function () {
+            const requestId = ++latest;
+            fetch(autocompleteUrl + '?q=' + encodeURIComponent(query))
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    // Ignore answers to queries the user has typed past
+                    if (requestId === latest) render(data.results || []);
+                })
+                .catch(function () { render([]); });
+        }, 120);
+    });
+
+    document.addEventListener('click', function (event) {
+        if (!event.target.closest('.search-box')) render([]);
+    });
+})();
@@ -0,0 +1,33 @@
+function showProgress(data) {
+    document.getElementById('jobBar').style.width = data.percent + '%';
+    document.getElementById('jobCount').textContent =
+        data.done + (data.total ? ' / ' + data.total : '') + ' tickets';
+    if (data.published) {
+        document.getElementById('jobTitle').textContent = '🎉 Your concert is live';
+        document.getElementById('jobMessage').textContent = 'All tickets are ready and fans can book now.';
+    }
+    if (data.error) {
+        const error = document.getElementById('jobError');
+        error.textContent = data.error;
+        error.hidden = false;
+    }
+    document.getElementById('jobRetry').hidden = data.state !== 'failed';
+}
+
+function pollProgress() {
+    fetch(progressUrl)
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+            showProgress(data);
+            if (data.state !== 'done' && data.state !== 'failed') {
+                setTimeout(pollProgress, 1000);
+            }
+        })
+        .catch(function () { setTimeout(pollProgress, 3000); });
+}
+
+if (initialProgress.state !== 'done' && initialProgress.state !== 'failed') {
+    setTimeout(pollProgress, 1000);
+} else {
+    showProgress(initialProgress);
+}
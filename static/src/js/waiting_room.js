@@ -0,0 +1,28 @@
+function showEta(seconds) {
+    const eta = document.getElementById('queueEta');
+    if (seconds <= 0) {
+        eta.textContent = 'Almost there...';
+    } else if (seconds < 60) {
+        eta.textContent = 'Estimated wait: less than a minute';
+    } else {
+        eta.textContent = 'Estimated wait: about ' + Math.ceil(seconds / 60) + ' min';
+    }
+}
+
+function pollQueue() {
+    fetch(statusUrl)
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+            if (data.admitted) {
+                window.location.href = bookingUrl;
+                return;
+            }
+            document.getElementById('queuePosition').textContent = data.position;
+            showEta(data.eta_seconds);
+            setTimeout(pollQueue, 3000);
+        })
+        .catch(function () { setTimeout(pollQueue, 5000); });
+}
+
+showEta(initialEta);
+setTimeout(pollQueue, 3000);
@@ -0,0 +1,484 @@
+# ticket_jobs.py
+"""
+Background ticket generation for new concerts.
+
+create_concert inserts the concert unpublished and queues a job here
+instead of generating tickets inside the request. The job turns the
+venue's seats into tickets with set-based INSERT ... SELECT statements,
+TICKET_JOB_BATCH seats per statement and one commit per batch, so a
+stadium never holds one huge transaction and progress is visible while it
+runs. When every seat has a ticket the concert is published.
+
+Jobs run on a small thread pool. Their prices and state are also kept in
+ConcertTicketJobs, so a job survives the process that ran it: a worker
+claims the row before generating (a running row whose heartbeat is older
+than TICKET_JOB_STALL_SECONDS is up for grabs), each process requeues the
+unpublished concerts at startup, and the artist or an admin can retry a
+failed job from the progress page. Status polls that reach another worker
+process fall back to that row and the ConcertTicketStats counters.
+"""
+import atexit
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, session, url_for
+from db import get_db_connection
+from permissions import get_role
+import fragment_cache
+import search
+
+ticket_jobs_bp = Blueprint('ticket_jobs', __name__)
+
+STATE_QUEUED = 'queued'
+STATE_RUNNING = 'running'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+FAILED_MESSAGE = 'Ticket generation stopped before every seat had a ticket. Retry to resume where it left off.'
+
+# Price of seat `s` from the (gold, silver, bronze) parameters; the
+# ticket_price() function is shared with the generate_concert_tickets procedure
+TICKET_PRICE_SQL = "ticket_price(s.seat_type, %s, %s, %s)"
+
+
+class TicketJob:
+
+    def __init__(self, concert_id, user_id, prices):
+        self.concert_id = concert_id
+        self.user_id = user_id
+        self.prices = prices    # (gold, silver, bronze)
+        self.state = STATE_QUEUED
+        self.total = None
+        self.done = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def progress(self):
+        return {
+            'concert_id': self.concert_id,
+            'state': self.state,
+            'total': self.total,
+            'done': self.done,
+            'percent': round(100 * self.done / self.total) if self.total else 0,
+            'published': self.state == STATE_DONE,
+            'error': self.error,
+        }
+
+
+def record_ticket_job(cursor, concert_id, prices):
+    """Store a new concert's job with its prices; commit it with the concert."""
+    cursor.execute("""
+        INSERT INTO ConcertTicketJobs (concert_id, gold_price, silver_price, bronze_price, state, updated_at)
+        VALUES (%s, %s, %s, %s, %s, NOW())
+    """, (concert_id, *prices, STATE_QUEUED))
+
+
+def claim_job(cursor, db, concert_id, stall_seconds):
+    """
+    Mark the stored job running for this process. False when another
+    worker is running it (its heartbeat is recent) or it is already done.
+    """
+    cursor.execute("""
+        UPDATE ConcertTicketJobs
+        SET state = %s, error = NULL, updated_at = NOW()
+        WHERE concert_id = %s
+          AND (state IN (%s, %s) OR (state = %s AND updated_at < NOW() - INTERVAL %s SECOND))
+    """, (STATE_RUNNING, concert_id, STATE_QUEUED, STATE_FAILED, STATE_RUNNING, int(stall_seconds)))
+    claimed = cursor.rowcount == 1
+    db.commit()
+    return claimed
+
+
+def generate_tickets(cursor, db, job, batch_size):
+    """
+    Insert the missing tickets of `job`'s concert in seat_id order, one
+    batch per transaction, then publish the concert. Resumes after the last
+    ticketed seat, so running it again after a failure is safe.
+    """
+    gold, silver, bronze = job.prices
+    cursor.execute("SELECT venue_id FROM Concerts WHERE concert_id = %s", (job.concert_id,))
+    row = cursor.fetchone()
+    if not row:
+        raise LookupError(f"Concert {job.concert_id} not found")
+    venue_id = row[0]
+
+    cursor.execute("SELECT COUNT(*) FROM Seats WHERE venue_id = %s", (venue_id,))
+    job.total = cursor.fetchone()[0]
+    cursor.execute("""
+        SELECT COUNT(*), COALESCE(MAX(seat_id), 0) FROM Tickets WHERE concert_id = %s
+    """, (job.concert_id,))
+    job.done, last_seat_id = cursor.fetchone()
+    db.commit()
+
+    while True:
+        # Upper seat_id of the next batch; None means the rest of the venue
+        cursor.execute("""
+            SELECT seat_id FROM Seats
+            WHERE venue_id = %s AND seat_id > %s
+            ORDER BY seat_id
+            LIMIT 1 OFFSET %s
+        """, (venue_id, last_seat_id, batch_size - 1))
+        bound = cursor.fetchone()
+        upper = bound[0] if bound else None
+
+        cursor.execute(f"""
+            INSERT INTO Tickets (concert_id, seat_id, price, status)
+            SELECT %s, s.seat_id, {TICKET_PRICE_SQL}, 'available'
+            FROM Seats s
+            WHERE s.venue_id = %s AND s.seat_id > %s {'AND s.seat_id <= %s' if upper else ''}
+            ORDER BY s.seat_id
+        """, (job.concert_id, gold, silver, bronze, venue_id, last_seat_id,
+              *((upper,) if upper else ())))
+        inserted = cursor.rowcount
+        # Heartbeat: keeps other workers from taking over a live job
+        cursor.execute("UPDATE ConcertTicketJobs SET updated_at = NOW() WHERE concert_id = %s",
+                       (job.concert_id,))
+        db.commit()
+        job.done += inserted
+        if upper is None:
+            break
+        last_seat_id = upper
+
+    cursor.execute("UPDATE Concerts SET published = 1 WHERE concert_id = %s", (job.concert_id,))
+    cursor.execute("UPDATE ConcertTicketJobs SET state = %s, updated_at = NOW() WHERE concert_id = %s",
+                   (STATE_DONE, job.concert_id))
+    db.commit()
+
+
+class TicketJobRunner:
+    """Runs TicketJobs on a thread pool and keeps them for status polls."""
+
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = int(app.config.get('TICKET_JOB_BATCH', 2000))
+        self.retention = float(app.config.get('TICKET_JOB_RETENTION', 3600))
+        self.stall_seconds = float(app.config.get('TICKET_JOB_STALL_SECONDS', 300))
+        self.resume_retries = int(app.config.get('TICKET_JOB_RESUME_RETRIES', 3))
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._resume_timer = None
+        self._resume_attempts = 0
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(app.config.get('TICKET_JOB_WORKERS', 2)),
+            thread_name_prefix='ticket-jobs')
+
+    def submit(self, concert_id, user_id, prices):
+        job = TicketJob(concert_id, user_id, prices)
+        with self._lock:
+            self._prune()
+            current = self.jobs.get(concert_id)
+            if current is not None and current.state in (STATE_QUEUED, STATE_RUNNING):
+                return current
+            self.jobs[concert_id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, concert_id):
+        with self._lock:
+            return self.jobs.get(concert_id)
+
+    def _forget(self, job):
+        with self._lock:
+            if self.jobs.get(job.concert_id) is job:
+                del self.jobs[job.concert_id]
+
+    def resume_in_background(self):
+        with self._lock:
+            if self._stopped:
+                return
+            self._resume_timer = None
+        self._executor.submit(self.resume_pending)
+
+    def _resume_later(self):
+        """
+        Look again once a running job's heartbeat could have gone stale, at
+        most TICKET_JOB_RESUME_RETRIES times in a row; after that the Retry
+        button or the next restart picks the job up.
+        """
+        with self._lock:
+            if self._stopped or self._resume_timer is not None:
+                return
+            if self._resume_attempts >= self.resume_retries:
+                print("Ticket jobs still running elsewhere; not checking on them again")
+                return
+            self._resume_attempts += 1
+            self._resume_timer = threading.Timer(self.stall_seconds + 1, self.resume_in_background)
+            self._resume_timer.daemon = True
+            self._resume_timer.start()
+
+    def stop(self):
+        """Cancel a pending resume and stop taking jobs; running ones finish."""
+        with self._lock:
+            self._stopped = True
+            if self._resume_timer is not None:
+                self._resume_timer.cancel()
+                self._resume_timer = None
+        self._executor.shutdown(wait=False)
+
+    def resume_pending(self):
+        """
+        Requeue every unpublished concert whose stored job is not done, e.g.
+        after a restart interrupted it. Jobs still running elsewhere are
+        skipped by the claim; they are looked at again once their heartbeat
+        could have gone stale (see _resume_later).
+        """
+        with self.app.app_context():
+            db = get_db_connection()
+            if not db:
+                print("Error resuming ticket jobs: database connection error")
+                return 0
+            cursor = db.cursor()
+            try:
+                # The job itself tops up any tickets still missing and
+                # publishes, so a concert whose last batch committed just
+                # before the crash only needs its publish step
+                cursor.execute("""
+                    SELECT j.concert_id, a.user_id, j.gold_price, j.silver_price, j.bronze_price, j.state
+                    FROM ConcertTicketJobs j
+                    JOIN Concerts c ON j.concert_id = c.concert_id
+                    JOIN Artists a ON c.artist_id = a.artist_id
+                    WHERE c.published = 0 AND j.state <> %s
+                """, (STATE_DONE,))
+                rows = cursor.fetchall()
+            except Exception as e:
+                print(f"Error resuming ticket jobs: {e}")
+                return 0
+            finally:
+                cursor.close()
+                db.close()
+
+        for concert_id, user_id, gold, silver, bronze, state in rows:
+            self.submit(concert_id, user_id, (gold, silver, bronze))
+        if any(row[5] == STATE_RUNNING for row in rows):
+            self._resume_later()
+        else:
+            with self._lock:
+                self._resume_attempts = 0
+        if rows:
+            print(f"Requeued ticket generation for {len(rows)} unpublished concert(s)")
+        return len(rows)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for concert_id, job in list(self.jobs.items()):
+            if job.finished_at and job.finished_at < cutoff:
+                del self.jobs[concert_id]
+
+    def _run(self, job):
+        with self.app.app_context():
+            db = get_db_connection()
+            cursor = None
+            try:
+                if not db:
+                    raise RuntimeError('Database connection error')
+                cursor = db.cursor()
+                if not claim_job(cursor, db, job.concert_id, self.stall_seconds):
+                    # Another worker has it (or it is done): polls read the stored state
+                    self._forget(job)
+                    return
+                job.state = STATE_RUNNING
+                generate_tickets(cursor, db, job, self.batch_size)
+                search.index_concert(cursor, job.concert_id)
+                # The new concert belongs in the cached listing pages now
+                fragment_cache.invalidate_concert(job.concert_id)
+                job.state = STATE_DONE
+            except Exception as e:
+                if db:
+                    db.rollback()
+                print(f"Error generating tickets for concert {job.concert_id}: {e}")
+                job.error = FAILED_MESSAGE
+                job.state = STATE_FAILED
+                if cursor:
+                    try:
+                        cursor.execute("""
+                            UPDATE ConcertTicketJobs SET state = %s, error = %s, updated_at = NOW()
+                            WHERE concert_id = %s
+                        """, (STATE_FAILED, str(e)[:255], job.concert_id))
+                        db.commit()
+                    except Exception as store_error:
+                        # The row stays 'running' and goes stale, so it is retried anyway
+                        print(f"Error recording failed ticket job {job.concert_id}: {store_error}")
+            finally:
+                job.finished_at = time.time()
+                if cursor:
+                    cursor.close()
+                if db:
+                    db.close()
+
+    def stats(self):
+        with self._lock:
+            return {str(concert_id): job.progress() for concert_id, job in self.jobs.items()}
+
+
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    app = current_app._get_current_object()
+    runner = app.extensions.get('ticket_jobs')
+    if runner is None:
+        with _runner_lock:
+            runner = app.extensions.get('ticket_jobs')
+            if runner is None:
+                runner = app.extensions['ticket_jobs'] = TicketJobRunner(app)
+                atexit.register(runner.stop)
+    return runner
+
+
+def start_ticket_generation(concert_id, user_id, prices):
+    return get_runner().submit(concert_id, user_id, prices)
+
+
+def _stored_progress(concert_id, user_id):
+    """
+    Progress as MySQL sees it, for jobs this process does not know about.
+    `user_id` restricts it to that artist's concerts (None: any, for admins).
+    """
+    db = get_db_connection()
+    if not db:
+        return None
+    cursor = db.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT c.published,
+                   (SELECT COALESCE(SUM(s.total_tickets), 0) FROM ConcertTicketStats s
+                    WHERE s.concert_id = c.concert_id),
+                   (SELECT COUNT(*) FROM Seats se WHERE se.venue_id = c.venue_id),
+                   j.state, j.updated_at < NOW() - INTERVAL %s SECOND
+            FROM Concerts c
+            JOIN Artists a ON c.artist_id = a.artist_id
+            LEFT JOIN ConcertTicketJobs j ON c.concert_id = j.concert_id
+            WHERE c.concert_id = %s {'AND a.user_id = %s' if user_id else ''}
+        """, (int(current_app.config.get('TICKET_JOB_STALL_SECONDS', 300)), concert_id,
+              *((user_id,) if user_id else ())))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    if not row:
+        return None
+    published, done, total, state, stale = row
+    if published:
+        state = STATE_DONE
+    elif state == STATE_FAILED or (state == STATE_RUNNING and stale):
+        # A running job whose heartbeat stopped died with its process
+        state = STATE_FAILED
+    else:
+        state = STATE_RUNNING
+    return {
+        'concert_id': concert_id,
+        'state': state,
+        'total': total,
+        'done': done,
+        'percent': round(100 * done / total) if total else 0,
+        'published': bool(published),
+        'error': FAILED_MESSAGE if state == STATE_FAILED else None,
+    }
+
+
+def retry_job(concert_id, user_id=None):
+    """
+    Queue the stored job of an unpublished concert again; `user_id`
+    restricts it to that artist's concerts. Returns the job, or None.
+    """
+    db = get_db_connection()
+    if not db:
+        return None
+    cursor = db.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT a.user_id, j.gold_price, j.silver_price, j.bronze_price
+            FROM ConcertTicketJobs j
+            JOIN Concerts c ON j.concert_id = c.concert_id
+            JOIN Artists a ON c.artist_id = a.artist_id
+            WHERE j.concert_id = %s AND c.published = 0 {'AND a.user_id = %s' if user_id else ''}
+        """, (concert_id, *((user_id,) if user_id else ())))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    if not row:
+        return None
+    owner_id, gold, silver, bronze = row
+    return get_runner().submit(concert_id, owner_id, (gold, silver, bronze))
+
+
+def job_progress(concert_id, user_id):
+    job = get_runner().get(concert_id)
+    if job is not None and (user_id is None or job.user_id == user_id):
+        return job.progress()
+    return _stored_progress(concert_id, user_id)
+
+
+def _owner_filter(user_id):
+    """Artists only see their own concerts' jobs; admins see every job."""
+    return None if get_role(user_id) == 'admin' else user_id
+
+
+@ticket_jobs_bp.route('/create_concert/<int:concert_id>/progress')
+def progress_page(concert_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        flash('You need to log in first!', 'error')
+        return redirect(url_for('auth.login'))
+    progress = job_progress(concert_id, _owner_filter(user_id))
+    if progress is None:
+        flash('Concert not found!', 'error')
+        return redirect(url_for('profile.profile'))
+    return render_template('ticket_job.html', concert_id=concert_id, progress=progress)
+
+
+@ticket_jobs_bp.route('/create_concert/<int:concert_id>/progress.json')
+def progress_status(concert_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Login required'}), 401
+    try:
+        progress = job_progress(concert_id, _owner_filter(user_id))
+    except Exception as e:
+        print(f"Error reading ticket job progress: {e}")
+        return jsonify({'error': 'Could not read progress'}), 500
+    if progress is None:
+        return jsonify({'error': 'Concert not found'}), 404
+    return jsonify(progress)
+
+
+@ticket_jobs_bp.route('/create_concert/<int:concert_id>/retry', methods=['POST'])
+def retry(concert_id):
+    """Resume a failed or interrupted job; for the concert's artist and admins"""
+    user_id = session.get('user_id')
+    if not user_id:
+        flash('You need to log in first!', 'error')
+        return redirect(url_for('auth.login'))
+    try:
+        job = retry_job(concert_id, _owner_filter(user_id))
+    except Exception as e:
+        print(f"Error retrying ticket job for concert {concert_id}: {e}")
+        job = None
+    if job is None:
+        flash('There is no unfinished ticket generation to retry for this concert.', 'error')
+    else:
+        flash('Ticket generation resumed.', 'success')
+    return redirect(url_for('ticket_jobs.progress_page', concert_id=concert_id))
+
+
+_start_lock = threading.Lock()
+
+
+def init_app(app):
+    """
+    Register the progress pages and requeue interrupted jobs with the first
+    request the process serves (as the hold sweeper starts).
+    """
+    app.register_blueprint(ticket_jobs_bp)
+
+    @app.before_request
+    def _resume_ticket_jobs():
+        if app.extensions.get('ticket_jobs_resumed'):
+            return
+        with _start_lock:
+            if app.extensions.get('ticket_jobs_resumed'):
+                return
+            app.extensions['ticket_jobs_resumed'] = True
+        get_runner().resume_in_background()
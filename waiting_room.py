@@ -0,0 +1,262 @@
+# waiting_room.py
+"""
+Virtual waiting room for hot concerts.
+
+When a concert has an admission rate, the first visit to its seat page
+hands out a signed queue token carrying a sequence number. An admission
+line advances at `rate` users per second; visitors whose number is behind
+the line are let through, everyone else waits on waiting_room.html and
+polls /queue/<concert_id>/status, which reads only in-process state and
+the session, never MySQL.
+
+Queues live in process memory, so with several worker processes the
+effective admission rate is `rate` times the number of processes.
+"""
+import threading
+import time
+
+from flask import (Blueprint, current_app, flash, jsonify, redirect, render_template,
+                   request, session, url_for)
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from db import get_db_connection
+from seatmap import seat_maps
+
+waiting_room_bp = Blueprint('waiting_room', __name__)
+
+
+class ConcertQueue:
+    """Admission line for one concert; `rate` users per second, `burst` at once."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.issued = 0
+        self.line = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _advance(self, now):
+        # Never let the line run further ahead than one burst past the last
+        # issued number, so a quiet period does not bank unlimited admissions.
+        self.line = min(self.line + self.rate * (now - self.updated_at), self.issued + self.burst)
+        self.updated_at = now
+
+    def join(self):
+        with self.lock:
+            self._advance(time.monotonic())
+            seq = self.issued
+            self.issued += 1
+            return seq
+
+    def position(self, seq):
+        """People ahead of `seq`; 0 means admitted."""
+        with self.lock:
+            self._advance(time.monotonic())
+            return 0 if seq < self.line else int(seq - self.line) + 1
+
+    def set_rate(self, rate, burst=None):
+        with self.lock:
+            self._advance(time.monotonic())
+            self.rate = rate
+            if burst is not None:
+                self.burst = burst
+
+    def stats(self):
+        with self.lock:
+            self._advance(time.monotonic())
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'issued': self.issued,
+                'admitted': min(self.issued, int(self.line)),
+                'waiting': max(0, self.issued - int(self.line)),
+            }
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue(concert_id):
+    """The concert's queue, or None if it is not behind the waiting room."""
+    queue = _queues.get(concert_id)
+    if queue is None:
+        default_rate = current_app.config.get('WAITING_ROOM_DEFAULT_RATE', 0)
+        if not default_rate:
+            return None
+        with _queues_lock:
+            queue = _queues.setdefault(concert_id, ConcertQueue(
+                default_rate, current_app.config.get('WAITING_ROOM_BURST', 50)))
+    return queue if queue.rate > 0 else None
+
+
+def set_rate(concert_id, rate, burst=None):
+    """
+    Set a concert's admissions per second at runtime; 0 opens it to everyone.
+    Only this process's queue changes; other workers keep their own rate.
+    """
+    with _queues_lock:
+        queue = _queues.get(concert_id)
+        if queue is None:
+            queue = _queues[concert_id] = ConcertQueue(
+                rate, burst if burst is not None else current_app.config.get('WAITING_ROOM_BURST', 50))
+            return queue
+    queue.set_rate(rate, burst)
+    return queue
+
+
+def all_stats():
+    return {concert_id: queue.stats() for concert_id, queue in list(_queues.items())}
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='waiting-room')
+
+
+def _token_for(concert_id):
+    """This visitor's queue token for the concert, issuing one on first visit."""
+    tokens = session.get('queue_tokens', {})
+    token = tokens.get(str(concert_id))
+    if token:
+        try:
+            data = _serializer().loads(token, max_age=current_app.config.get('WAITING_ROOM_TOKEN_TTL', 3600))
+            if data.get('c') == concert_id and data.get('u') == session.get('user_id'):
+                return token, data
+        except BadSignature:
+            pass
+    data = {'c': concert_id, 's': get_queue(concert_id).join(), 'u': session.get('user_id')}
+    token = _serializer().dumps(data)
+    tokens[str(concert_id)] = token
+    session['queue_tokens'] = tokens
+    return token, data
+
+
+def is_admitted(concert_id):
+    admitted = session.get('admitted', {})
+    return admitted.get(str(concert_id), 0) > time.time()
+
+
+def _admit(concert_id):
+    admitted = {k: v for k, v in session.get('admitted', {}).items() if v > time.time()}
+    admitted[str(concert_id)] = time.time() + current_app.config.get('WAITING_ROOM_ADMISSION_TTL', 900)
+    session['admitted'] = admitted
+    tokens = session.get('queue_tokens', {})
+    tokens.pop(str(concert_id), None)
+    session['queue_tokens'] = tokens
+
+
+def check_admission(concert_id):
+    """
+    None if the visitor may use the concert's seat selection and payment
+    pages, otherwise a redirect to the waiting room.
+    """
+    queue = get_queue(concert_id)
+    if queue is None or is_admitted(concert_id):
+        return None
+    _, data = _token_for(concert_id)
+    if queue.position(data['s']) == 0:
+        _admit(concert_id)
+        return None
+    return redirect(url_for('waiting_room.wait', concert_id=concert_id))
+
+
+def _any_gated():
+    if current_app.config.get('WAITING_ROOM_DEFAULT_RATE', 0):
+        return True
+    with _queues_lock:
+        return any(queue.rate > 0 for queue in _queues.values())
+
+
+def _concerts_of(ticket_ids):
+    """
+    Concert ids of `ticket_ids`: from the seat map cache when this process
+    has the concert loaded, otherwise from MySQL. None if any ticket could
+    not be resolved.
+    """
+    concert_ids = set()
+    unknown = []
+    for ticket_id in ticket_ids:
+        concert_id = seat_maps.concert_of(ticket_id)
+        if concert_id is None:
+            unknown.append(ticket_id)
+        else:
+            concert_ids.add(concert_id)
+    if not unknown:
+        return concert_ids
+
+    db = get_db_connection()
+    if not db:
+        return None
+    cursor = db.cursor()
+    try:
+        placeholders = ', '.join(['%s'] * len(unknown))
+        cursor.execute(f"SELECT ticket_id, concert_id FROM Tickets WHERE ticket_id IN ({placeholders})",
+                       tuple(unknown))
+        rows = cursor.fetchall()
+    except Exception as e:
+        print(f"Error resolving concerts of tickets: {e}")
+        return None
+    finally:
+        cursor.close()
+    if len(rows) != len(unknown):
+        return None
+    return concert_ids | {concert_id for _, concert_id in rows}
+
+
+def guard_tickets(ticket_ids):
+    """
+    check_admission for the concerts of the submitted tickets (payment
+    pages). Tickets whose concert cannot be resolved are refused, so a
+    worker that has not loaded the seat map cannot be used to skip the line.
+    """
+    if not ticket_ids or not _any_gated():
+        return None
+    concert_ids = _concerts_of(ticket_ids)
+    if concert_ids is None:
+        flash('Those seats could not be checked. Please pick them again.', 'error')
+        return redirect(url_for('index'))
+    for concert_id in concert_ids:
+        if get_queue(concert_id) is not None and not is_admitted(concert_id):
+            flash('This concert is busy. Please wait for your turn.', 'info')
+            return redirect(url_for('waiting_room.wait', concert_id=concert_id))
+    return None
+
+
+@waiting_room_bp.route('/queue/<int:concert_id>')
+def wait(concert_id):
+    if not session.get('user_id'):
+        flash('You need to log in first to book a concert!', 'error')
+        return redirect(url_for('auth.login'))
+    queue = get_queue(concert_id)
+    if queue is None or is_admitted(concert_id):
+        return redirect(url_for('book.book_concert', concert_id=concert_id))
+    token, data = _token_for(concert_id)
+    position = queue.position(data['s'])
+    return render_template('waiting_room.html', concert_id=concert_id, token=token,
+                           position=position,
+                           eta_seconds=int(position / queue.rate) if queue.rate else 0)
+
+
+@waiting_room_bp.route('/queue/<int:concert_id>/status')
+def status(concert_id):
+    """Cheap poll for waiting visitors: session and memory only, no MySQL"""
+    queue = get_queue(concert_id)
+    if queue is None or is_admitted(concert_id):
+        return jsonify({'admitted': True, 'position': 0, 'eta_seconds': 0})
+
+    token = request.args.get('token') or session.get('queue_tokens', {}).get(str(concert_id))
+    try:
+        data = _serializer().loads(token, max_age=current_app.config.get('WAITING_ROOM_TOKEN_TTL', 3600))
+    except (BadSignature, TypeError):
+        return jsonify({'error': 'Invalid or expired queue token'}), 400
+    if data.get('c') != concert_id or data.get('u') != session.get('user_id'):
+        return jsonify({'error': 'Invalid or expired queue token'}), 400
+
+    position = queue.position(data['s'])
+    if position == 0:
+        _admit(concert_id)
+    return jsonify({
+        'admitted': position == 0,
+        'position': position,
+        'eta_seconds': int(position / queue.rate) if queue.rate else 0,
+    })